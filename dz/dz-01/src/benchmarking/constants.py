@@ -0,0 +1,81 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+DEFAULT_IMPORT_MODULES = (
+    "src.parsing.ppm_parsing",
+    "src.transformations.image_transformations",
+    "src.quantization.ycbcr_quantization",
+    "src.pipeline.intra_coding",
+)
+DEFAULT_IMPORT_RUNS = 10
+
+# Dependencies that are only needed by some code paths and shouldn't be loaded by
+# a plain import.
+OPTIONAL_DEPENDENCIES = ("tqdm", "numba")
+
+DEFAULT_EQUIVALENCE_TRIALS = 4
+DEFAULT_EQUIVALENCE_BIT_DEPTHS = (8, 10, 12, 16)
+DEFAULT_EQUIVALENCE_REPEATS = 3
+DEFAULT_EQUIVALENCE_SEED = 0
+
+# Inputs go up to this many pixels or blocks per side; sizes are drawn at random,
+# so most of them aren't multiples of 8.
+MAX_EQUIVALENCE_IMAGE_SIZE = 37
+MAX_EQUIVALENCE_BLOCK_GRID_SIZE = 3
+
+# Pixel patterns inputs are drawn from: uniform noise, the extremes of the sample
+# range, and constant 8x8 tiles with some tiles replaced by noise, as in screen
+# content.
+UNIFORM_PATTERN = "uniform"
+ZEROS_PATTERN = "zeros"
+MAX_PATTERN = "max"
+CHECKERBOARD_PATTERN = "checkerboard"
+FLAT_TILES_PATTERN = "flat-tiles"
+PIXEL_PATTERNS = (
+    UNIFORM_PATTERN,
+    ZEROS_PATTERN,
+    MAX_PATTERN,
+    CHECKERBOARD_PATTERN,
+    FLAT_TILES_PATTERN,
+)
+
+# Inputs of the pruning checks add blocks whose noise puts their energy within this
+# many decades of the lowest AC pruning threshold, on either side of it.
+PRUNING_NOISE_DECADES = 0.5
+# They also add blocks of a single DCT basis pattern, whose coefficient is below
+# half a quantization step by a relative gap of 10 ** x, with x drawn from this
+# range.
+PRUNING_GAP_EXPONENTS = (-12, -2)
+
+# Photo-like inputs of the pruning checks are grids of this many blocks per side, of
+# a luma and two chroma components. Every component is a random level plus a few
+# low frequency cosines with these amplitudes at the scale of 8-bit content, up to
+# this many cycles per input, and noise of this fraction of the amplitude.
+PHOTO_BLOCK_GRID_SIZE = 32
+PHOTO_COMPONENT_AMPLITUDES = (48, 12, 12)
+PHOTO_N_COSINES = 4
+PHOTO_MAX_FREQUENCY = 8
+PHOTO_NOISE_SCALE = 0.125
+
+# Tolerances are relative to the sample range, 2 ** bit_depth.
+FLOAT64_TOLERANCE = 1e-12
+FLOAT32_TOLERANCE = 1e-5
+# The YCoCg-R lifting rounds Y down (from a multiple of 1/4) and Cg up (from a
+# multiple of 1/2), so the unrounded transform is at most this far from it.
+YCOCG_R_LIFTING_TOLERANCE = 0.75
+
+DEFAULT_RANS_LANE_COUNTS = (4, 8, 16, 32)
+DEFAULT_ENTROPY_REPEATS = 3
+DEFAULT_ENTROPY_QUALITY = 50
@@ -0,0 +1,165 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import argparse
+import time
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+from . import constants
+from ..entropy.rans_coding import decode_rans, encode_rans
+from ..entropy.restart_coding import (
+    RestartCodedImage,
+    decode_with_restarts,
+    encode_with_restarts,
+)
+from ..parsing.ppm_parsing import Ppm6Image
+from ..pipeline.intra_coding import encode_image
+from ..pipeline.precision import get_bit_depth
+from ..quantization.ycbcr_quantization import get_quantization_tensor
+
+
+def _get_coders(lane_counts: Sequence[int]) -> List[Tuple[str, Callable, Callable]]:
+    # Huffman is coded as a single segment, so both coders see the same symbols.
+    coders = [
+        (
+            "huffman",
+            lambda x: encode_with_restarts(
+                x, restart_interval=max(x.size, 1)
+            ).to_bytes(),
+            lambda x: decode_with_restarts(RestartCodedImage.from_bytes(x)),
+        )
+    ]
+
+    for n_lanes in lane_counts:
+        coders.append(
+            (
+                f"rans-{n_lanes}",
+                lambda x, n_lanes=n_lanes: encode_rans(x, n_lanes=n_lanes),
+                decode_rans,
+            )
+        )
+
+    return coders
+
+
+def _time(function: Callable, argument, n_repeats: int) -> Tuple[float, object]:
+    best_time = np.inf
+
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = function(argument)
+        best_time = min(best_time, time.perf_counter() - start)
+
+    return best_time, result
+
+
+def compare_entropy_coders(
+    zigzagged_blocks: np.ndarray,
+    lane_counts: Sequence[int] = constants.DEFAULT_RANS_LANE_COUNTS,
+    n_repeats: int = constants.DEFAULT_ENTROPY_REPEATS,
+) -> List[Tuple[str, int, float, float]]:
+    """
+    Codes the same coefficients with Huffman and with rANS for every lane count.
+
+    Sizes include everything needed for decoding (headers, tables or frequencies);
+    times are the best of n_repeats runs. Every coder has to reproduce the
+    coefficients exactly.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBxCx64 containing integer coefficients, usually the
+        output of encode_image.
+    :param lane_counts:
+        (Optional) A sequence of ints representing the numbers of rANS lanes to
+        try. Defaults to 4, 8, 16 and 32.
+    :param n_repeats:
+        (Optional) An int representing the number of timed runs. Defaults to 3.
+
+    :return:
+        A list of tuples (coder name, size in bytes, encode seconds, decode
+        seconds), Huffman first.
+    """
+    results = list()
+
+    for name, encode, decode in _get_coders(lane_counts):
+        encode_time, content = _time(encode, zigzagged_blocks, n_repeats)
+        decode_time, decoded = _time(decode, content, n_repeats)
+
+        if not np.array_equal(decoded, zigzagged_blocks):
+            raise AssertionError(f"{name} did not reproduce the coefficients")
+
+        results.append((name, len(content), encode_time, decode_time))
+
+    return results
+
+
+parser = argparse.ArgumentParser(
+    description="Compares Huffman and rANS coding of quantized coefficients."
+)
+
+parser.add_argument(
+    "image_paths", nargs="+", help="Paths to PPM6 images to encode and compare on."
+)
+parser.add_argument(
+    "--quality",
+    type=int,
+    default=constants.DEFAULT_ENTROPY_QUALITY,
+    help="The quality the K1 and K2 tables are scaled to.",
+)
+parser.add_argument(
+    "--lanes",
+    type=int,
+    nargs="+",
+    default=constants.DEFAULT_RANS_LANE_COUNTS,
+    help="The numbers of interleaved rANS lanes to try.",
+)
+parser.add_argument(
+    "--repeats",
+    type=int,
+    default=constants.DEFAULT_ENTROPY_REPEATS,
+    help="The number of timed runs per coder.",
+)
+
+
+def main():
+    args = parser.parse_args()
+
+    for image_path in args.image_paths:
+        image = Ppm6Image(image_path)
+        zigzagged_blocks = encode_image(
+            image.data,
+            quantization_tensor=get_quantization_tensor(quality=args.quality),
+            bit_depth=get_bit_depth(image.max_value),
+        )
+
+        results = compare_entropy_coders(
+            zigzagged_blocks, lane_counts=args.lanes, n_repeats=args.repeats
+        )
+        huffman_size, huffman_decode_time = results[0][1], results[0][3]
+
+        print(image_path)
+
+        for name, size, encode_time, decode_time in results:
+            print(
+                f"  {name:10} {size:9d} B ({size / huffman_size:6.1%}), "
+                f"encode {encode_time * 1000:7.1f} ms, "
+                f"decode {decode_time * 1000:7.1f} ms "
+                f"({huffman_decode_time / decode_time:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,945 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import argparse
+from io import BytesIO
+import sys
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from . import constants, reference
+from ..parsing.ppm_parsing import Ppm6Image
+from ..pipeline.block_kernels import dct_quantize_zigzag
+from ..pipeline.constants import (
+    HAAR_LOSSLESS_TRANSFORM,
+    IDENTITY_LOSSLESS_TRANSFORM,
+)
+from ..pipeline.fused_reconstruction import get_color_reconstruction_matrix
+from ..pipeline.intra_coding import decode_image, encode_image
+from ..pipeline.lossless_coding import decode_lossless, encode_lossless
+from ..pipeline.precision import FLOAT32_POLICY, FLOAT64_POLICY, get_level_shift
+from ..quantization.ycbcr_quantization import get_quantization_tensor, quantize
+from ..transformations.block_statistics import divide_image_to_blocks_with_statistics
+from ..transformations.color_transforms import get_color_transform, rgb_to_ycocg_r
+from ..transformations.constants import (
+    NUMBA_BACKEND,
+    NUMPY_BACKEND,
+    YCOCG_R_COLOR_TRANSFORM,
+)
+from ..transformations.fused_transformations import (
+    is_numba_available,
+    rgb_to_shifted_blocks,
+    rgb_to_shifted_ycbcr_blocks,
+)
+from ..transformations.image_transformations import (
+    dct_2d,
+    dct_2d_dc,
+    divide_image_to_blocks,
+    get_dct_basis,
+    get_dct_weights,
+    rgb_to_ycbcr,
+)
+from ..transformations.matrix_transformations import zigzag_pixel_blocks
+from ..transformations.pruned_transformations import (
+    get_pruned_dct_sizes,
+    get_pruned_dct_thresholds,
+    pruned_dct_2d,
+)
+
+
+class EquivalenceResult:
+    """
+    A class holding the outcome of checking one backend of a stage.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        backend: str,
+        max_error: float,
+        tolerance: float,
+        reference_time: float,
+        backend_time: float,
+    ):
+        self._stage = stage
+        self._backend = backend
+        self._max_error = max_error
+        self._tolerance = tolerance
+        self._reference_time = reference_time
+        self._backend_time = backend_time
+
+    # region Properties
+    @property
+    def stage(self) -> str:
+        """
+        The stage property.
+
+        :return:
+            A string representing the name of the checked stage.
+        """
+        return self._stage
+
+    @property
+    def backend(self) -> str:
+        """
+        The backend property.
+
+        :return:
+            A string representing the name of the checked backend.
+        """
+        return self._backend
+
+    @property
+    def max_error(self) -> float:
+        """
+        The maximum error property.
+
+        :return:
+            A float representing the largest difference to the reference over all
+            inputs, relative to the sample range if the tolerance is.
+        """
+        return self._max_error
+
+    @property
+    def tolerance(self) -> float:
+        """
+        The tolerance property.
+
+        :return:
+            A float representing the largest difference the backend may have.
+        """
+        return self._tolerance
+
+    @property
+    def passed(self) -> bool:
+        """
+        The passed property.
+
+        :return:
+            A bool; True if the maximum error is within the tolerance.
+        """
+        return self._max_error <= self._tolerance
+
+    @property
+    def speedup(self) -> float:
+        """
+        The speedup property.
+
+        :return:
+            A float representing how many times faster the backend ran than the
+            reference on the same inputs.
+        """
+        return self._reference_time / max(self._backend_time, sys.float_info.min)
+
+    # endregion
+
+
+# Every stage has a reference function, an input generator taking a
+# np.random.RandomState and a bit depth and returning the positional arguments, and
+# its backends with their tolerances.
+_reference_functions: Dict[str, Callable] = dict()
+_input_generators: Dict[str, Callable] = dict()
+_backends: Dict[str, Dict[str, Tuple[Callable, float, bool]]] = dict()
+
+
+def register_stage(name: str, reference_function: Callable, input_generator: Callable):
+    """
+    Makes a stage available for equivalence checks.
+
+    :param name:
+        A string representing the name of the stage.
+    :param reference_function:
+        A function computing the expected output from the generated arguments.
+    :param input_generator:
+        A function taking a np.random.RandomState and a bit depth and returning a
+        tuple of arguments for the reference and every backend.
+
+    :return:
+        Nothing.
+    """
+    _reference_functions[name] = reference_function
+    _input_generators[name] = input_generator
+    _backends.setdefault(name, dict())
+
+
+def register_backend(
+    stage: str,
+    name: str,
+    function: Callable,
+    tolerance: float = 0,
+    relative: bool = False,
+):
+    """
+    Adds an implementation to a registered stage.
+
+    :param stage:
+        A string representing the name of the stage.
+    :param name:
+        A string representing the name of the backend; one registered under the
+        same name is replaced.
+    :param function:
+        A function taking the same arguments as the reference function.
+    :param tolerance:
+        (Optional) A float representing the largest allowed absolute difference to
+        the reference. Defaults to 0 (exact).
+    :param relative:
+        (Optional) A bool; if True, differences are divided by the sample range,
+        2 ** bit_depth, before comparing them to the tolerance. Defaults to False.
+
+    :return:
+        Nothing.
+    """
+    if stage not in _backends:
+        raise KeyError(
+            f"Expected one of the registered stages {get_stage_names()}, got {stage}"
+        )
+
+    _backends[stage][name] = (function, tolerance, relative)
+
+
+def get_stage_names() -> List[str]:
+    """
+    Gets the names of all registered stages.
+
+    :return:
+        A sorted list of strings.
+    """
+    return sorted(_reference_functions)
+
+
+def _get_pixels(
+    rng: np.random.RandomState,
+    shape: Tuple[int, ...],
+    bit_depth: int,
+    pattern: str = None,
+) -> np.ndarray:
+    max_value = (1 << bit_depth) - 1
+    dtype = np.uint8 if bit_depth <= 8 else np.uint16
+
+    if pattern is None:
+        pattern = rng.choice(constants.PIXEL_PATTERNS)
+
+    if pattern == constants.ZEROS_PATTERN:
+        return np.zeros(shape, dtype=dtype)
+
+    if pattern == constants.MAX_PATTERN:
+        return np.full(shape, max_value, dtype=dtype)
+
+    if pattern == constants.CHECKERBOARD_PATTERN:
+        # Alternates along every axis but the components one.
+        checkerboard = (np.sum(np.indices(shape[:-1]), axis=0) % 2).astype(dtype)
+        checkerboard *= max_value
+
+        return np.broadcast_to(checkerboard[..., np.newaxis], shape).copy()
+
+    noise = rng.randint(0, max_value + 1, size=shape, dtype=dtype)
+
+    if pattern == constants.FLAT_TILES_PATTERN:
+        # Tiles follow the 8x8 grid of images, or are whole blocks of block inputs.
+        if len(shape) == 3:
+            rows, columns = np.indices(shape[:2]) // 8
+        else:
+            rows, columns = np.indices(shape[:2])[(Ellipsis,) + (None,) * 2]
+
+        tile_values = rng.randint(0, max_value + 1, size=(64, 64, shape[-1]))
+        tiles = np.broadcast_to(tile_values[rows, columns], shape).astype(dtype)
+        is_noise = np.broadcast_to(
+            (rng.random_sample((64, 64)) < 0.25)[rows, columns][..., np.newaxis], shape
+        )
+
+        return np.where(is_noise, noise, tiles)
+
+    return noise
+
+
+def _get_image(rng: np.random.RandomState, bit_depth: int) -> np.ndarray:
+    height, width = rng.randint(1, constants.MAX_EQUIVALENCE_IMAGE_SIZE, size=2)
+
+    return _get_pixels(rng, (height, width, 3), bit_depth)
+
+
+def _get_blocks(rng: np.random.RandomState, bit_depth: int) -> np.ndarray:
+    n_block_rows, n_block_columns = rng.randint(
+        1, constants.MAX_EQUIVALENCE_BLOCK_GRID_SIZE + 1, size=2
+    )
+    pixels = _get_pixels(rng, (n_block_rows, n_block_columns, 8, 8, 3), bit_depth)
+
+    return pixels.astype(np.float64) - (1 << (bit_depth - 1))
+
+
+def _get_pruning_blocks(rng: np.random.RandomState, bit_depth: int) -> np.ndarray:
+    # Adds a row of blocks with a random level and little noise, whose energies lie
+    # around the pruning thresholds, and a row of blocks with a random level and a
+    # single DCT basis pattern, whose bound is tight and whose coefficient is just
+    # below half a quantization step. These are where a wrong skip would show.
+    blocks = _get_blocks(rng, bit_depth)
+    shape = (1,) + blocks.shape[1:]
+    max_value = (1 << bit_depth) - 1
+    quantization_tensor = reference.get_quantization_tensor()
+
+    # The noise of n pixels has an energy of about sqrt(n) times its scale.
+    lowest_thresholds = get_pruned_dct_thresholds(quantization_tensor)
+    exponents = rng.uniform(
+        -constants.PRUNING_NOISE_DECADES,
+        constants.PRUNING_NOISE_DECADES,
+        size=shape[:2] + (1, 1, 3),
+    )
+    noise_scales = lowest_thresholds[:, 1] / 8 * np.power(10, exponents)
+    levels = rng.randint(0, max_value + 1, size=shape[:2] + (1, 1, 3))
+    noisy_pixels = np.clip(
+        np.rint(levels + noise_scales * rng.standard_normal(shape)), 0, max_value
+    )
+
+    basis = get_dct_basis()
+    weights = get_dct_weights() / 4
+    indices = rng.randint(1, 64, size=shape[:2] + (3,))
+    u, v = indices // 8, indices % 8
+    patterns = np.moveaxis(basis[u, :, np.newaxis] * basis[v, np.newaxis, :], 2, -1)
+    pattern_coefficients = (
+        weights[u, v]
+        * np.sum(np.square(patterns), axis=(2, 3))
+        / quantization_tensor[u, v, np.arange(3)]
+    )
+    amplitudes = (
+        rng.choice((-0.5, 0.5), size=pattern_coefficients.shape)
+        * (1 - np.power(10, rng.uniform(*constants.PRUNING_GAP_EXPONENTS)))
+        / pattern_coefficients
+    )
+    levels = rng.randint(0, max_value + 1, size=shape[:2] + (1, 1, 3))
+    pattern_pixels = levels + amplitudes[:, :, np.newaxis, np.newaxis] * patterns
+
+    return np.concatenate(
+        [
+            blocks,
+            noisy_pixels - (1 << (bit_depth - 1)),
+            pattern_pixels - (1 << (bit_depth - 1)),
+        ]
+    )
+
+
+def _get_photo_blocks(rng: np.random.RandomState, bit_depth: int) -> np.ndarray:
+    # Smooth components with a little noise, as after the color transform of a
+    # photo: luma needs most of its coefficients, chroma only the first few.
+    size = 8 * constants.PHOTO_BLOCK_GRID_SIZE
+    rows, columns = np.indices((size, size)) / size
+    max_value = (1 << bit_depth) - 1
+    components = list()
+
+    for amplitude in constants.PHOTO_COMPONENT_AMPLITUDES:
+        frequencies = rng.uniform(
+            0, constants.PHOTO_MAX_FREQUENCY, size=(constants.PHOTO_N_COSINES, 2)
+        )
+        phases = rng.uniform(0, 2 * np.pi, size=constants.PHOTO_N_COSINES)
+        cosines = np.cos(
+            2 * np.pi * np.multiply.outer(rows, frequencies[:, 0])
+            + 2 * np.pi * np.multiply.outer(columns, frequencies[:, 1])
+            + phases
+        )
+        field = amplitude / np.sqrt(constants.PHOTO_N_COSINES) * np.sum(cosines, -1)
+        noise = (
+            constants.PHOTO_NOISE_SCALE * amplitude * rng.standard_normal((size, size))
+        )
+        level = rng.randint(0, max_value + 1)
+
+        components.append(np.clip(np.rint(level + field + noise), 0, max_value))
+
+    return divide_image_to_blocks(np.stack(components, axis=-1)) - (
+        1 << (bit_depth - 1)
+    )
+
+
+def _get_block_image(rng: np.random.RandomState, bit_depth: int) -> np.ndarray:
+    # Every image stacks one band of blocks per pixel pattern, so every input
+    # covers noise, the extremes and the checkerboard.
+    n_block_rows, n_block_columns = rng.randint(
+        1, constants.MAX_EQUIVALENCE_BLOCK_GRID_SIZE + 1, size=2
+    )
+    band_shape = (8 * n_block_rows, 8 * n_block_columns, 3)
+
+    return np.concatenate(
+        [
+            _get_pixels(rng, band_shape, bit_depth, pattern=pattern)
+            for pattern in constants.PIXEL_PATTERNS
+        ]
+    )
+
+
+def _get_ppm6(rng: np.random.RandomState, bit_depth: int) -> bytes:
+    pixel_data = _get_image(rng, bit_depth)
+    header = (
+        f"P6\n{pixel_data.shape[1]} {pixel_data.shape[0]}\n{(1 << bit_depth) - 1}\n"
+    )
+
+    return (
+        header.encode("ascii")
+        + pixel_data.astype(pixel_data.dtype.newbyteorder(">")).tobytes()
+    )
+
+
+def _unrounded_ycocg_r(pixel_data: np.ndarray) -> np.ndarray:
+    color_transform = get_color_transform(YCOCG_R_COLOR_TRANSFORM)
+
+    return color_transform.forward(pixel_data) - color_transform.get_offsets()
+
+
+def _shifted_blocks_reference(pixel_data: np.ndarray) -> np.ndarray:
+    return reference.divide_image_to_blocks(reference.rgb_to_ycbcr(pixel_data) - 128)
+
+
+def _dct_quantize_zigzag_reference(pixel_blocks: np.ndarray) -> np.ndarray:
+    return reference.zigzag_pixel_blocks(
+        reference.quantize(
+            reference.dct_2d(pixel_blocks), reference.get_quantization_tensor()
+        )
+    )
+
+
+def _pruned_dct_quantize_zigzag(pixel_blocks: np.ndarray, dtype) -> np.ndarray:
+    quantization_tensor = reference.get_quantization_tensor()
+
+    return zigzag_pixel_blocks(
+        quantize(
+            pruned_dct_2d(pixel_blocks, quantization_tensor, dtype=dtype),
+            quantization_tensor,
+        )
+    )
+
+
+def _pruned_dct_skips(pixel_blocks: np.ndarray, dtype) -> np.ndarray:
+    # The full DCT with the coefficients pruning skips set to 0, which only matches
+    # the full path if every skipped coefficient quantizes to 0. Unlike the pruned
+    # paths, it doesn't depend on the order the kept coefficients are summed in.
+    quantization_tensor = reference.get_quantization_tensor()
+    sizes = get_pruned_dct_sizes(pixel_blocks, quantization_tensor, dtype=dtype)
+    rings = np.maximum.outer(np.arange(8), np.arange(8))
+    is_kept = rings[..., np.newaxis] < sizes[:, :, np.newaxis, np.newaxis, :]
+
+    return zigzag_pixel_blocks(
+        quantize(
+            np.where(is_kept, dct_2d(pixel_blocks, dtype=dtype), 0),
+            quantization_tensor,
+        )
+    )
+
+
+def _float32_policy_coefficients(pixel_data: np.ndarray, bit_depth: int) -> np.ndarray:
+    # The FLOAT32_POLICY coefficients with every change PrecisionPolicy bounds set
+    # back to the FLOAT64_POLICY ones, so any difference left breaks the bound: a
+    # coefficient may only change if its float64 value lies within the float error
+    # of both policies of a rounding boundary.
+    expected = encode_image(pixel_data, policy=FLOAT64_POLICY, bit_depth=bit_depth)
+    result = encode_image(pixel_data, policy=FLOAT32_POLICY, bit_depth=bit_depth)
+
+    quantization_tensor = get_quantization_tensor()
+    transform = get_color_transform()
+    dct_blocks = dct_2d(
+        rgb_to_shifted_blocks(
+            pixel_data,
+            transform.get_forward_matrix(),
+            transform.get_offset_vector(bit_depth, shift=-get_level_shift(bit_depth)),
+        )
+    )
+    values = zigzag_pixel_blocks(dct_blocks / quantization_tensor)
+    margins = (
+        FLOAT32_POLICY.get_coefficient_error_bound(bit_depth)
+        + FLOAT64_POLICY.get_coefficient_error_bound(bit_depth)
+    ) / zigzag_pixel_blocks(np.broadcast_to(quantization_tensor, dct_blocks.shape))
+
+    changes = np.abs(result.astype(np.int64) - expected)
+    is_bound = (np.abs(values - np.floor(values) - 0.5) <= margins) & (
+        changes <= 2 * margins + 1
+    )
+
+    return np.where(is_bound | (changes == 0), expected, result)
+
+
+def _float32_policy_pixels(pixel_data: np.ndarray, bit_depth: int) -> np.ndarray:
+    # The same for the pixels decoded from the coefficients of either policy, which
+    # may differ by 1 plus what the changed coefficients contribute plus the float
+    # error of both policies.
+    coefficients = [
+        encode_image(pixel_data, policy=policy, bit_depth=bit_depth).reshape(
+            pixel_data.shape[0] // 8, pixel_data.shape[1] // 8, -1
+        )
+        for policy in (FLOAT64_POLICY, FLOAT32_POLICY)
+    ]
+    expected, result = [
+        decode_image(
+            x.reshape(x.shape[:2] + (3, 64)), policy=policy, bit_depth=bit_depth
+        ).astype(np.int64)
+        for x, policy in zip(coefficients, (FLOAT64_POLICY, FLOAT32_POLICY))
+    ]
+
+    transform = get_color_transform()
+    matrix, offsets = get_color_reconstruction_matrix(
+        get_quantization_tensor(),
+        transform.inverse_matrix,
+        transform.get_offset_vector(bit_depth),
+        level_shift=get_level_shift(bit_depth),
+    )
+    matrix = np.abs(matrix)
+    offsets = np.abs(np.tile(offsets, 64))
+
+    bounds = (
+        1
+        + np.abs(coefficients[1] - coefficients[0].astype(np.float64)) @ matrix
+        + FLOAT64_POLICY.get_reconstruction_error_bound(
+            np.abs(coefficients[0]) @ matrix + offsets
+        )
+        + FLOAT32_POLICY.get_reconstruction_error_bound(
+            np.abs(coefficients[1]) @ matrix + offsets
+        )
+    )
+    # AxBx8x8x3 -> 8Ax8Bx3, the layout of the decoded image.
+    bounds = np.swapaxes(bounds.reshape(bounds.shape[:2] + (8, 8, 3)), 1, 2).reshape(
+        expected.shape
+    )
+
+    return np.where(np.abs(result - expected) <= bounds, expected, result)
+
+
+def _time(function: Callable, arguments: tuple, n_repeats: int) -> Tuple[float, object]:
+    best_time = np.inf
+
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = function(*arguments)
+        best_time = min(best_time, time.perf_counter() - start)
+
+    return best_time, result
+
+
+def check_equivalence(
+    stages: Sequence[str] = None,
+    n_trials: int = constants.DEFAULT_EQUIVALENCE_TRIALS,
+    bit_depths: Sequence[int] = constants.DEFAULT_EQUIVALENCE_BIT_DEPTHS,
+    n_repeats: int = constants.DEFAULT_EQUIVALENCE_REPEATS,
+    seed: int = constants.DEFAULT_EQUIVALENCE_SEED,
+) -> List[EquivalenceResult]:
+    """
+    Runs random inputs through the reference and every backend of stages.
+
+    Every backend gets the same inputs as the reference: n_trials random ones per
+    bit depth, with odd sizes and pixels drawn from noise, all zeros, all maximum
+    values or a checkerboard of both. Every backend is called once before it is
+    timed, so compilation isn't counted, and the best of n_repeats runs is kept.
+
+    :param stages:
+        (Optional) A sequence of strings representing the names of the stages to
+        check. Defaults to None (all registered stages).
+    :param n_trials:
+        (Optional) An int representing the number of inputs per bit depth.
+        Defaults to 4.
+    :param bit_depths:
+        (Optional) A sequence of ints representing the bits per sample inputs are
+        drawn with. Defaults to 8, 10, 12 and 16.
+    :param n_repeats:
+        (Optional) An int representing the number of timed runs per input.
+        Defaults to 3.
+    :param seed:
+        (Optional) An int used to seed the inputs. Defaults to 0.
+
+    :return:
+        A list of EquivalenceResult, one for every backend of every stage.
+    """
+    if stages is None:
+        stages = get_stage_names()
+
+    results = list()
+
+    for stage in stages:
+        # RandomState rather than default_rng, which needs numpy 1.17.
+        rng = np.random.RandomState(seed)
+        inputs = [
+            (bit_depth, _input_generators[stage](rng, bit_depth))
+            for bit_depth in bit_depths
+            for _ in range(n_trials)
+        ]
+
+        reference_time = 0
+        expected_results = list()
+
+        for _, arguments in inputs:
+            elapsed, expected = _time(_reference_functions[stage], arguments, 1)
+            reference_time += elapsed
+            expected_results.append(expected)
+
+        for backend, (function, tolerance, relative) in _backends[stage].items():
+            function(*inputs[0][1])
+
+            backend_time = 0
+            max_error = 0
+
+            for (bit_depth, arguments), expected in zip(inputs, expected_results):
+                elapsed, result = _time(function, arguments, n_repeats)
+                backend_time += elapsed
+
+                result = np.asarray(result)
+
+                if result.shape != expected.shape:
+                    max_error = np.inf
+
+                    continue
+
+                if result.size != 0:
+                    error = np.max(
+                        np.abs(result.astype(np.float64) - expected.astype(np.float64))
+                    )
+                    max_error = max(
+                        max_error, error / (1 << bit_depth) if relative else error
+                    )
+
+            results.append(
+                EquivalenceResult(
+                    stage=stage,
+                    backend=backend,
+                    max_error=float(max_error),
+                    tolerance=tolerance,
+                    reference_time=reference_time,
+                    backend_time=backend_time,
+                )
+            )
+
+    return results
+
+
+register_stage(
+    "rgb_to_ycbcr",
+    reference.rgb_to_ycbcr,
+    lambda rng, bit_depth: (_get_image(rng, bit_depth),),
+)
+register_backend(
+    "rgb_to_ycbcr",
+    NUMPY_BACKEND,
+    rgb_to_ycbcr,
+    tolerance=constants.FLOAT64_TOLERANCE,
+    relative=True,
+)
+register_backend(
+    "rgb_to_ycbcr",
+    "numpy-float32",
+    lambda x: rgb_to_ycbcr(x, dtype=np.float32),
+    tolerance=constants.FLOAT32_TOLERANCE,
+    relative=True,
+)
+
+# The reference always centers chroma on 128, which is what the color transform
+# does for 8 bits per sample.
+register_backend(
+    "rgb_to_ycbcr",
+    "color-transform",
+    lambda x: get_color_transform().forward(x, bit_depth=8),
+    tolerance=constants.FLOAT64_TOLERANCE,
+    relative=True,
+)
+
+
+register_stage(
+    "rgb_to_ycocg_r",
+    reference.rgb_to_ycocg_r,
+    lambda rng, bit_depth: (_get_image(rng, bit_depth),),
+)
+register_backend("rgb_to_ycocg_r", "lifting", rgb_to_ycocg_r)
+
+# The registered float transform has to be the lifting without its rounding.
+register_backend(
+    "rgb_to_ycocg_r",
+    "color-transform",
+    _unrounded_ycocg_r,
+    tolerance=constants.YCOCG_R_LIFTING_TOLERANCE,
+)
+
+register_stage(
+    "divide_image_to_blocks",
+    reference.divide_image_to_blocks,
+    lambda rng, bit_depth: (_get_image(rng, bit_depth),),
+)
+register_backend("divide_image_to_blocks", NUMPY_BACKEND, divide_image_to_blocks)
+register_backend(
+    "divide_image_to_blocks",
+    "with-statistics",
+    lambda x: divide_image_to_blocks_with_statistics(x)[0],
+)
+
+register_stage(
+    "rgb_to_shifted_ycbcr_blocks",
+    _shifted_blocks_reference,
+    lambda rng, bit_depth: (_get_image(rng, bit_depth),),
+)
+
+register_stage(
+    "dct_2d",
+    reference.dct_2d,
+    lambda rng, bit_depth: (_get_blocks(rng, bit_depth),),
+)
+register_backend(
+    "dct_2d",
+    NUMPY_BACKEND,
+    dct_2d,
+    tolerance=constants.FLOAT64_TOLERANCE,
+    relative=True,
+)
+register_backend(
+    "dct_2d",
+    "numpy-float32",
+    lambda x: dct_2d(x, dtype=np.float32),
+    tolerance=constants.FLOAT32_TOLERANCE,
+    relative=True,
+)
+
+# The DC coefficients of flat blocks have to match those of the full DCT exactly.
+for _dtype in (np.float64, np.float32):
+    _stage = f"dct_2d_dc-{np.dtype(_dtype).name}"
+
+    register_stage(
+        _stage,
+        lambda x, dtype=_dtype: dct_2d(x, dtype=dtype)[:, :, 0, 0],
+        lambda rng, bit_depth: (_get_pruning_blocks(rng, bit_depth),),
+    )
+    register_backend(
+        _stage,
+        NUMPY_BACKEND,
+        lambda x, dtype=_dtype: dct_2d_dc(
+            x.reshape((-1,) + x.shape[2:]), dtype=dtype
+        ).reshape(x.shape[:2] + x.shape[4:]),
+    )
+
+register_stage(
+    "quantize",
+    reference.quantize,
+    lambda rng, bit_depth: (
+        reference.dct_2d(_get_blocks(rng, bit_depth)),
+        reference.get_quantization_tensor(),
+    ),
+)
+register_backend("quantize", NUMPY_BACKEND, quantize)
+
+register_stage(
+    "zigzag_pixel_blocks",
+    reference.zigzag_pixel_blocks,
+    lambda rng, bit_depth: (_get_blocks(rng, bit_depth),),
+)
+register_backend("zigzag_pixel_blocks", NUMPY_BACKEND, zigzag_pixel_blocks)
+
+# Rounding the DCT coefficients of two implementations can only disagree on values
+# within float error of a rounding boundary, and then by 1.
+register_stage(
+    "dct_quantize_zigzag",
+    _dct_quantize_zigzag_reference,
+    lambda rng, bit_depth: (_get_blocks(rng, bit_depth),),
+)
+
+for _backend in (NUMPY_BACKEND, NUMBA_BACKEND):
+    if _backend == NUMBA_BACKEND and not is_numba_available():
+        continue
+
+    register_backend(
+        "rgb_to_shifted_ycbcr_blocks",
+        _backend,
+        lambda x, backend=_backend: rgb_to_shifted_ycbcr_blocks(x, backend=backend),
+        tolerance=constants.FLOAT64_TOLERANCE,
+        relative=True,
+    )
+    register_backend(
+        "dct_quantize_zigzag",
+        _backend,
+        lambda x, backend=_backend: dct_quantize_zigzag(
+            x, reference.get_quantization_tensor(), backend=backend
+        ),
+        tolerance=1,
+    )
+
+    # Skipped coefficients have to quantize to 0, so neither pruning nor skipping
+    # flat blocks can change the result of the same backend. The numpy pruned paths
+    # sum the kept coefficients in another order, so they may differ by 1 where a
+    # coefficient lies within float error of a rounding boundary, which the inputs
+    # are built to hit; whether every skipped coefficient quantizes to 0 is checked
+    # exactly on the full DCT instead.
+    for _dtype in (np.float64, np.float32):
+        _stage = f"dct_quantize_zigzag-{_backend}-{np.dtype(_dtype).name}"
+        _pruning_tolerance = 1 if _backend == NUMPY_BACKEND else 0
+
+        register_stage(
+            _stage,
+            lambda x, backend=_backend, dtype=_dtype: dct_quantize_zigzag(
+                x, reference.get_quantization_tensor(), dtype=dtype, backend=backend
+            ),
+            lambda rng, bit_depth: (_get_pruning_blocks(rng, bit_depth),),
+        )
+
+        if _backend == NUMPY_BACKEND:
+            register_backend(
+                _stage,
+                "pruned_dct_2d",
+                lambda x, dtype=_dtype: _pruned_dct_quantize_zigzag(x, dtype=dtype),
+                tolerance=_pruning_tolerance,
+            )
+            register_backend(
+                _stage,
+                "pruned-skips",
+                lambda x, dtype=_dtype: _pruned_dct_skips(x, dtype=dtype),
+            )
+
+        register_backend(
+            _stage,
+            "pruned",
+            lambda x, backend=_backend, dtype=_dtype: dct_quantize_zigzag(
+                x,
+                reference.get_quantization_tensor(),
+                dtype=dtype,
+                backend=backend,
+                pruning_tolerance=0,
+            ),
+            tolerance=_pruning_tolerance,
+        )
+        register_backend(
+            _stage,
+            "flat",
+            lambda x, backend=_backend, dtype=_dtype: dct_quantize_zigzag(
+                x,
+                reference.get_quantization_tensor(),
+                dtype=dtype,
+                backend=backend,
+                skip_flat_blocks=True,
+            ),
+        )
+
+        # The same check on larger, photo-like inputs, where pruning pays off.
+        _stage = f"{_stage}-photo"
+
+        register_stage(
+            _stage,
+            lambda x, backend=_backend, dtype=_dtype: dct_quantize_zigzag(
+                x, reference.get_quantization_tensor(), dtype=dtype, backend=backend
+            ),
+            lambda rng, bit_depth: (_get_photo_blocks(rng, bit_depth),),
+        )
+        register_backend(
+            _stage,
+            "pruned",
+            lambda x, backend=_backend, dtype=_dtype: dct_quantize_zigzag(
+                x,
+                reference.get_quantization_tensor(),
+                dtype=dtype,
+                backend=backend,
+                pruning_tolerance=0,
+            ),
+            tolerance=_pruning_tolerance,
+        )
+
+
+# FLOAT32_POLICY may only differ from FLOAT64_POLICY within the bounds derived in
+# PrecisionPolicy.
+register_stage(
+    "float32_policy",
+    lambda pixel_data, bit_depth: encode_image(
+        pixel_data, policy=FLOAT64_POLICY, bit_depth=bit_depth
+    ),
+    lambda rng, bit_depth: (_get_block_image(rng, bit_depth), bit_depth),
+)
+register_backend("float32_policy", "bound", _float32_policy_coefficients)
+
+register_stage(
+    "float32_policy_decode",
+    lambda pixel_data, bit_depth: decode_image(
+        encode_image(pixel_data, policy=FLOAT64_POLICY, bit_depth=bit_depth),
+        policy=FLOAT64_POLICY,
+        bit_depth=bit_depth,
+    ),
+    lambda rng, bit_depth: (_get_block_image(rng, bit_depth), bit_depth),
+)
+register_backend("float32_policy_decode", "bound", _float32_policy_pixels)
+
+# Lossless coding has to give back exactly the image it was given.
+register_stage(
+    "lossless_round_trip",
+    lambda pixel_data, bit_depth: pixel_data,
+    lambda rng, bit_depth: (_get_block_image(rng, bit_depth), bit_depth),
+)
+
+for _transform in (HAAR_LOSSLESS_TRANSFORM, IDENTITY_LOSSLESS_TRANSFORM):
+    register_backend(
+        "lossless_round_trip",
+        _transform,
+        lambda x, bit_depth, transform=_transform: decode_lossless(
+            encode_lossless(x, bit_depth=bit_depth, transform=transform),
+            bit_depth=bit_depth,
+            transform=transform,
+        ),
+    )
+
+register_stage(
+    "ppm6",
+    reference.read_ppm6,
+    lambda rng, bit_depth: (_get_ppm6(rng, bit_depth),),
+)
+register_backend("ppm6", NUMPY_BACKEND, lambda x: Ppm6Image(BytesIO(x)).data)
+
+
+parser = argparse.ArgumentParser(
+    description="Checks optimized pipeline stages against their loop references."
+)
+
+parser.add_argument(
+    "stages",
+    nargs="*",
+    default=None,
+    help="Names of the stages to check; all of them if none are given.",
+)
+parser.add_argument(
+    "--trials",
+    type=int,
+    default=constants.DEFAULT_EQUIVALENCE_TRIALS,
+    help="The number of random inputs per bit depth.",
+)
+parser.add_argument(
+    "--repeats",
+    type=int,
+    default=constants.DEFAULT_EQUIVALENCE_REPEATS,
+    help="The number of timed runs per input and backend.",
+)
+parser.add_argument(
+    "--seed",
+    type=int,
+    default=constants.DEFAULT_EQUIVALENCE_SEED,
+    help="The seed the inputs are drawn with.",
+)
+
+
+def main():
+    args = parser.parse_args()
+
+    results = check_equivalence(
+        stages=args.stages if len(args.stages) != 0 else None,
+        n_trials=args.trials,
+        n_repeats=args.repeats,
+        seed=args.seed,
+    )
+
+    for result in results:
+        print(
+            f"{'ok' if result.passed else 'FAIL':4} {result.stage:28} "
+            f"{result.backend:16} error {result.max_error:.3g} "
+            f"(tolerance {result.tolerance:.3g}), {result.speedup:.1f}x"
+        )
+
+    if not all(result.passed for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import sys
+from textwrap import dedent
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from . import constants
+
+_PACKAGE_ROOT = Path(__file__).resolve().parents[2]
+
+_IMPORT_SCRIPT = dedent("""
+    import json
+    import sys
+    import time
+
+    start = time.perf_counter()
+    import {module_name}
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({{
+        "elapsed": elapsed,
+        "loaded": [x for x in {optional_dependencies!r} if x in sys.modules],
+    }}))
+    """)
+
+
+def measure_import_time(
+    module_name: str,
+    n_runs: int = constants.DEFAULT_IMPORT_RUNS,
+    optional_dependencies: Sequence[str] = constants.OPTIONAL_DEPENDENCIES,
+) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Measures how long importing a module takes in a fresh interpreter.
+
+    Every run starts a new Python process, so nothing is cached in sys.modules and
+    the result is what a command line invocation pays on startup. Only the import
+    itself is timed, not the interpreter startup.
+
+    :param module_name:
+        A string representing the dotted name of the module, e.g.
+        "src.pipeline.intra_coding".
+    :param n_runs:
+        (Optional) An int representing the number of processes to time. Defaults
+        to 10.
+    :param optional_dependencies:
+        (Optional) A sequence of strings representing top level modules which
+        should not be loaded by the import. Defaults to tqdm and numba.
+
+    :return:
+        A tuple containing a np.ndarray of shape (n_runs) with the import time of
+        every run in seconds, and a tuple of strings with the optional dependencies
+        the import loaded.
+    """
+    script = _IMPORT_SCRIPT.format(
+        module_name=module_name, optional_dependencies=tuple(optional_dependencies)
+    )
+
+    elapsed = np.empty(n_runs, dtype=np.float64)
+    loaded = set()
+
+    for i in range(n_runs):
+        result = json.loads(
+            subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=_PACKAGE_ROOT,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+
+        elapsed[i] = result["elapsed"]
+        loaded.update(result["loaded"])
+
+    return elapsed, tuple(sorted(loaded))
+
+
+parser = argparse.ArgumentParser(
+    description="Measures the import time of package modules in fresh interpreters."
+)
+
+parser.add_argument(
+    "modules",
+    nargs="*",
+    default=constants.DEFAULT_IMPORT_MODULES,
+    help="Dotted names of the modules to import.",
+)
+parser.add_argument(
+    "--runs",
+    type=int,
+    default=constants.DEFAULT_IMPORT_RUNS,
+    help="The number of fresh interpreters every module is imported in.",
+)
+
+
+def main():
+    args = parser.parse_args()
+
+    for module_name in args.modules:
+        elapsed, loaded = measure_import_time(module_name, n_runs=args.runs)
+
+        print(
+            f"{module_name}: median {np.median(elapsed) * 1000:.1f} ms, "
+            f"min {np.min(elapsed) * 1000:.1f} ms over {args.runs} runs"
+            + (f", loads {', '.join(loaded)}" if len(loaded) != 0 else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import numpy as np
+
+from ..parsing import constants as parsing_constants
+from ..quantization import constants as quantization_constants
+from ..transformations import constants as transformation_constants
+
+# The original per-pixel and per-block implementations of pipeline stages, frozen
+# as reference oracles for the equivalence checks. They are slow on purpose and
+# must not be optimized; the faster versions live in their own subpackages.
+
+
+def rgb_to_ycbcr(
+    pixel_data: np.ndarray,
+    y_coefficients=transformation_constants.DEFAULT_Y_COEFFICIENTS,
+    cb_coefficients=transformation_constants.DEFAULT_CB_COEFFICIENTS,
+    cr_coefficients=transformation_constants.DEFAULT_CR_COEFFICIENTS,
+    y_addition=transformation_constants.DEFAULT_Y_ADDITION,
+    cb_addition=transformation_constants.DEFAULT_CB_ADDITION,
+    cr_addition=transformation_constants.DEFAULT_CR_ADDITION,
+) -> np.ndarray:
+    """
+    Converts a RGB matrix into a YCbCr matrix one pixel at a time.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 you wish to convert to YCbCr.
+
+    :return:
+        A np.ndarray of shape HxWx3: the image in YCbCr color space.
+    """
+    y_coefficients, cb_coefficients, cr_coefficients = (
+        np.array(x) for x in (y_coefficients, cb_coefficients, cr_coefficients)
+    )
+
+    return np.array(
+        [
+            [
+                [
+                    y_coefficients @ pixel + y_addition,
+                    cb_coefficients @ pixel + cb_addition,
+                    cr_coefficients @ pixel + cr_addition,
+                ]
+                for pixel in row
+            ]
+            for row in pixel_data
+        ]
+    ).reshape(pixel_data.shape[:2] + (3,))
+
+
+def rgb_to_ycocg_r(pixel_data: np.ndarray) -> np.ndarray:
+    """
+    Converts integer RGB pixels into YCoCg-R one pixel at a time, with the
+    lossless lifting steps.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 containing integer RGB pixels.
+
+    :return:
+        A np.ndarray of shape HxWx3 containing Y, Co and Cg.
+    """
+    to_return = list()
+
+    for red, green, blue in np.reshape(pixel_data, (-1, 3)).tolist():
+        co = red - blue
+        t = blue + (co >> 1)
+        cg = green - t
+
+        to_return.append((t + (cg >> 1), co, cg))
+
+    return np.array(to_return, dtype=np.int64).reshape(np.shape(pixel_data))
+
+
+def divide_image_to_blocks(
+    pixel_data: np.ndarray, block_width: int = 8, block_height: int = 8
+) -> np.ndarray:
+    """
+    Divides an image into block_width x block_height blocks one block at a time.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3, where A = H/8 and B = W/8
+    """
+    to_return = list()
+
+    for h_offset in range(0, pixel_data.shape[0] - block_height + 1, block_height):
+        current_row = list()
+
+        for w_offset in range(0, pixel_data.shape[1] - block_width + 1, block_width):
+            current_row.append(
+                pixel_data[
+                    h_offset : h_offset + block_height,
+                    w_offset : w_offset + block_width,
+                ]
+            )
+
+        to_return.append(current_row)
+
+    return np.array(to_return).reshape(
+        (
+            pixel_data.shape[0] // block_height,
+            pixel_data.shape[1] // block_width,
+            block_height,
+            block_width,
+            pixel_data.shape[2],
+        )
+    )
+
+
+def dct_2d_on_8x8_block(pixel_block: np.ndarray) -> np.ndarray:
+    """
+    Does 2D DCT on a single 8x8 block one coefficient at a time.
+
+    :param pixel_block:
+        A np.ndarray of shape 8x8x3.
+
+    :return:
+        A np.ndarray of shape 8x8x3: the 2D DCT result.
+    """
+    to_return = list()
+
+    for u in range(8):
+        current_row = list()
+
+        for v in range(8):
+            coefficient = (
+                transformation_constants.DCT_C_ZERO_VAL
+                if (u == 0 or v == 0)
+                else transformation_constants.DCT_C_NONZERO_VAL
+            )
+            coefficient /= 4
+            u_coef = u * transformation_constants.PI_SIXTEENTH
+            v_coef = v * transformation_constants.PI_SIXTEENTH
+            current_value = np.zeros(pixel_block[0][0].shape, dtype=np.float64)
+
+            for i, pixel_block_row in enumerate(pixel_block):
+                for j, pixel in enumerate(pixel_block_row):
+                    current_value += (
+                        pixel
+                        * np.cos((2 * i + 1) * u_coef)
+                        * np.cos((2 * j + 1) * v_coef)
+                    )
+
+            current_row.append(coefficient * current_value)
+
+        to_return.append(current_row)
+
+    return np.array(to_return)
+
+
+def dct_2d(pixel_blocks: np.ndarray) -> np.ndarray:
+    """
+    Does 8x8 2D DCT on an image represented by pixel blocks one block at a time.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+    """
+    return np.array(
+        [
+            [dct_2d_on_8x8_block(pixel_block) for pixel_block in row]
+            for row in pixel_blocks
+        ]
+    ).reshape(pixel_blocks.shape)
+
+
+def get_quantization_tensor(
+    y_table=quantization_constants.K1_TABLE,
+    cb_table=quantization_constants.K2_TABLE,
+    cr_table=quantization_constants.K2_TABLE,
+) -> np.ndarray:
+    """
+    Gets a tensor used to quantize DCT blocks.
+
+    :return:
+        A np.ndarray of shape 8x8x3 used to quantize DCT blocks.
+    """
+    return np.stack([y_table, cb_table, cr_table]).transpose((1, 2, 0))
+
+
+def quantize(pixel_blocks: np.ndarray, quantization_tensor: np.ndarray) -> np.ndarray:
+    """
+    Quantizes an image comprised of pixel blocks one block at a time.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 you with to quantize the pixel blocks with.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3: the quantization result.
+    """
+    return np.array(
+        [
+            [
+                np.rint(pixel_block / quantization_tensor).astype(int)
+                for pixel_block in pixel_block_row
+            ]
+            for pixel_block_row in pixel_blocks
+        ]
+    ).reshape(pixel_blocks.shape)
+
+
+def array_2d_to_zigzag(array_2d: np.ndarray) -> np.ndarray:
+    """
+    Converts a 2D array into a 1D array by zigzag scanning.
+
+    :param array_2d:
+        A np.ndarray of shape AxB.
+
+    :return:
+        A np.ndarray of shape AB.
+    """
+    return np.concatenate(
+        [
+            np.diagonal(array_2d[::-1, :], k)[:: (2 * (k % 2) - 1)]
+            for k in range(1 - array_2d.shape[0], array_2d.shape[0])
+        ]
+    )
+
+
+def zigzag_pixel_blocks(pixel_blocks: np.ndarray) -> np.ndarray:
+    """
+    Zigzag scans every component of every block one block at a time.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+
+    :return:
+        A np.ndarray of shape AxBx3x64, where A = H/8, B = W/8.
+    """
+    return np.array(
+        [
+            [
+                [
+                    array_2d_to_zigzag(pixel_sector)
+                    for pixel_sector in pixel_block.transpose(2, 0, 1)
+                ]
+                for pixel_block in pixel_block_row
+            ]
+            for pixel_block_row in pixel_blocks
+        ]
+    ).reshape(pixel_blocks.shape[:2] + (pixel_blocks.shape[4], -1))
+
+
+def read_ppm6(content: bytes) -> np.ndarray:
+    """
+    Reads the pixels of a PPM6 image one sample at a time.
+
+    The original reader kept every byte of a 16-bit image as its own sample; here
+    the big-endian byte pairs are combined as the format specifies, everything
+    else is as it was. Headers are expected to have one field per line and no
+    comments.
+
+    :param content:
+        A bytes object containing the whole file.
+
+    :return:
+        A np.ndarray of shape HxWx3 containing the pixels, uint8 or uint16.
+    """
+    lines = content.split(b"\n", 3)
+    width, height = (
+        int(x)
+        for x in parsing_constants.WHITESPACE_REGEX.split(
+            lines[1].decode("utf8").strip()
+        )
+    )
+    max_value = int(lines[2].decode("utf8").strip())
+
+    bytes_per_color = 1 if max_value < 256 else 2
+    read_content = lines[3]
+
+    samples = [
+        int.from_bytes(read_content[i : i + bytes_per_color], byteorder="big")
+        for i in range(0, width * height * 3 * bytes_per_color, bytes_per_color)
+    ]
+
+    return np.array(
+        samples, dtype=np.uint8 if bytes_per_color == 1 else np.uint16
+    ).reshape(height, width, 3)
@@ -0,0 +1,442 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Callable, Tuple
+
+import numpy as np
+
+from . import constants
+from ..pipeline.block_kernels import dct_quantize_zigzag
+from ..quantization.ycbcr_quantization import quantize
+from ..transformations.constants import NUMPY_BACKEND
+from ..transformations.fused_transformations import resolve_backend
+from ..transformations.image_transformations import dct_2d
+
+# Blocks are hashed as rows of 64-bit words: every (folded) word is multiplied by its
+# own random odd constant, the products are summed (mod 2^64) together with the hash
+# of the context (the kind of result, quantization tensor and options), and the sum
+# is mixed with the splitmix64 finalizer. Hashes only find candidates: a cached
+# entry is used only if its words and context are equal to those of the block.
+
+
+def get_block_digest(data: np.ndarray, prefix: bytes = b"") -> bytes:
+    """
+    Hashes the contents, shape and dtype of an array.
+
+    :param data:
+        A np.ndarray of shape S (any shape).
+    :param prefix:
+        (Optional) Bytes hashed before the array.
+
+    :return:
+        A bytes object of length 16: the digest.
+    """
+    hasher = blake2b(prefix, digest_size=constants.BLOCK_HASH_DIGEST_SIZE)
+    hasher.update(f"{data.dtype.str}{data.shape}".encode("utf8"))
+    hasher.update(np.ascontiguousarray(data).tobytes())
+
+    return hasher.digest()
+
+
+@lru_cache(maxsize=None)
+def _get_hash_multipliers(n_words: int) -> np.ndarray:
+    # RandomState rather than default_rng, which needs numpy 1.17.
+    multipliers = np.random.RandomState(constants.BLOCK_HASH_SEED).randint(
+        0, 2**64, size=n_words, dtype=np.uint64
+    ) | np.uint64(1)
+    multipliers.flags.writeable = False
+
+    return multipliers
+
+
+def get_block_words(flat_blocks: np.ndarray) -> np.ndarray:
+    """
+    Views every block as a row of 64-bit words.
+
+    :param flat_blocks:
+        A np.ndarray of shape NxS (any trailing shape S).
+
+    :return:
+        A np.ndarray of shape NxW of dtype uint64 holding the bytes of every block,
+        zero padded to a whole number of words.
+    """
+    block_bytes = np.ascontiguousarray(flat_blocks).reshape(len(flat_blocks), -1)
+    block_bytes = block_bytes.view(np.uint8)
+
+    if block_bytes.shape[1] % 8 != 0:
+        block_bytes = np.pad(block_bytes, ((0, 0), (0, -block_bytes.shape[1] % 8)))
+
+    return np.ascontiguousarray(block_bytes).view(np.uint64)
+
+
+def get_block_hashes(block_words: np.ndarray, salt: int = 0) -> np.ndarray:
+    """
+    Hashes every row of words at once.
+
+    :param block_words:
+        A np.ndarray of shape NxW of dtype uint64, usually from get_block_words.
+    :param salt:
+        (Optional) An int in [0, 2^64) mixed into every hash. Defaults to 0.
+
+    :return:
+        A np.ndarray of shape N of dtype uint64.
+    """
+    # Folding the high half into the low one keeps words which only differ in their
+    # high bits (e.g. floats) from cancelling out in the products.
+    hashes = (block_words ^ (block_words >> np.uint64(32))) @ _get_hash_multipliers(
+        block_words.shape[1]
+    )
+    hashes += np.uint64(salt)
+
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94D049BB133111EB)
+    hashes ^= hashes >> np.uint64(31)
+
+    return hashes
+
+
+def _get_salt(*context) -> int:
+    digest = blake2b(repr(context).encode("utf8"), digest_size=8).digest()
+
+    return int.from_bytes(digest, "little")
+
+
+class BlockCache:
+    """
+    A class for reusing quantized DCT coefficients of blocks seen before.
+
+    Entries are addressed by a hash of the pixel block and the quantization tensor,
+    and the least recently used entry is evicted once the cache is full. Blocks are
+    hashed, deduplicated and looked up as whole arrays, so only the blocks which
+    are not cached go through the DCT.
+
+    A lookup costs a bit more than half of the NumPy DCT, quantization and zigzag
+    scan of the same blocks, so the cache pays off once most blocks repeat; the
+    numba kernel is about as fast as the lookup itself.
+
+    The cache holds results of one layout (block dtype and shape, result shape and
+    dtype) at a time; a call with a different layout empties it first.
+    """
+
+    def __init__(self, max_size: int = constants.DEFAULT_BLOCK_CACHE_SIZE):
+        if max_size < 1:
+            raise ValueError(f"Expected max_size to be at least 1, got {max_size}")
+
+        self._max_size = max_size
+
+        self._layout = None
+        self._slots = dict()
+        self._size = 0
+        self._clock = 0
+
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._salts = np.empty(0, dtype=np.uint64)
+        self._last_used = np.empty(0, dtype=np.int64)
+        self._words = None
+        self._values = None
+
+        self._hits = 0
+        self._misses = 0
+
+    # region Properties
+    @property
+    def max_size(self) -> int:
+        """
+        The maximum size property.
+
+        :return:
+            An int representing the maximum number of cached blocks.
+        """
+        return self._max_size
+
+    @property
+    def size(self) -> int:
+        """
+        The size property.
+
+        :return:
+            An int representing the number of currently cached blocks.
+        """
+        return self._size
+
+    @property
+    def hits(self) -> int:
+        """
+        The hit counter.
+
+        :return:
+            An int representing the number of blocks found in the cache.
+        """
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        The miss counter.
+
+        :return:
+            An int representing the number of blocks which had to be computed.
+        """
+        return self._misses
+
+    # endregion
+
+    def _empty(self):
+        self._layout = None
+        self._slots.clear()
+        self._size = 0
+
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._salts = np.empty(0, dtype=np.uint64)
+        self._last_used = np.empty(0, dtype=np.int64)
+        self._words = None
+        self._values = None
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+
+        :return:
+            Nothing.
+        """
+        self._empty()
+        self._hits = 0
+        self._misses = 0
+
+    def _grow(self, capacity: int):
+        def _resize(array: np.ndarray) -> np.ndarray:
+            resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            resized[: len(array)] = array
+
+            return resized
+
+        self._hashes = _resize(self._hashes)
+        self._salts = _resize(self._salts)
+        self._last_used = _resize(self._last_used)
+        self._words = _resize(self._words)
+        self._values = _resize(self._values)
+
+    def _insert(
+        self, hashes: np.ndarray, salt: int, words: np.ndarray, values: np.ndarray
+    ):
+        # Hashes already in use belong to other blocks (or contexts), which keep
+        # their slots.
+        is_new = np.array([x not in self._slots for x in hashes.tolist()], dtype=bool)
+        hashes, words, values = hashes[is_new], words[is_new], values[is_new]
+
+        n_new = min(len(hashes), self._max_size)
+        hashes, words, values = hashes[:n_new], words[:n_new], values[:n_new]
+
+        if n_new == 0:
+            return
+
+        if self._size + n_new > len(self._hashes):
+            self._grow(
+                min(self._max_size, max(2 * len(self._hashes), self._size + n_new))
+            )
+
+        n_free = min(n_new, len(self._hashes) - self._size)
+        slots = np.arange(self._size, self._size + n_free)
+
+        if n_free < n_new:
+            n_evicted = n_new - n_free
+            evicted = np.argpartition(self._last_used[: self._size], n_evicted - 1)
+            evicted = evicted[:n_evicted]
+
+            for evicted_hash in self._hashes[evicted].tolist():
+                del self._slots[evicted_hash]
+
+            slots = np.concatenate((slots, evicted))
+
+        self._size += n_free
+
+        self._hashes[slots] = hashes
+        self._salts[slots] = salt
+        self._last_used[slots] = self._clock
+        self._words[slots] = words
+        self._values[slots] = values
+        self._slots.update(zip(hashes.tolist(), slots.tolist()))
+
+    def _get(
+        self,
+        pixel_blocks: np.ndarray,
+        context: Tuple,
+        compute: Callable[[np.ndarray], np.ndarray],
+        value_shape: Tuple[int, ...],
+        value_dtype,
+    ) -> np.ndarray:
+        value_dtype = np.dtype(value_dtype)
+        flat_blocks = np.reshape(pixel_blocks, (-1,) + pixel_blocks.shape[2:])
+        words = get_block_words(flat_blocks)
+
+        layout = (
+            flat_blocks.dtype.str,
+            flat_blocks.shape[1:],
+            value_shape,
+            value_dtype,
+        )
+
+        if layout != self._layout:
+            self._empty()
+            self._layout = layout
+            self._words = np.empty((0, words.shape[1]), dtype=np.uint64)
+            self._values = np.empty((0,) + value_shape, dtype=value_dtype)
+
+        salt = _get_salt(flat_blocks.dtype.str, *context)
+        hashes = get_block_hashes(words, salt)
+        self._clock += 1
+
+        # Repeated blocks within the call are looked up and computed only once.
+        unique_hashes, first, inverse = np.unique(
+            hashes, return_index=True, return_inverse=True
+        )
+        repeated = np.flatnonzero(first[inverse] != np.arange(len(flat_blocks)))
+        colliding = repeated[
+            np.any(words[repeated] != words[first[inverse[repeated]]], axis=1)
+        ]
+
+        slots = np.array(
+            [self._slots.get(x, -1) for x in unique_hashes.tolist()], dtype=np.intp
+        )
+        is_found = slots >= 0
+        is_found[is_found] = (self._salts[slots[is_found]] == np.uint64(salt)) & np.all(
+            self._words[slots[is_found]] == words[first[is_found]], axis=1
+        )
+
+        self._last_used[slots[is_found]] = self._clock
+        missing = np.flatnonzero(~is_found)
+
+        # Missing blocks are computed in the order of the call, so when no block is
+        # cached or repeated (e.g. a new image) they are used as they are.
+        missing = missing[np.argsort(first[missing])]
+
+        if len(missing) == 0:
+            values = self._values[slots[inverse]]
+        elif len(missing) == len(flat_blocks):
+            values = compute(flat_blocks)
+
+            self._insert(unique_hashes[missing], salt, words, values)
+        else:
+            unique_values = np.empty(
+                (len(unique_hashes),) + value_shape, dtype=value_dtype
+            )
+            unique_values[is_found] = self._values[slots[is_found]]
+            unique_values[missing] = compute(flat_blocks[first[missing]])
+
+            values = unique_values[inverse]
+
+            self._insert(
+                unique_hashes[missing],
+                salt,
+                words[first[missing]],
+                unique_values[missing],
+            )
+
+        # Blocks whose hash collides with another block of the call are computed on
+        # their own and not cached.
+        if len(colliding) != 0:
+            values[colliding] = compute(flat_blocks[colliding])
+
+        n_computed = len(missing) + len(colliding)
+        self._misses += n_computed
+        self._hits += len(flat_blocks) - n_computed
+
+        return values.reshape(pixel_blocks.shape[:2] + value_shape)
+
+    def quantize(
+        self, pixel_blocks: np.ndarray, quantization_tensor: np.ndarray
+    ) -> np.ndarray:
+        """
+        Does the 2D DCT and quantization, computing only blocks not in the cache.
+
+        The result is the same as quantize(dct_2d(pixel_blocks), quantization_tensor).
+
+        :param pixel_blocks:
+            A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+        :param quantization_tensor:
+            A np.ndarray of shape 8x8x3 you wish to quantize with.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3: the quantization result.
+        """
+        quantization_tensor = np.asarray(quantization_tensor)
+
+        return self._get(
+            pixel_blocks,
+            context=("quantize", get_block_digest(quantization_tensor)),
+            compute=lambda x: quantize(dct_2d(x[np.newaxis])[0], quantization_tensor),
+            value_shape=pixel_blocks.shape[2:],
+            value_dtype=int,
+        )
+
+    def dct_quantize_zigzag(
+        self,
+        pixel_blocks: np.ndarray,
+        quantization_tensor: np.ndarray,
+        dtype=np.float64,
+        coefficient_dtype=int,
+        backend: str = NUMPY_BACKEND,
+        skip_flat_blocks: bool = False,
+    ) -> np.ndarray:
+        """
+        Does the 2D DCT, quantization and zigzag scanning, computing only blocks not
+        in the cache.
+
+        The result is the same as dct_quantize_zigzag with the same arguments.
+
+        :param pixel_blocks:
+            A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+        :param quantization_tensor:
+            A np.ndarray of shape 8x8x3 you wish to quantize with.
+        :param dtype:
+            (Optional) The floating point dtype the DCT is computed in. Defaults to
+            np.float64.
+        :param coefficient_dtype:
+            (Optional) The integer dtype of the result. Defaults to int.
+        :param backend:
+            (Optional) A string: "numpy", "numba" or "auto". Defaults to "numpy".
+        :param skip_flat_blocks:
+            (Optional) A bool passed to dct_quantize_zigzag. Defaults to False.
+
+        :return:
+            A np.ndarray of shape AxBx3x64.
+        """
+        quantization_tensor = np.asarray(quantization_tensor)
+        backend = resolve_backend(backend)
+
+        return self._get(
+            pixel_blocks,
+            context=(
+                "dct_quantize_zigzag",
+                get_block_digest(quantization_tensor),
+                np.dtype(dtype).str,
+                backend,
+                skip_flat_blocks,
+            ),
+            compute=lambda x: dct_quantize_zigzag(
+                x[np.newaxis],
+                quantization_tensor,
+                dtype=dtype,
+                coefficient_dtype=coefficient_dtype,
+                backend=backend,
+                skip_flat_blocks=skip_flat_blocks,
+            )[0],
+            value_shape=(pixel_blocks.shape[4], 64),
+            value_dtype=coefficient_dtype,
+        )
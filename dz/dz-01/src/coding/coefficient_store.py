@@ -0,0 +1,242 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from pathlib import Path
+import struct
+
+import numpy as np
+
+from . import constants
+
+# The file layout is:
+#   - the header (magic, version, A, B, components, coefficients, dtype)
+#   - the 8x8x3 quantization tensor
+#   - A + 1 block row offsets, in bytes from the start of the file
+#   - the payload: every block row stored planar, as components x B x coefficients
+
+
+def save_coefficients(
+    file_path: Path or str,
+    zigzagged_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    dtype: str = constants.DEFAULT_COEFFICIENT_DTYPE,
+):
+    """
+    Saves quantized coefficients into a binary coefficient store.
+
+    :param file_path:
+        A Path or string representing the path of the file to write.
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64, usually the output of zigzag_pixel_blocks.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+    :param dtype:
+        A string representing the little-endian integer dtype of the payload.
+        Defaults to int16.
+
+    :return:
+        Nothing.
+    """
+    dtype = np.dtype(dtype)
+    limits = np.iinfo(dtype)
+
+    if zigzagged_blocks.size != 0 and (
+        np.min(zigzagged_blocks) < limits.min or np.max(zigzagged_blocks) > limits.max
+    ):
+        raise ValueError(f"Coefficients do not fit into {dtype.str}")
+
+    n_block_rows, n_block_columns, n_components, n_coefficients = zigzagged_blocks.shape
+    header = struct.pack(
+        constants.COEFFICIENT_STORE_HEADER_FORMAT,
+        constants.COEFFICIENT_STORE_MAGIC,
+        constants.COEFFICIENT_STORE_VERSION,
+        n_block_rows,
+        n_block_columns,
+        n_components,
+        n_coefficients,
+        dtype.str.encode("ascii"),
+    )
+    table = np.asarray(
+        quantization_tensor, dtype=constants.COEFFICIENT_STORE_TABLE_DTYPE
+    ).tobytes()
+
+    payload_start = (
+        len(header)
+        + len(table)
+        + (n_block_rows + 1)
+        * np.dtype(constants.COEFFICIENT_STORE_INDEX_DTYPE).itemsize
+    )
+    row_size = n_block_columns * n_components * n_coefficients * dtype.itemsize
+    offsets = payload_start + np.arange(n_block_rows + 1) * row_size
+
+    with open(file_path, mode="wb") as file:
+        file.write(header)
+        file.write(table)
+        file.write(offsets.astype(constants.COEFFICIENT_STORE_INDEX_DTYPE).tobytes())
+        file.write(
+            np.ascontiguousarray(
+                zigzagged_blocks.transpose((0, 2, 1, 3)), dtype=dtype
+            ).tobytes()
+        )
+
+
+class CoefficientStore:
+    """
+    A class for reading a binary coefficient store.
+
+    The payload is memory-mapped, so single blocks and block rows are read without
+    loading the whole file.
+    """
+
+    def __init__(self, file_path: Path or str):
+        header_size = struct.calcsize(constants.COEFFICIENT_STORE_HEADER_FORMAT)
+
+        with open(file_path, mode="rb") as file:
+            (
+                magic,
+                version,
+                n_block_rows,
+                n_block_columns,
+                n_components,
+                n_coefficients,
+                dtype,
+            ) = struct.unpack(
+                constants.COEFFICIENT_STORE_HEADER_FORMAT, file.read(header_size)
+            )
+
+            if magic != constants.COEFFICIENT_STORE_MAGIC:
+                raise ValueError(f"{file_path} is not a coefficient store")
+
+            if version != constants.COEFFICIENT_STORE_VERSION:
+                raise ValueError(
+                    f"Expected coefficient store version "
+                    f"{constants.COEFFICIENT_STORE_VERSION}, got {version}"
+                )
+
+            table_dtype = np.dtype(constants.COEFFICIENT_STORE_TABLE_DTYPE)
+            index_dtype = np.dtype(constants.COEFFICIENT_STORE_INDEX_DTYPE)
+
+            self._shape = (n_block_rows, n_block_columns, n_components, n_coefficients)
+            self._dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+            self._quantization_tensor = (
+                np.frombuffer(
+                    file.read(64 * n_components * table_dtype.itemsize), table_dtype
+                )
+                .reshape(8, 8, n_components)
+                .astype(int)
+            )
+            self._offsets = np.frombuffer(
+                file.read((n_block_rows + 1) * index_dtype.itemsize), index_dtype
+            ).astype(np.int64)
+
+        payload_size = int(self._offsets[-1] - self._offsets[0])
+
+        # np.memmap can not map an empty region.
+        self._payload = (
+            np.memmap(
+                file_path,
+                dtype=self._dtype,
+                mode="r",
+                offset=int(self._offsets[0]),
+                shape=(payload_size // self._dtype.itemsize,),
+            )
+            if payload_size != 0
+            else np.zeros(0, dtype=self._dtype)
+        )
+
+    # region Properties
+    @property
+    def shape(self) -> tuple:
+        """
+        The shape property.
+
+        :return:
+            A tuple (A, B, 3, 64) representing the shape of the stored coefficients.
+        """
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The payload dtype property.
+
+        :return:
+            A np.dtype representing the dtype the coefficients are stored as.
+        """
+        return self._dtype
+
+    @property
+    def quantization_tensor(self) -> np.ndarray:
+        """
+        The quantization tensor property.
+
+        :return:
+            A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+        """
+        return np.copy(self._quantization_tensor)
+
+    # endregion
+
+    def get_block_row(self, block_row: int) -> np.ndarray:
+        """
+        Reads a single block row.
+
+        :param block_row:
+            An int representing the index of the block row, in [0, A).
+
+        :return:
+            A read-only np.ndarray view of shape Bx3x64.
+        """
+        if not 0 <= block_row < self._shape[0]:
+            raise IndexError(
+                f"Expected block_row to be in [0, {self._shape[0]}), got {block_row}"
+            )
+
+        start, end = self._offsets[block_row : block_row + 2] - self._offsets[0]
+        start, end = start // self._dtype.itemsize, end // self._dtype.itemsize
+
+        return (
+            self._payload[start:end]
+            .reshape(self._shape[2], self._shape[1], self._shape[3])
+            .transpose((1, 0, 2))
+        )
+
+    def get_block(self, block_row: int, block_column: int) -> np.ndarray:
+        """
+        Reads a single block.
+
+        :param block_row:
+            An int representing the row index of the block.
+        :param block_column:
+            An int representing the column index of the block.
+
+        :return:
+            A read-only np.ndarray view of shape 3x64.
+        """
+        return self.get_block_row(block_row)[block_column]
+
+    def to_array(self) -> np.ndarray:
+        """
+        Reads all of the stored coefficients.
+
+        :return:
+            A np.ndarray of shape AxBx3x64 with the same layout as the output of
+            zigzag_pixel_blocks.
+        """
+        return np.array(
+            self._payload.reshape(
+                self._shape[0], self._shape[2], self._shape[1], self._shape[3]
+            ).transpose((0, 2, 1, 3)),
+            dtype=int,
+        )
@@ -0,0 +1,32 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+DEFAULT_MOTION_SEARCH_METHOD = "diamond"
+INTRA_PREDICTION_VALUE = 128
+MIN_PIXEL_VALUE = 0
+MAX_PIXEL_VALUE = 255
+
+DEFAULT_BLOCK_CACHE_SIZE = 65536
+BLOCK_HASH_DIGEST_SIZE = 16
+BLOCK_HASH_SEED = 0x4D414953
+
+COEFFICIENT_STORE_MAGIC = b"MAISCOEF"
+COEFFICIENT_STORE_VERSION = 1
+COEFFICIENT_STORE_HEADER_FORMAT = "<8sHIIHH4s"
+COEFFICIENT_STORE_TABLE_DTYPE = "<u2"
+COEFFICIENT_STORE_INDEX_DTYPE = "<u8"
+DEFAULT_COEFFICIENT_DTYPE = "<i2"
+
+SPARSE_POSITION_DTYPE = "u1"
+SPARSE_INDEX_DTYPE = "i8"
@@ -0,0 +1,309 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+from . import constants
+from .block_cache import BlockCache
+from ..quantization.ycbcr_quantization import (
+    dequantize,
+    get_quantization_tensor,
+    quantize,
+)
+from ..transformations.constants import DEFAULT_SEARCH_RANGE
+from ..transformations.image_transformations import (
+    dct_2d,
+    divide_image_to_blocks,
+    get_dct_weights,
+    idct_2d,
+    merge_blocks_to_image,
+)
+from ..transformations.matrix_transformations import (
+    unzigzag_pixel_blocks,
+    zigzag_pixel_blocks,
+)
+from ..transformations.motion_estimation import (
+    estimate_motion,
+    get_motion_compensated_blocks,
+)
+
+
+class EncodedFrame:
+    """
+    A class holding a single coded frame.
+
+    Intra frames are predicted from a flat frame, so their residual is the level
+    shifted frame itself. Inter frames are predicted from the motion compensated
+    previous reconstructed frame.
+    """
+
+    def __init__(
+        self,
+        is_intra: bool,
+        motion_vectors: np.ndarray,
+        skip_mask: np.ndarray,
+        coefficients: np.ndarray,
+    ):
+        self._is_intra = is_intra
+        self._motion_vectors = motion_vectors
+        self._skip_mask = skip_mask
+        self._coefficients = coefficients
+
+    # region Properties
+    @property
+    def is_intra(self) -> bool:
+        """
+        The intra frame property.
+
+        :return:
+            A bool; True if the frame was coded without a reference frame.
+        """
+        return self._is_intra
+
+    @property
+    def motion_vectors(self) -> np.ndarray:
+        """
+        The motion vectors.
+
+        :return:
+            A np.ndarray of shape AxBx2 containing the (dy, dx) motion vector of every
+            block.
+        """
+        return np.copy(self._motion_vectors)
+
+    @property
+    def skip_mask(self) -> np.ndarray:
+        """
+        The skip mask.
+
+        :return:
+            A np.ndarray of shape AxB; True for blocks whose quantized residual is
+            all zeros and which are therefore not coded.
+        """
+        return np.copy(self._skip_mask)
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        """
+        The zigzagged quantized residual coefficients of the coded blocks.
+
+        :return:
+            A np.ndarray of shape Nx3x64, where N is the number of blocks which are
+            not skipped, in raster order.
+        """
+        return np.copy(self._coefficients)
+
+    # endregion
+
+
+def get_skip_bound_mask(
+    residual_blocks: np.ndarray, quantization_tensor: np.ndarray
+) -> np.ndarray:
+    """
+    Finds blocks whose quantized DCT is provably all zeros without doing the DCT.
+
+    Every DCT coefficient is bound by its weight / 4 times the sum of absolute
+    residuals, so a block quantizes to zeros if that bound stays below half of
+    every quantization step.
+
+    :param residual_blocks:
+        A np.ndarray of shape AxBx8x8x3.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 you wish to quantize with.
+
+    :return:
+        A np.ndarray of shape AxB; True for blocks which can be skipped.
+    """
+    max_gain = np.max(
+        get_dct_weights()[..., np.newaxis] / (4 * quantization_tensor), axis=(0, 1)
+    )
+    absolute_sums = np.sum(np.abs(residual_blocks), axis=(2, 3))
+
+    return np.all(absolute_sums * max_gain < 0.5, axis=-1)
+
+
+class InterFrameCoder:
+    """
+    A class for coding a sequence of YCbCr frames with P-frames.
+
+    The first frame is coded as an intra frame, every following one is predicted
+    from the previous reconstructed frame using 8x8 block motion vectors, and only
+    the residual goes through the DCT, quantization and zigzag scanning.
+    """
+
+    def __init__(
+        self,
+        quantization_tensor: np.ndarray = None,
+        method: str = constants.DEFAULT_MOTION_SEARCH_METHOD,
+        search_range: int = DEFAULT_SEARCH_RANGE,
+        n_jobs: int = 1,
+        block_cache: BlockCache = None,
+    ):
+        self._quantization_tensor = (
+            get_quantization_tensor()
+            if quantization_tensor is None
+            else quantization_tensor
+        )
+        self._method = method
+        self._search_range = search_range
+        self._n_jobs = n_jobs
+        self._block_cache = block_cache
+
+        self._reference_frame = None
+
+    # region Properties
+    @property
+    def reference_frame(self) -> np.ndarray or None:
+        """
+        The previous reconstructed frame.
+
+        :return:
+            A np.ndarray of shape HxWx3, or None if no frame was coded yet.
+        """
+        return None if self._reference_frame is None else np.copy(self._reference_frame)
+
+    # endregion
+
+    def reset(self):
+        """
+        Forgets the reference frame, so that the next frame is coded as intra.
+
+        :return:
+            Nothing.
+        """
+        self._reference_frame = None
+
+    def _get_prediction_blocks(self, motion_vectors: np.ndarray) -> np.ndarray:
+        if self._reference_frame is None:
+            return np.full(
+                motion_vectors.shape[:2] + (8, 8, 3),
+                constants.INTRA_PREDICTION_VALUE,
+                dtype=np.float64,
+            )
+
+        return get_motion_compensated_blocks(self._reference_frame, motion_vectors)
+
+    def _reconstruct(
+        self,
+        prediction_blocks: np.ndarray,
+        skip_mask: np.ndarray,
+        quantized_blocks: np.ndarray,
+    ) -> np.ndarray:
+        reconstructed_blocks = np.array(prediction_blocks, dtype=np.float64)
+
+        if len(quantized_blocks) != 0:
+            reconstructed_blocks[~skip_mask] += idct_2d(
+                dequantize(quantized_blocks, self._quantization_tensor)[np.newaxis]
+            )[0]
+
+        self._reference_frame = np.clip(
+            merge_blocks_to_image(reconstructed_blocks),
+            constants.MIN_PIXEL_VALUE,
+            constants.MAX_PIXEL_VALUE,
+        )
+
+        return np.copy(self._reference_frame)
+
+    def encode(self, frame: np.ndarray) -> EncodedFrame:
+        """
+        Encodes a frame and updates the reference frame with its reconstruction.
+
+        :param frame:
+            A np.ndarray of shape HxWx3 containing a YCbCr frame, where H and W are
+            multiples of 8. Every frame of a sequence must have the same shape.
+
+        :return:
+            An EncodedFrame.
+        """
+        current_blocks = divide_image_to_blocks(frame)
+        is_intra = self._reference_frame is None
+
+        if is_intra:
+            motion_vectors = np.zeros(current_blocks.shape[:2] + (2,), dtype=int)
+        else:
+            # Motion is searched on luma only.
+            motion_vectors, _ = estimate_motion(
+                self._reference_frame[..., 0],
+                frame[..., 0],
+                method=self._method,
+                search_range=self._search_range,
+                n_jobs=self._n_jobs,
+            )
+
+        prediction_blocks = self._get_prediction_blocks(motion_vectors)
+        residual_blocks = current_blocks - prediction_blocks
+
+        skip_mask = get_skip_bound_mask(residual_blocks, self._quantization_tensor)
+        quantized_blocks = np.zeros((0, 8, 8, 3), dtype=int)
+        coefficients = np.zeros((0, 3, 64), dtype=int)
+
+        if not np.all(skip_mask):
+            coded_blocks = residual_blocks[~skip_mask][np.newaxis]
+
+            if self._block_cache is None:
+                quantized_blocks = quantize(
+                    dct_2d(coded_blocks)[0], self._quantization_tensor
+                )
+            else:
+                quantized_blocks = self._block_cache.quantize(
+                    coded_blocks, self._quantization_tensor
+                )[0]
+
+            # Blocks which only quantized to zeros are skipped as well.
+            is_zero = np.all(quantized_blocks == 0, axis=(1, 2, 3))
+            skip_mask[~skip_mask] = is_zero
+            quantized_blocks = quantized_blocks[~is_zero]
+
+        if len(quantized_blocks) != 0:
+            coefficients = zigzag_pixel_blocks(quantized_blocks[np.newaxis])[0]
+
+        self._reconstruct(prediction_blocks, skip_mask, quantized_blocks)
+
+        return EncodedFrame(
+            is_intra=is_intra,
+            motion_vectors=motion_vectors,
+            skip_mask=skip_mask,
+            coefficients=coefficients,
+        )
+
+    def decode(self, encoded_frame: EncodedFrame) -> np.ndarray:
+        """
+        Decodes a frame and updates the reference frame with it.
+
+        A decoding InterFrameCoder must be given the frames in the order they were
+        encoded in. Raises a ValueError for a P-frame if there is no reference frame
+        to predict it from, e.g. because the intra frame before it wasn't decoded.
+
+        :param encoded_frame:
+            An EncodedFrame.
+
+        :return:
+            A np.ndarray of shape HxWx3 containing the reconstructed YCbCr frame.
+        """
+        if encoded_frame.is_intra:
+            self.reset()
+        elif self._reference_frame is None:
+            raise ValueError(
+                "Expected an intra frame to be decoded before a P-frame, but there is "
+                "no reference frame"
+            )
+
+        motion_vectors = encoded_frame.motion_vectors
+        coefficients = encoded_frame.coefficients
+
+        return self._reconstruct(
+            self._get_prediction_blocks(motion_vectors),
+            encoded_frame.skip_mask,
+            unzigzag_pixel_blocks(coefficients),
+        )
@@ -0,0 +1,173 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Tuple
+
+import numpy as np
+
+from . import constants
+
+
+class SparseCoefficients:
+    """
+    A class holding zigzagged quantized coefficients in a CSR-like layout.
+
+    Every block component (a row of 64 zigzagged coefficients) is a sparse row:
+    the nonzero values of all rows are stored back to back in a flat array, along
+    with their zigzag positions, and row i owns the entries from offsets[i] to
+    offsets[i + 1].
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        offsets: np.ndarray,
+        positions: np.ndarray,
+        values: np.ndarray,
+    ):
+        n_rows = int(np.prod(shape[:-1]))
+
+        if len(offsets) != n_rows + 1:
+            raise ValueError(
+                f"Expected {n_rows + 1} offsets for shape {shape}, got {len(offsets)}"
+            )
+
+        if len(positions) != len(values) or offsets[-1] != len(values):
+            raise ValueError(
+                f"Expected {offsets[-1]} positions and values, got {len(positions)} "
+                f"and {len(values)}"
+            )
+
+        self._shape = tuple(shape)
+        self._offsets = np.asarray(offsets, dtype=constants.SPARSE_INDEX_DTYPE)
+        self._positions = np.asarray(positions, dtype=constants.SPARSE_POSITION_DTYPE)
+        self._values = np.asarray(values)
+
+    @classmethod
+    def from_dense(cls, zigzagged_blocks: np.ndarray) -> "SparseCoefficients":
+        """
+        Creates SparseCoefficients from dense zigzagged blocks.
+
+        :param zigzagged_blocks:
+            A np.ndarray of shape AxBx3x64, usually the output of encode_image.
+
+        :return:
+            SparseCoefficients holding the nonzero coefficients.
+        """
+        rows = zigzagged_blocks.reshape(-1, zigzagged_blocks.shape[-1])
+        nonzero_mask = rows != 0
+
+        # np.nonzero goes through the rows in order, so the entries come out
+        # grouped by row and sorted by zigzag position.
+        positions = np.nonzero(nonzero_mask)[1]
+        offsets = np.zeros(len(rows) + 1, dtype=constants.SPARSE_INDEX_DTYPE)
+        np.cumsum(np.count_nonzero(nonzero_mask, axis=-1), out=offsets[1:])
+
+        return cls(
+            shape=zigzagged_blocks.shape,
+            offsets=offsets,
+            positions=positions,
+            values=rows[nonzero_mask],
+        )
+
+    # region Properties
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The shape property.
+
+        :return:
+            A tuple of ints representing the shape of the dense coefficients.
+        """
+        return self._shape
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        The offsets property.
+
+        :return:
+            A np.ndarray of shape (R + 1), where R is the number of rows; row i owns
+            the entries from offsets[i] to offsets[i + 1].
+        """
+        return np.copy(self._offsets)
+
+    @property
+    def positions(self) -> np.ndarray:
+        """
+        The positions property.
+
+        :return:
+            A np.ndarray of shape N containing the zigzag position of every nonzero
+            coefficient.
+        """
+        return np.copy(self._positions)
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        The values property.
+
+        :return:
+            A np.ndarray of shape N containing the nonzero coefficients.
+        """
+        return np.copy(self._values)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        The nonzero counts property.
+
+        :return:
+            A np.ndarray of shape AxBx3 containing the number of nonzero
+            coefficients of every block component.
+        """
+        return np.diff(self._offsets).reshape(self._shape[:-1])
+
+    @property
+    def nnz(self) -> int:
+        """
+        The number of nonzero coefficients property.
+
+        :return:
+            An int representing the number of stored coefficients.
+        """
+        return len(self._values)
+
+    @property
+    def density(self) -> float:
+        """
+        The density property.
+
+        :return:
+            A float representing the share of coefficients which are nonzero.
+        """
+        return self.nnz / max(int(np.prod(self._shape)), 1)
+
+    # endregion
+
+    def to_dense(self) -> np.ndarray:
+        """
+        Scatters the nonzero coefficients back into a dense array.
+
+        :return:
+            A np.ndarray of shape AxBx3x64 in the dtype of the values.
+        """
+        rows = np.zeros(
+            (len(self._offsets) - 1, self._shape[-1]), dtype=self._values.dtype
+        )
+        row_indices = np.repeat(np.arange(len(rows)), np.diff(self._offsets))
+        rows[row_indices, self._positions] = self._values
+
+        return rows.reshape(self._shape)
@@ -0,0 +1,47 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+DEFAULT_MAX_VALUE = 255
+DEFAULT_N_GROUPS = 16
+DEFAULT_STRIPE_HEIGHT = 64
+
+# Coefficients are coded as in JPEG: a size category (the bit length of the value)
+# followed by that many amplitude bits, AC sizes being paired with the run of zeros
+# before them into a single symbol.
+N_SIZE_CATEGORIES = 32
+AC_RUN_SHIFT = 5
+MAX_AC_RUN = 15
+N_AC_SYMBOLS = (MAX_AC_RUN + 1) << AC_RUN_SHIFT
+END_OF_BLOCK_SYMBOL = 0
+ZERO_RUN_SYMBOL = MAX_AC_RUN << AC_RUN_SHIFT
+
+RESTART_CODED_MAGIC = b"MAISRST0"
+RESTART_CODED_VERSION = 1
+RESTART_CODED_HEADER_FORMAT = "<8sHIIHHI"
+RESTART_CODED_CODE_LENGTH_DTYPE = "u1"
+RESTART_CODED_INDEX_DTYPE = "<u8"
+
+# rANS uses 32-bit states renormalized 16 bits at a time, so with probabilities
+# scaled to 2^14 every lane emits at most one word per symbol.
+RANS_SCALE_BITS = 14
+RANS_LOWER_BOUND = 1 << 16
+RANS_WORD_BITS = 16
+DEFAULT_RANS_LANES = 32
+
+RANS_CODED_MAGIC = b"MAISRANS"
+RANS_CODED_VERSION = 1
+RANS_CODED_HEADER_FORMAT = "<8sHIIHHH"
+RANS_STREAM_HEADER_FORMAT = "<HQQ"
+RANS_SYMBOL_DTYPE = "<u2"
+RANS_WORD_DTYPE = "<u2"
@@ -0,0 +1,257 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+from . import constants
+from ..parsing.netpbm_parsing import read_netpbm_image
+
+
+def _check_max_value(pixel_data: np.ndarray, max_value: int):
+    # Larger values would land in the bins of another histogram or widen this one.
+    if np.size(pixel_data) > 0 and np.max(pixel_data) > max_value:
+        raise ValueError(
+            f"Expected values of at most max_value={max_value}, got "
+            f"{np.max(pixel_data)}"
+        )
+
+
+def get_histogram(
+    pixel_data: np.ndarray, max_value: int = constants.DEFAULT_MAX_VALUE
+) -> np.ndarray:
+    """
+    Counts the occurrences of every value in an image.
+
+    :param pixel_data:
+        A np.ndarray of shape S (any shape) containing non-negative integers.
+    :param max_value:
+        An int representing the maximum value an element can have; larger values
+        raise a ValueError.
+
+    :return:
+        A np.ndarray of shape (max_value + 1) containing the counts.
+    """
+    _check_max_value(pixel_data, max_value)
+
+    return np.bincount(np.ravel(pixel_data), minlength=max_value + 1)
+
+
+def get_group_histogram(
+    histogram: np.ndarray, n_groups: int = constants.DEFAULT_N_GROUPS
+) -> np.ndarray:
+    """
+    Merges a histogram into n_groups equally wide groups.
+
+    For a 256 bin histogram and 16 groups, a value belongs to the group value >> 4.
+
+    :param histogram:
+        A np.ndarray of shape N containing counts.
+    :param n_groups:
+        An int representing the number of groups.
+
+    :return:
+        A np.ndarray of shape n_groups containing the group counts.
+    """
+    groups = np.arange(len(histogram)) * n_groups // len(histogram)
+
+    return np.bincount(groups, weights=histogram, minlength=n_groups).astype(np.int64)
+
+
+def merge_histograms(histograms: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    Sums histograms, padding shorter ones with zeros.
+
+    :param histograms:
+        An iterable of np.ndarrays of shape N_i containing counts.
+
+    :return:
+        A np.ndarray of shape max(N_i) containing the summed counts.
+    """
+    histograms = list(histograms)
+    merged = np.zeros(max(len(x) for x in histograms), dtype=np.int64)
+
+    for histogram in histograms:
+        merged[: len(histogram)] += histogram
+
+    return merged
+
+
+def get_stripe_histograms(
+    pixel_data: np.ndarray,
+    stripe_height: int = constants.DEFAULT_STRIPE_HEIGHT,
+    max_value: int = constants.DEFAULT_MAX_VALUE,
+) -> np.ndarray:
+    """
+    Gets the histogram of every horizontal stripe of an image.
+
+    :param pixel_data:
+        A np.ndarray of shape HxW or HxWxC containing non-negative integers.
+    :param stripe_height:
+        An int representing the height of a stripe; the last stripe may be lower.
+    :param max_value:
+        An int representing the maximum value an element can have; larger values
+        raise a ValueError, as they would be counted in the next stripe.
+
+    :return:
+        A np.ndarray of shape Sx(max_value + 1), where S = ceil(H / stripe_height).
+    """
+    _check_max_value(pixel_data, max_value)
+
+    n_stripes = -(-pixel_data.shape[0] // stripe_height)
+    stripe_indices = np.arange(pixel_data.shape[0]) // stripe_height
+    n_bins = max_value + 1
+
+    # Offset every stripe into its own range of bins and count them all at once.
+    offsets = stripe_indices.reshape((-1,) + (1,) * (pixel_data.ndim - 1)) * n_bins
+
+    return np.bincount(
+        np.ravel(pixel_data + offsets), minlength=n_stripes * n_bins
+    ).reshape(n_stripes, n_bins)
+
+
+def get_entropy(histogram: np.ndarray) -> float:
+    """
+    Calculates the entropy of a histogram.
+
+    :param histogram:
+        A np.ndarray of shape N containing counts.
+
+    :return:
+        A float representing the entropy in bits per symbol.
+    """
+    probabilities = histogram[histogram > 0] / np.sum(histogram)
+
+    return float(-np.sum(probabilities * np.log2(probabilities)))
+
+
+def get_huffman_code_lengths(histogram: np.ndarray) -> np.ndarray:
+    """
+    Calculates Huffman code lengths for a histogram.
+
+    :param histogram:
+        A np.ndarray of shape N containing counts.
+
+    :return:
+        A np.ndarray of shape N containing the code length of every symbol. Symbols
+        which never occur get a length of 0. A single occurring symbol gets a
+        length of 1.
+    """
+    code_lengths = np.zeros(len(histogram), dtype=np.int64)
+    symbols = np.flatnonzero(histogram)
+
+    if len(symbols) == 1:
+        code_lengths[symbols] = 1
+
+    # Heap entries carry a tie-breaking counter so that lists are never compared.
+    heap = [(histogram[x], i, [x]) for i, x in enumerate(symbols)]
+    heapq.heapify(heap)
+    counter = len(heap)
+
+    while len(heap) > 1:
+        first_count, _, first_symbols = heapq.heappop(heap)
+        second_count, _, second_symbols = heapq.heappop(heap)
+
+        merged_symbols = first_symbols + second_symbols
+        code_lengths[merged_symbols] += 1
+
+        heapq.heappush(heap, (first_count + second_count, counter, merged_symbols))
+        counter += 1
+
+    return code_lengths
+
+
+def get_canonical_huffman_codes(code_lengths: np.ndarray) -> List[str]:
+    """
+    Assigns canonical Huffman codes to code lengths.
+
+    :param code_lengths:
+        A np.ndarray of shape N containing the code length of every symbol.
+
+    :return:
+        A list of N strings of 0s and 1s; symbols with a code length of 0 get an
+        empty string.
+    """
+    codes = [""] * len(code_lengths)
+    code, previous_length = 0, 0
+
+    for symbol in np.lexsort((np.arange(len(code_lengths)), code_lengths)):
+        length = int(code_lengths[symbol])
+
+        if length == 0:
+            continue
+
+        code <<= length - previous_length
+        codes[symbol] = format(code, f"0{length}b")
+        code, previous_length = code + 1, length
+
+    return codes
+
+
+def get_file_histogram(image_path: Path or str, max_value: int = None) -> np.ndarray:
+    """
+    Gets the histogram of a PGM5 or PPM6 image.
+
+    :param image_path:
+        A Path or string representing the path to the image.
+    :param max_value:
+        (Optional) An int representing the maximum value an element can have.
+        Defaults to None (the maximum value from the image header).
+
+    :return:
+        A np.ndarray of shape (max_value + 1) containing the counts.
+    """
+    image = read_netpbm_image(image_path)
+
+    if max_value is None:
+        max_value = image.max_value
+
+    return get_histogram(image.data, max_value=max_value)
+
+
+def get_corpus_histogram(
+    image_paths: Iterable[Path or str],
+    max_value: int = None,
+    n_jobs: int = 1,
+) -> np.ndarray:
+    """
+    Gets the merged histogram of many PGM5 or PPM6 images.
+
+    :param image_paths:
+        An iterable of Paths or strings representing the paths to the images.
+    :param max_value:
+        (Optional) An int representing the maximum value an element can have.
+        Defaults to None (the maximum value from the header of every image).
+    :param n_jobs:
+        An int representing the number of processes files are read and counted in.
+        Defaults to 1 (no additional processes).
+
+    :return:
+        A np.ndarray of shape (max_value + 1) containing the summed counts, where
+        max_value is the largest one of the images if not given.
+    """
+    image_paths = list(image_paths)
+    max_values = [max_value] * len(image_paths)
+
+    if n_jobs <= 1:
+        return merge_histograms(map(get_file_histogram, image_paths, max_values))
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return merge_histograms(
+            executor.map(get_file_histogram, image_paths, max_values)
+        )
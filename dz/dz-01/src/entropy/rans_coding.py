@@ -0,0 +1,477 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+from . import constants
+
+# Symbols are the size categories and run and size pairs of restart_coding, except
+# that every block ends with an end of block symbol. Every component has a DC and
+# an AC stream with its own static frequency table, so the table of every symbol is
+# known before decoding and all lanes of a stream can be decoded at once. Amplitude
+# bits of all streams are stored raw after the rANS streams.
+
+
+def get_rans_frequencies(
+    histogram: np.ndarray, scale_bits: int = constants.RANS_SCALE_BITS
+) -> np.ndarray:
+    """
+    Scales a histogram to frequencies summing to 2^scale_bits.
+
+    :param histogram:
+        A np.ndarray of shape N containing symbol counts.
+    :param scale_bits:
+        (Optional) An int representing the precision of the frequencies. Defaults
+        to 14.
+
+    :return:
+        A np.ndarray of shape N containing the frequencies; every symbol which
+        occurs gets at least 1, every other one 0. All zeros if nothing occurs.
+    """
+    histogram = np.asarray(histogram, dtype=np.int64)
+    total = np.sum(histogram)
+
+    if total == 0:
+        return np.zeros(len(histogram), dtype=np.int64)
+
+    if np.count_nonzero(histogram) > 1 << scale_bits:
+        raise ValueError(
+            f"Expected at most {1 << scale_bits} symbols, got "
+            f"{np.count_nonzero(histogram)}"
+        )
+
+    frequencies = np.where(
+        histogram > 0,
+        np.maximum(np.rint(histogram * (1 << scale_bits) / total), 1),
+        0,
+    ).astype(np.int64)
+
+    # Rounding and the minimum of 1 are corrected on the most frequent symbols.
+    difference = (1 << scale_bits) - np.sum(frequencies)
+
+    while difference != 0:
+        largest = np.argmax(frequencies)
+        change = max(difference, 1 - frequencies[largest])
+        frequencies[largest] += change
+        difference -= change
+
+    return frequencies
+
+
+def rans_encode(
+    symbols: np.ndarray,
+    frequencies: np.ndarray,
+    n_lanes: int = constants.DEFAULT_RANS_LANES,
+    scale_bits: int = constants.RANS_SCALE_BITS,
+) -> np.ndarray:
+    """
+    Codes symbols with interleaved rANS.
+
+    Symbol i goes to lane i % n_lanes, and all lanes are updated together, so the
+    work is a loop over ceil(N / n_lanes) vectorized steps.
+
+    :param symbols:
+        A np.ndarray of shape N containing symbols, all with nonzero frequencies.
+    :param frequencies:
+        A np.ndarray of symbol frequencies summing to 2^scale_bits, usually from
+        get_rans_frequencies.
+    :param n_lanes:
+        (Optional) An int representing the number of interleaved states. Defaults
+        to 32.
+    :param scale_bits:
+        (Optional) An int representing the precision of the frequencies. Defaults
+        to 14.
+
+    :return:
+        A np.ndarray of uint16 words: the final state of every lane (low word
+        first) followed by the renormalization words in the order rans_decode
+        reads them.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.uint64)
+    cumulative = np.concatenate(([0], np.cumsum(frequencies)[:-1])).astype(np.uint64)
+    upper_bounds = (
+        np.uint64(constants.RANS_LOWER_BOUND >> scale_bits << constants.RANS_WORD_BITS)
+        * frequencies
+    )
+    symbols = np.asarray(symbols, dtype=np.intp)
+
+    word_bits = np.uint64(constants.RANS_WORD_BITS)
+    word_mask = np.uint64((1 << constants.RANS_WORD_BITS) - 1)
+    shift = np.uint64(scale_bits)
+
+    states = np.full(n_lanes, constants.RANS_LOWER_BOUND, dtype=np.uint64)
+    words = list()
+
+    # The decoder reads words in the opposite order they are written, so steps are
+    # encoded last to first and their words are put back in order at the end.
+    for start in reversed(range(0, len(symbols), n_lanes)):
+        step_symbols = symbols[start : start + n_lanes]
+        lane_states = states[: len(step_symbols)]
+
+        emit = lane_states >= upper_bounds[step_symbols]
+        words.append(lane_states[emit] & word_mask)
+        lane_states[emit] >>= word_bits
+
+        step_frequencies = frequencies[step_symbols]
+        lane_states[:] = (
+            (lane_states // step_frequencies << shift)
+            + lane_states % step_frequencies
+            + cumulative[step_symbols]
+        )
+
+    return np.concatenate(
+        [np.stack((states & word_mask, states >> word_bits), axis=-1).ravel()]
+        + words[::-1]
+    ).astype(np.uint16)
+
+
+def rans_decode(
+    words: np.ndarray,
+    frequencies: np.ndarray,
+    n_symbols: int,
+    n_lanes: int = constants.DEFAULT_RANS_LANES,
+    scale_bits: int = constants.RANS_SCALE_BITS,
+) -> np.ndarray:
+    """
+    Decodes symbols coded with rans_encode.
+
+    :param words:
+        A np.ndarray of uint16 words, the output of rans_encode.
+    :param frequencies:
+        A np.ndarray of the symbol frequencies the symbols were coded with.
+    :param n_symbols:
+        An int representing the number of coded symbols.
+    :param n_lanes:
+        (Optional) An int representing the number of interleaved states. Defaults
+        to 32.
+    :param scale_bits:
+        (Optional) An int representing the precision of the frequencies. Defaults
+        to 14.
+
+    :return:
+        A np.ndarray of shape (n_symbols) containing the symbols.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.uint64)
+    cumulative = np.concatenate(([0], np.cumsum(frequencies)[:-1])).astype(np.uint64)
+    slot_symbols = np.repeat(np.arange(len(frequencies)), frequencies.astype(np.intp))
+
+    words = np.asarray(words, dtype=np.uint64)
+    word_bits = np.uint64(constants.RANS_WORD_BITS)
+    slot_mask = np.uint64((1 << scale_bits) - 1)
+    shift = np.uint64(scale_bits)
+
+    states = words[: 2 * n_lanes : 2] | (words[1 : 2 * n_lanes : 2] << word_bits)
+    position = 2 * n_lanes
+    symbols = np.empty(n_symbols, dtype=np.intp)
+
+    for start in range(0, n_symbols, n_lanes):
+        lane_states = states[: min(n_lanes, n_symbols - start)]
+
+        slots = lane_states & slot_mask
+        step_symbols = slot_symbols[slots.astype(np.intp)]
+        symbols[start : start + len(step_symbols)] = step_symbols
+
+        lane_states[:] = (
+            frequencies[step_symbols] * (lane_states >> shift)
+            + slots
+            - cumulative[step_symbols]
+        )
+
+        refill = lane_states < constants.RANS_LOWER_BOUND
+        n_refills = np.count_nonzero(refill)
+        lane_states[refill] = (lane_states[refill] << word_bits) | words[
+            position : position + n_refills
+        ]
+        position += n_refills
+
+    return symbols
+
+
+def _get_sizes(values: np.ndarray) -> np.ndarray:
+    # The bit length of every absolute value, 0 for 0.
+    return np.frexp(np.abs(values).astype(np.float64))[1].astype(np.int64)
+
+
+def _pack_amplitudes(values: np.ndarray, sizes: np.ndarray) -> bytes:
+    # Negative values are stored as value + 2^size - 1, so their top bit is 0.
+    amplitudes = np.where(values > 0, values, values + (1 << sizes) - 1)
+
+    owners = np.repeat(np.arange(len(values)), sizes)
+    bit_indices = np.arange(len(owners)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    return np.packbits(
+        (amplitudes[owners] >> (sizes[owners] - 1 - bit_indices)) & 1
+    ).tobytes()
+
+
+def _unpack_amplitudes(content: bytes, sizes: np.ndarray) -> np.ndarray:
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    bit_indices = np.arange(len(owners)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    bits = np.unpackbits(np.frombuffer(content, dtype=np.uint8))[: len(owners)]
+
+    amplitudes = np.zeros(len(sizes), dtype=np.int64)
+    np.add.at(
+        amplitudes, owners, bits.astype(np.int64) << (sizes[owners] - 1 - bit_indices)
+    )
+
+    is_negative = (sizes > 0) & (amplitudes >> np.maximum(sizes - 1, 0) == 0)
+
+    return np.where(is_negative, amplitudes - (1 << sizes) + 1, amplitudes)
+
+
+def _get_ac_symbols(ac_coefficients: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # ac_coefficients is NxK; returns the symbols and the nonzero values in order.
+    block_indices, positions = np.nonzero(ac_coefficients)
+    values = ac_coefficients[block_indices, positions]
+
+    is_first = np.ones(len(positions), dtype=bool)
+    is_first[1:] = block_indices[1:] != block_indices[:-1]
+    previous = np.where(is_first, -1, np.roll(positions, 1))
+    runs = positions - previous - 1
+
+    # Runs of 16 or more zeros are split off as zero run symbols in front.
+    n_zero_runs = runs // (constants.MAX_AC_RUN + 1)
+    coded_symbols = (
+        (runs % (constants.MAX_AC_RUN + 1)) << constants.AC_RUN_SHIFT
+    ) | _get_sizes(values)
+
+    owners = np.repeat(np.arange(len(values)), n_zero_runs + 1)
+    is_coded = np.ones(len(owners), dtype=bool)
+    is_coded[: len(owners) - 1] = owners[1:] != owners[:-1]
+    value_symbols = np.where(is_coded, coded_symbols[owners], constants.ZERO_RUN_SYMBOL)
+
+    # Every block ends with an end of block symbol after its own value symbols.
+    items_per_block = np.bincount(block_indices[owners], minlength=len(ac_coefficients))
+    end_positions = np.cumsum(items_per_block + 1) - 1
+
+    symbols = np.empty(len(value_symbols) + len(ac_coefficients), dtype=np.int64)
+    is_value = np.ones(len(symbols), dtype=bool)
+    is_value[end_positions] = False
+    symbols[is_value] = value_symbols
+    symbols[end_positions] = constants.END_OF_BLOCK_SYMBOL
+
+    return symbols, values
+
+
+def _get_ac_coefficients(
+    symbols: np.ndarray, values: np.ndarray, n_blocks: int, n_coefficients: int
+) -> np.ndarray:
+    is_end = symbols == constants.END_OF_BLOCK_SYMBOL
+    is_zero_run = symbols == constants.ZERO_RUN_SYMBOL
+    is_value = ~(is_end | is_zero_run)
+
+    advances = np.where(
+        is_value,
+        (symbols >> constants.AC_RUN_SHIFT) + 1,
+        np.where(is_zero_run, constants.MAX_AC_RUN + 1, 0),
+    )
+    offsets = np.cumsum(advances)
+    block_indices = np.cumsum(is_end) - is_end
+    block_starts = np.concatenate(([0], offsets[is_end][:-1]))
+
+    ac_coefficients = np.zeros((n_blocks, n_coefficients - 1), dtype=np.int64)
+    ac_coefficients[
+        block_indices[is_value],
+        offsets[is_value] - block_starts[block_indices[is_value]] - 1,
+    ] = values
+
+    return ac_coefficients
+
+
+def _pack_stream(symbols: np.ndarray, n_symbols: int, n_lanes: int) -> bytes:
+    frequencies = get_rans_frequencies(np.bincount(symbols, minlength=n_symbols))
+    used_symbols = np.flatnonzero(frequencies)
+    words = rans_encode(symbols, frequencies, n_lanes=n_lanes)
+
+    return b"".join(
+        (
+            struct.pack(
+                constants.RANS_STREAM_HEADER_FORMAT,
+                len(used_symbols),
+                len(symbols),
+                len(words),
+            ),
+            used_symbols.astype(constants.RANS_SYMBOL_DTYPE).tobytes(),
+            frequencies[used_symbols].astype(constants.RANS_SYMBOL_DTYPE).tobytes(),
+            words.astype(constants.RANS_WORD_DTYPE).tobytes(),
+        )
+    )
+
+
+def _unpack_stream(
+    content: bytes, position: int, n_symbols: int, n_lanes: int
+) -> Tuple[np.ndarray, int]:
+    header_size = struct.calcsize(constants.RANS_STREAM_HEADER_FORMAT)
+    n_used_symbols, n_stream_symbols, n_words = struct.unpack(
+        constants.RANS_STREAM_HEADER_FORMAT, content[position : position + header_size]
+    )
+    position += header_size
+
+    used_symbols, used_frequencies = (
+        np.frombuffer(
+            content,
+            dtype=constants.RANS_SYMBOL_DTYPE,
+            count=n_used_symbols,
+            offset=position + i * 2 * n_used_symbols,
+        )
+        for i in range(2)
+    )
+    position += 4 * n_used_symbols
+
+    words = np.frombuffer(
+        content, dtype=constants.RANS_WORD_DTYPE, count=n_words, offset=position
+    )
+    position += 2 * n_words
+
+    frequencies = np.zeros(n_symbols, dtype=np.int64)
+    frequencies[used_symbols] = used_frequencies
+
+    return rans_decode(words, frequencies, n_stream_symbols, n_lanes=n_lanes), position
+
+
+def encode_rans(
+    zigzagged_blocks: np.ndarray, n_lanes: int = constants.DEFAULT_RANS_LANES
+) -> bytes:
+    """
+    Codes quantized coefficients with interleaved rANS.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBxCxK containing integer coefficients, usually the
+        output of zigzag_pixel_blocks.
+    :param n_lanes:
+        (Optional) An int representing the number of interleaved rANS states.
+        Defaults to 32.
+
+    :return:
+        A bytes object: the header (magic, version, A, B, C, K, lanes), a DC and an
+        AC stream per component (used symbols, their frequencies and the rANS
+        words) and the amplitude bits.
+    """
+    if not 1 <= n_lanes < 1 << 16:
+        raise ValueError(f"Expected the number of lanes in [1, 65535], got {n_lanes}")
+
+    n_block_rows, n_block_columns, n_components, n_coefficients = zigzagged_blocks.shape
+    flat_blocks = np.asarray(zigzagged_blocks, dtype=np.int64).reshape(
+        -1, n_components, n_coefficients
+    )
+
+    pieces = [
+        struct.pack(
+            constants.RANS_CODED_HEADER_FORMAT,
+            constants.RANS_CODED_MAGIC,
+            constants.RANS_CODED_VERSION,
+            n_block_rows,
+            n_block_columns,
+            n_components,
+            n_coefficients,
+            n_lanes,
+        )
+    ]
+    amplitude_values: List[np.ndarray] = list()
+
+    for component in range(n_components):
+        dc_differences = np.diff(np.concatenate(([0], flat_blocks[:, component, 0])))
+        ac_symbols, ac_values = _get_ac_symbols(flat_blocks[:, component, 1:])
+
+        pieces.append(
+            _pack_stream(
+                _get_sizes(dc_differences), constants.N_SIZE_CATEGORIES, n_lanes
+            )
+        )
+        pieces.append(_pack_stream(ac_symbols, constants.N_AC_SYMBOLS, n_lanes))
+        amplitude_values.extend((dc_differences, ac_values))
+
+    amplitude_values = np.concatenate(amplitude_values)
+    pieces.append(_pack_amplitudes(amplitude_values, _get_sizes(amplitude_values)))
+
+    return b"".join(pieces)
+
+
+def decode_rans(content: bytes, dtype=int) -> np.ndarray:
+    """
+    Decodes coefficients coded with encode_rans.
+
+    :param content:
+        A bytes object, the output of encode_rans.
+    :param dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
+
+    :return:
+        A np.ndarray of shape AxBxCxK containing the coefficients.
+    """
+    position = struct.calcsize(constants.RANS_CODED_HEADER_FORMAT)
+    (
+        magic,
+        version,
+        n_block_rows,
+        n_block_columns,
+        n_components,
+        n_coefficients,
+        n_lanes,
+    ) = struct.unpack(constants.RANS_CODED_HEADER_FORMAT, content[:position])
+
+    if magic != constants.RANS_CODED_MAGIC:
+        raise ValueError(f"Expected magic {constants.RANS_CODED_MAGIC}, got {magic}")
+
+    if version != constants.RANS_CODED_VERSION:
+        raise ValueError(
+            f"Expected version {constants.RANS_CODED_VERSION}, got {version}"
+        )
+
+    n_blocks = n_block_rows * n_block_columns
+    streams = list()
+
+    for _ in range(n_components):
+        for n_symbols in (constants.N_SIZE_CATEGORIES, constants.N_AC_SYMBOLS):
+            symbols, position = _unpack_stream(content, position, n_symbols, n_lanes)
+            streams.append(symbols)
+
+    # The amplitude sizes follow from the symbols: DC symbols are sizes and AC value
+    # symbols carry theirs in the low bits.
+    size_mask = (1 << constants.AC_RUN_SHIFT) - 1
+    amplitude_sizes = list()
+
+    for dc_symbols, ac_symbols in zip(streams[::2], streams[1::2]):
+        is_value = (ac_symbols != constants.END_OF_BLOCK_SYMBOL) & (
+            ac_symbols != constants.ZERO_RUN_SYMBOL
+        )
+        amplitude_sizes.extend((dc_symbols, ac_symbols[is_value] & size_mask))
+
+    amplitudes = _unpack_amplitudes(
+        content[position:], np.concatenate(amplitude_sizes).astype(np.int64)
+    )
+
+    flat_blocks = np.empty((n_blocks, n_components, n_coefficients), dtype=dtype)
+    amplitude_start = 0
+
+    for component, (ac_symbols, ac_sizes) in enumerate(
+        zip(streams[1::2], amplitude_sizes[1::2])
+    ):
+        dc_differences = amplitudes[amplitude_start : amplitude_start + n_blocks]
+        amplitude_start += n_blocks
+        ac_values = amplitudes[amplitude_start : amplitude_start + len(ac_sizes)]
+        amplitude_start += len(ac_sizes)
+
+        flat_blocks[:, component, 0] = np.cumsum(dc_differences)
+        flat_blocks[:, component, 1:] = _get_ac_coefficients(
+            ac_symbols, ac_values, n_blocks, n_coefficients
+        )
+
+    return flat_blocks.reshape(
+        n_block_rows, n_block_columns, n_components, n_coefficients
+    )
@@ -0,0 +1,541 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from . import constants
+from .image_statistics import get_canonical_huffman_codes, get_huffman_code_lengths
+
+# Blocks are coded in raster order, every segment of restart_interval blocks on its
+# own: the DC prediction starts from 0 and the segment is padded with 1s to a whole
+# byte, so any segment can be found through the offset index and decoded without
+# the others. All segments share one DC and one AC Huffman table per component.
+
+
+def get_segment_starts(n_blocks: int, restart_interval: int) -> np.ndarray:
+    """
+    Gets the index of the first block of every segment.
+
+    :param n_blocks:
+        An int representing the number of blocks.
+    :param restart_interval:
+        An int representing the number of blocks in a segment; the last segment may
+        have fewer.
+
+    :return:
+        A np.ndarray of shape (S + 1) containing the first block of every one of S
+        segments, followed by n_blocks.
+    """
+    if restart_interval < 1:
+        raise ValueError(
+            f"Expected restart interval to be at least 1, got {restart_interval}"
+        )
+
+    return np.append(np.arange(0, n_blocks, restart_interval), n_blocks)
+
+
+def _iterate_symbols(
+    segment_blocks: np.ndarray,
+) -> Iterator[Tuple[int, bool, int, int]]:
+    # Yields (component, is_dc, symbol, value) for every coded symbol in order.
+    predictions = [0] * segment_blocks.shape[1]
+
+    for block in segment_blocks.tolist():
+        for component, coefficients in enumerate(block):
+            difference = coefficients[0] - predictions[component]
+            predictions[component] = coefficients[0]
+
+            yield component, True, abs(difference).bit_length(), difference
+
+            last = len(coefficients) - 1
+
+            while last > 0 and coefficients[last] == 0:
+                last -= 1
+
+            run = 0
+
+            for coefficient in coefficients[1 : last + 1]:
+                if coefficient == 0:
+                    run += 1
+
+                    continue
+
+                while run > constants.MAX_AC_RUN:
+                    yield component, False, constants.ZERO_RUN_SYMBOL, 0
+                    run -= constants.MAX_AC_RUN + 1
+
+                yield component, False, (run << constants.AC_RUN_SHIFT) | abs(
+                    coefficient
+                ).bit_length(), coefficient
+                run = 0
+
+            if last < len(coefficients) - 1:
+                yield component, False, constants.END_OF_BLOCK_SYMBOL, 0
+
+
+def _count_segment_symbols(segment_blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    dc_histograms = np.zeros(
+        (segment_blocks.shape[1], constants.N_SIZE_CATEGORIES), dtype=np.int64
+    )
+    ac_histograms = np.zeros(
+        (segment_blocks.shape[1], constants.N_AC_SYMBOLS), dtype=np.int64
+    )
+
+    for component, is_dc, symbol, _ in _iterate_symbols(segment_blocks):
+        (dc_histograms if is_dc else ac_histograms)[component, symbol] += 1
+
+    return dc_histograms, ac_histograms
+
+
+def _get_amplitude_bits(value: int) -> str:
+    size = abs(value).bit_length()
+
+    if size == 0:
+        return ""
+
+    # Negative values are stored as value + 2^size - 1, so their top bit is 0.
+    return format(value if value > 0 else value + (1 << size) - 1, f"0{size}b")
+
+
+def _encode_segment(
+    segment_blocks: np.ndarray, tables: Tuple[List[List[str]], List[List[str]]]
+) -> bytes:
+    dc_codes, ac_codes = tables
+    pieces = list()
+
+    for component, is_dc, symbol, value in _iterate_symbols(segment_blocks):
+        pieces.append((dc_codes if is_dc else ac_codes)[component][symbol])
+        pieces.append(_get_amplitude_bits(value))
+
+    bits = "".join(pieces)
+    bits += "1" * (-len(bits) % 8)
+
+    return np.packbits(
+        np.frombuffer(bits.encode("ascii"), dtype=np.uint8) - ord("0")
+    ).tobytes()
+
+
+def _get_decoding_table(code_lengths: np.ndarray) -> Tuple[Dict[str, int], List[int]]:
+    codes = get_canonical_huffman_codes(code_lengths)
+
+    return (
+        {code: symbol for symbol, code in enumerate(codes) if len(code) != 0},
+        sorted({len(code) for code in codes if len(code) != 0}),
+    )
+
+
+def _read_symbol(
+    bits: str, position: int, table: Tuple[Dict[str, int], List[int]]
+) -> Tuple[int, int]:
+    symbols, lengths = table
+
+    for length in lengths:
+        symbol = symbols.get(bits[position : position + length])
+
+        if symbol is not None:
+            return symbol, position + length
+
+    raise ValueError(f"Invalid code at bit {position}")
+
+
+def _read_amplitude(bits: str, position: int, size: int) -> Tuple[int, int]:
+    if size == 0:
+        return 0, position
+
+    value = int(bits[position : position + size], 2)
+
+    if value >> (size - 1) == 0:
+        value -= (1 << size) - 1
+
+    return value, position + size
+
+
+def _decode_segment(
+    segment: bytes,
+    n_blocks: int,
+    tables: Tuple[List[tuple], List[tuple]],
+    n_coefficients: int,
+) -> np.ndarray:
+    dc_tables, ac_tables = tables
+    bits = (
+        (np.unpackbits(np.frombuffer(segment, dtype=np.uint8)) + ord("0"))
+        .tobytes()
+        .decode("ascii")
+    )
+
+    segment_blocks = np.zeros(
+        (n_blocks, len(dc_tables), n_coefficients), dtype=np.int64
+    )
+    predictions = [0] * len(dc_tables)
+    position = 0
+
+    for block in segment_blocks:
+        for component, coefficients in enumerate(block):
+            size, position = _read_symbol(bits, position, dc_tables[component])
+            difference, position = _read_amplitude(bits, position, size)
+            predictions[component] += difference
+            coefficients[0] = predictions[component]
+
+            k = 1
+
+            while k < n_coefficients:
+                symbol, position = _read_symbol(bits, position, ac_tables[component])
+
+                if symbol == constants.END_OF_BLOCK_SYMBOL:
+                    break
+
+                if symbol == constants.ZERO_RUN_SYMBOL:
+                    k += constants.MAX_AC_RUN + 1
+
+                    continue
+
+                k += symbol >> constants.AC_RUN_SHIFT
+                coefficients[k], position = _read_amplitude(
+                    bits, position, symbol & ((1 << constants.AC_RUN_SHIFT) - 1)
+                )
+                k += 1
+
+    return segment_blocks
+
+
+def _map(function, n_jobs: int, *iterables) -> list:
+    if n_jobs <= 1:
+        return list(map(function, *iterables))
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(function, *iterables))
+
+
+class RestartCodedImage:
+    """
+    A class holding Huffman coded coefficients split into restart segments.
+
+    Segments are stored back to back; an index of their offsets lets every segment
+    be decoded on its own, so encoding and decoding can be spread over processes.
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int, int, int],
+        restart_interval: int,
+        dc_code_lengths: np.ndarray,
+        ac_code_lengths: np.ndarray,
+        offsets: np.ndarray,
+        data: bytes,
+    ):
+        self._shape = tuple(int(x) for x in shape)
+        self._restart_interval = int(restart_interval)
+        self._dc_code_lengths = np.array(
+            dc_code_lengths, dtype=constants.RESTART_CODED_CODE_LENGTH_DTYPE
+        )
+        self._ac_code_lengths = np.array(
+            ac_code_lengths, dtype=constants.RESTART_CODED_CODE_LENGTH_DTYPE
+        )
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._data = bytes(data)
+
+    # region Properties
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        """
+        The shape property.
+
+        :return:
+            A tuple of 4 ints: the shape AxBxCxK of the coded coefficients.
+        """
+        return self._shape
+
+    @property
+    def restart_interval(self) -> int:
+        """
+        The restart interval property.
+
+        :return:
+            An int representing the number of blocks in a segment.
+        """
+        return self._restart_interval
+
+    @property
+    def n_segments(self) -> int:
+        """
+        The number of segments property.
+
+        :return:
+            An int representing the number of segments.
+        """
+        return len(self._offsets) - 1
+
+    @property
+    def dc_code_lengths(self) -> np.ndarray:
+        """
+        The DC code lengths property.
+
+        :return:
+            A np.ndarray of shape Cx32 containing the Huffman code length of every
+            DC size category of every component.
+        """
+        return np.copy(self._dc_code_lengths)
+
+    @property
+    def ac_code_lengths(self) -> np.ndarray:
+        """
+        The AC code lengths property.
+
+        :return:
+            A np.ndarray of shape Cx512 containing the Huffman code length of every
+            run and size symbol of every component.
+        """
+        return np.copy(self._ac_code_lengths)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        The offsets property.
+
+        :return:
+            A np.ndarray of shape (S + 1) containing the byte offset of every
+            segment in the data, followed by the length of the data.
+        """
+        return np.copy(self._offsets)
+
+    @property
+    def data(self) -> bytes:
+        """
+        The data property.
+
+        :return:
+            A bytes object containing all segments back to back.
+        """
+        return self._data
+
+    # endregion
+
+    def get_segment(self, index: int) -> bytes:
+        """
+        Gets the coded bytes of a single segment.
+
+        :param index:
+            An int representing the index of the segment.
+
+        :return:
+            A bytes object containing the segment.
+        """
+        return self._data[self._offsets[index] : self._offsets[index + 1]]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the coded image.
+
+        The layout is the header (magic, version, A, B, C, K, restart interval), the
+        DC and AC code lengths, S + 1 segment offsets and the segments.
+
+        :return:
+            A bytes object which from_bytes reads back.
+        """
+        n_block_rows, n_block_columns, n_components, n_coefficients = self._shape
+
+        return b"".join(
+            (
+                struct.pack(
+                    constants.RESTART_CODED_HEADER_FORMAT,
+                    constants.RESTART_CODED_MAGIC,
+                    constants.RESTART_CODED_VERSION,
+                    n_block_rows,
+                    n_block_columns,
+                    n_components,
+                    n_coefficients,
+                    self._restart_interval,
+                ),
+                self._dc_code_lengths.tobytes(),
+                self._ac_code_lengths.tobytes(),
+                self._offsets.astype(constants.RESTART_CODED_INDEX_DTYPE).tobytes(),
+                self._data,
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "RestartCodedImage":
+        """
+        Reads a coded image serialized with to_bytes.
+
+        :param content:
+            A bytes object.
+
+        :return:
+            A RestartCodedImage.
+        """
+        position = struct.calcsize(constants.RESTART_CODED_HEADER_FORMAT)
+        (
+            magic,
+            version,
+            n_block_rows,
+            n_block_columns,
+            n_components,
+            n_coefficients,
+            restart_interval,
+        ) = struct.unpack(constants.RESTART_CODED_HEADER_FORMAT, content[:position])
+
+        if magic != constants.RESTART_CODED_MAGIC:
+            raise ValueError(
+                f"Expected magic {constants.RESTART_CODED_MAGIC}, got {magic}"
+            )
+
+        if version != constants.RESTART_CODED_VERSION:
+            raise ValueError(
+                f"Expected version {constants.RESTART_CODED_VERSION}, got {version}"
+            )
+
+        code_lengths = list()
+
+        for n_symbols in (constants.N_SIZE_CATEGORIES, constants.N_AC_SYMBOLS):
+            code_lengths.append(
+                np.frombuffer(
+                    content,
+                    dtype=constants.RESTART_CODED_CODE_LENGTH_DTYPE,
+                    count=n_components * n_symbols,
+                    offset=position,
+                ).reshape(n_components, n_symbols)
+            )
+            position += n_components * n_symbols
+
+        n_segments = len(
+            get_segment_starts(n_block_rows * n_block_columns, restart_interval)
+        )
+        offsets = np.frombuffer(
+            content,
+            dtype=constants.RESTART_CODED_INDEX_DTYPE,
+            count=n_segments,
+            offset=position,
+        )
+        position += offsets.nbytes
+
+        return cls(
+            shape=(n_block_rows, n_block_columns, n_components, n_coefficients),
+            restart_interval=restart_interval,
+            dc_code_lengths=code_lengths[0],
+            ac_code_lengths=code_lengths[1],
+            offsets=offsets,
+            data=content[position:],
+        )
+
+
+def encode_with_restarts(
+    zigzagged_blocks: np.ndarray, restart_interval: int = None, n_jobs: int = 1
+) -> RestartCodedImage:
+    """
+    Huffman codes quantized coefficients in independent restart segments.
+
+    Symbols are counted per segment, merged into one set of Huffman tables and
+    every segment is then coded with them; both passes run on a pool of n_jobs
+    processes.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBxCx64 containing integer coefficients, usually the
+        output of zigzag_pixel_blocks.
+    :param restart_interval:
+        (Optional) An int representing the number of blocks in a segment. Defaults
+        to None (a row of B blocks).
+    :param n_jobs:
+        An int representing the number of processes segments are coded in.
+        Defaults to 1 (no additional processes).
+
+    :return:
+        A RestartCodedImage.
+    """
+    if restart_interval is None:
+        restart_interval = max(zigzagged_blocks.shape[1], 1)
+
+    flat_blocks = np.asarray(zigzagged_blocks).reshape(
+        (-1,) + zigzagged_blocks.shape[2:]
+    )
+    starts = get_segment_starts(len(flat_blocks), restart_interval)
+    segments = [flat_blocks[x:y] for x, y in zip(starts[:-1], starts[1:])]
+
+    dc_histograms = np.zeros(
+        (zigzagged_blocks.shape[2], constants.N_SIZE_CATEGORIES), dtype=np.int64
+    )
+    ac_histograms = np.zeros(
+        (zigzagged_blocks.shape[2], constants.N_AC_SYMBOLS), dtype=np.int64
+    )
+
+    for segment_dc_histograms, segment_ac_histograms in _map(
+        _count_segment_symbols, n_jobs, segments
+    ):
+        dc_histograms += segment_dc_histograms
+        ac_histograms += segment_ac_histograms
+
+    dc_code_lengths = np.array([get_huffman_code_lengths(x) for x in dc_histograms])
+    ac_code_lengths = np.array([get_huffman_code_lengths(x) for x in ac_histograms])
+    tables = (
+        [get_canonical_huffman_codes(x) for x in dc_code_lengths],
+        [get_canonical_huffman_codes(x) for x in ac_code_lengths],
+    )
+
+    coded_segments = _map(_encode_segment, n_jobs, segments, repeat(tables))
+
+    return RestartCodedImage(
+        shape=zigzagged_blocks.shape,
+        restart_interval=restart_interval,
+        dc_code_lengths=dc_code_lengths,
+        ac_code_lengths=ac_code_lengths,
+        offsets=np.cumsum([0] + [len(x) for x in coded_segments]),
+        data=b"".join(coded_segments),
+    )
+
+
+def decode_with_restarts(
+    coded_image: RestartCodedImage, n_jobs: int = 1, dtype=int
+) -> np.ndarray:
+    """
+    Decodes coefficients coded with encode_with_restarts.
+
+    :param coded_image:
+        A RestartCodedImage.
+    :param n_jobs:
+        An int representing the number of processes segments are decoded in.
+        Defaults to 1 (no additional processes).
+    :param dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
+
+    :return:
+        A np.ndarray of shape AxBxCx64 containing the coefficients.
+    """
+    n_block_rows, n_block_columns, n_components, n_coefficients = coded_image.shape
+    starts = get_segment_starts(
+        n_block_rows * n_block_columns, coded_image.restart_interval
+    )
+    tables = tuple(
+        [_get_decoding_table(x) for x in lengths]
+        for lengths in (coded_image.dc_code_lengths, coded_image.ac_code_lengths)
+    )
+
+    decoded_segments = _map(
+        _decode_segment,
+        n_jobs,
+        [coded_image.get_segment(i) for i in range(coded_image.n_segments)],
+        np.diff(starts).tolist(),
+        repeat(tables),
+        repeat(n_coefficients),
+    )
+
+    if len(decoded_segments) == 0:
+        return np.zeros(coded_image.shape, dtype=dtype)
+
+    return np.concatenate(decoded_segments).astype(dtype).reshape(coded_image.shape)
@@ -17,3 +17,8 @@ import re
 WHITESPACE_PATTERN = r"\s+"
 
 WHITESPACE_REGEX = re.compile(WHITESPACE_PATTERN)
+
+PGM_FILE_TYPE = "P5"
+PPM_FILE_TYPE = "P6"
+N_HEADER_TOKENS = 4
+COMMENT_START = b"#"
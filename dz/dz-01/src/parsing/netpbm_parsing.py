@@ -0,0 +1,44 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from pathlib import Path
+
+from . import constants
+from .pgm_parsing import Pgm5Image
+from .ppm_parsing import Ppm6Image
+
+
+def read_netpbm_image(image_path: Path or str) -> Pgm5Image or Ppm6Image:
+    """
+    Reads a Netpbm image, picking the reader based on its magic number.
+
+    :param image_path:
+        A Path or string representing the path to a PGM5 or PPM6 image.
+
+    :return:
+        A Pgm5Image or a Ppm6Image, depending on the file type.
+    """
+    with open(image_path, mode="rb") as file:
+        file_type = file.read(2).decode("utf8")
+
+    if file_type == constants.PGM_FILE_TYPE:
+        return Pgm5Image(image_path)
+
+    if file_type == constants.PPM_FILE_TYPE:
+        return Ppm6Image(image_path)
+
+    raise ValueError(
+        f"Expected a {constants.PGM_FILE_TYPE} or {constants.PPM_FILE_TYPE} image, "
+        f"got {file_type}"
+    )
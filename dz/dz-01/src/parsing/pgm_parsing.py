@@ -0,0 +1,131 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from pathlib import Path
+from typing import BinaryIO, List
+
+import numpy as np
+
+from . import constants
+
+
+def read_header_tokens(file: BinaryIO, n_tokens: int) -> List[str]:
+    """
+    Reads whitespace separated Netpbm header tokens, skipping comments.
+
+    The file is left positioned at the first byte of the pixel data.
+
+    :param file:
+        A binary file object positioned at the start of a Netpbm file.
+    :param n_tokens:
+        An int representing the number of tokens to read.
+
+    :return:
+        A list of n_tokens strings.
+    """
+    tokens = list()
+
+    while len(tokens) < n_tokens:
+        line = file.readline()
+
+        if len(line) == 0:
+            raise ValueError(
+                f"Expected {n_tokens} header tokens, but reached EOF after "
+                f"{len(tokens)}"
+            )
+
+        line = line.split(constants.COMMENT_START, 1)[0].decode("utf8").strip()
+
+        if len(line) != 0:
+            tokens.extend(constants.WHITESPACE_REGEX.split(line))
+
+    return tokens
+
+
+class Pgm5Image:
+    """
+    A class for easier handling of PGM5 images.
+    """
+
+    def __init__(self, image_path: Path or str):
+        with open(image_path, mode="rb") as file:
+            self._file_type, width, height, max_value = read_header_tokens(
+                file, constants.N_HEADER_TOKENS
+            )
+            self._width, self._height = int(width), int(height)
+            self._max_value = int(max_value)
+
+            dtype = np.uint8 if self.max_value < 256 else np.dtype(">u2")
+
+            self._data = (
+                np.frombuffer(
+                    file.read(self.width * self.height * np.dtype(dtype).itemsize),
+                    dtype=dtype,
+                )
+                .reshape(self.height, self.width)
+                .astype(np.uint8 if self.max_value < 256 else np.uint16)
+            )
+
+    # region Properties
+    @property
+    def file_type(self) -> str:
+        """
+        The file type property.
+
+        :return:
+            A string representing the file type (should be only "P5").
+        """
+        return self._file_type
+
+    @property
+    def width(self) -> int:
+        """
+        The image width property.
+
+        :return:
+            An int representing the image width.
+        """
+        return self._width
+
+    @property
+    def height(self) -> int:
+        """
+        The image height property.
+
+        :return:
+            An int representing the image height.
+        """
+        return self._height
+
+    @property
+    def max_value(self) -> int:
+        """
+        The maximum value property.
+
+        :return:
+            An int representing the maximum value found in the image.
+        """
+        return self._max_value
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The image data.
+
+        :return:
+            A np.ndarray of shape HxW representing the image data.
+        """
+        return np.copy(self._data)
+
+    # endregion
@@ -12,11 +12,14 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+from contextlib import nullcontext
 from pathlib import Path
+from typing import BinaryIO
 
 import numpy as np
 
 from . import constants
+from .pgm_parsing import read_header_tokens
 
 
 class Ppm6Image:
@@ -24,35 +27,29 @@ class Ppm6Image:
     A class for easier handling of PPM6 images.
     """
 
-    def __init__(self, image_path: Path or str):
-        with open(image_path, mode="rb") as file:
-            self._file_type = file.readline().decode("utf8").strip()
-            self._width, self._height = (
-                int(x)
-                for x in constants.WHITESPACE_REGEX.split(
-                    file.readline().decode("utf8").strip()
-                )
+    def __init__(self, image_path: Path or str or BinaryIO):
+        # An already opened binary file (e.g. io.BytesIO) is read as is.
+        with (
+            nullcontext(image_path)
+            if hasattr(image_path, "read")
+            else open(image_path, mode="rb")
+        ) as file:
+            self._file_type, width, height, max_value = read_header_tokens(
+                file, constants.N_HEADER_TOKENS
             )
-            self._max_value = int(file.readline().decode("utf8").strip())
-
-            bytes_per_color = 1 if self.max_value < 256 else 2
-            bytes_per_pixel = 3 * bytes_per_color
-
-            read_content = file.read()
-            read_rows = [
-                read_content[i : i + (self.width * bytes_per_pixel)]
-                for i in range(0, len(read_content), self.width * bytes_per_pixel)
-            ]
-            read_pixels = [
-                [
-                    [int(element) for element in read_row[i : i + bytes_per_pixel]]
-                    for i in range(0, len(read_row), bytes_per_pixel)
-                ]
-                for read_row in read_rows
-            ]
-
-            self._data = np.array(
-                read_pixels, dtype=np.uint8 if bytes_per_color == 1 else np.uint16
+            self._width, self._height = int(width), int(height)
+            self._max_value = int(max_value)
+
+            # Samples wider than a byte are stored big endian.
+            dtype = np.uint8 if self.max_value < 256 else np.dtype(">u2")
+
+            self._data = (
+                np.frombuffer(
+                    file.read(3 * self.width * self.height * np.dtype(dtype).itemsize),
+                    dtype=dtype,
+                )
+                .reshape(self.height, self.width, 3)
+                .astype(np.uint8 if self.max_value < 256 else np.uint16)
             )
 
     # region Properties
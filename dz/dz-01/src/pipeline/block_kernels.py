@@ -0,0 +1,233 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+from ..quantization.ycbcr_quantization import quantize
+from ..transformations.block_statistics import get_block_moments
+from ..transformations.constants import NUMBA_BACKEND, NUMPY_BACKEND
+from ..transformations.fused_transformations import get_numba_kernel, resolve_backend
+from ..transformations.image_transformations import (
+    dct_2d,
+    dct_2d_dc,
+    get_dct_tables,
+)
+from ..transformations.matrix_transformations import (
+    get_zigzag_indices,
+    zigzag_pixel_blocks,
+)
+from ..transformations.pruned_transformations import (
+    get_flat_block_mask,
+    get_pruned_dct_corners,
+    get_pruned_dct_groups,
+    get_pruned_dct_sizes,
+    get_pruned_dct_slack,
+    get_pruned_dct_thresholds,
+)
+
+
+def _pruned_dct_quantize_zigzag(
+    pixel_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    tolerance: float,
+    dtype,
+    coefficient_dtype,
+) -> np.ndarray:
+    n_components = pixel_blocks.shape[4]
+    sizes = get_pruned_dct_sizes(
+        pixel_blocks, quantization_tensor, tolerance=tolerance, dtype=dtype
+    )
+
+    # 8x8xC -> Cx8x8, so that the table of a flat index into the AxBxC blocks and
+    # components is at that index modulo C.
+    component_tensors = np.moveaxis(np.asarray(quantization_tensor, dtype=dtype), -1, 0)
+    zigzag_positions = np.argsort(get_zigzag_indices()).reshape(8, 8)
+
+    output = np.zeros((sizes.size, 64), dtype=coefficient_dtype)
+
+    for k, indices in get_pruned_dct_groups(sizes):
+        quantized_corners = quantize(
+            get_pruned_dct_corners(pixel_blocks, indices, k, dtype=dtype),
+            component_tensors[indices % n_components, :k, :k],
+            dtype=coefficient_dtype,
+        )
+        output[
+            indices[:, np.newaxis], zigzag_positions[:k, :k].ravel()
+        ] = quantized_corners.reshape(len(indices), -1)
+
+    return output.reshape(pixel_blocks.shape[:2] + (n_components, 64))
+
+
+def dct_quantize_zigzag(
+    pixel_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    dtype=np.float64,
+    coefficient_dtype=int,
+    backend: str = NUMPY_BACKEND,
+    pruning_tolerance: float = None,
+    skip_flat_blocks: bool = False,
+    block_statistics: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Does the 2D DCT, quantization and zigzag scanning of pixel blocks.
+
+    With the numpy backend, gives the same result as
+    zigzag_pixel_blocks(quantize(dct_2d(pixel_blocks), quantization_tensor)). The
+    numba backend does all three per block in a single kernel, parallel over block
+    rows; it is compiled on first use and cached on disk. It sums the DCT products
+    in another order than the matrix products of dct_2d, so where a coefficient
+    lies within float error of a rounding boundary its result may differ from the
+    numpy one by 1 (which the equivalence harness allows). The numpy backend is
+    used if numba is not installed and backend is "auto".
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 you wish to quantize with.
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in. Defaults to
+        np.float64.
+    :param coefficient_dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
+    :param backend:
+        (Optional) A string: "numpy", "numba" or "auto". Defaults to "numpy".
+    :param pruning_tolerance:
+        (Optional) A float; if given, coefficients which get_pruned_dct_thresholds
+        with this tolerance shows to quantize to 0 aren't computed. The numpy
+        backend groups the blocks and components by get_pruned_dct_sizes and only
+        transforms, quantizes and scans the top left k x k coefficients of every
+        group; the numba kernel does the same check per block and component. With
+        0 every skipped coefficient quantizes to 0, so the numba kernel gives the
+        same result as without pruning. The numpy backend sums the kept
+        coefficients in another order, so like pruned_dct_2d it may differ by 1
+        where a coefficient lies within float error of a rounding boundary. On
+        lenna with K1 and K2 on one core, the numpy backend takes about 90% of the
+        time of the full path in float64 and 80% in float32, and about 60% on the
+        photo-like inputs of the equivalence harness. The numba kernel takes about
+        70% of the time with 88% of the blocks flat, but breaks even on lenna.
+        Defaults to None (no pruning).
+    :param skip_flat_blocks:
+        (Optional) A bool; if True, blocks get_flat_block_mask finds flat get only
+        their quantized DC coefficients, computed by dct_2d_dc, and the rest of
+        the blocks go through the DCT. Their AC coefficients are provably 0 and
+        dct_2d_dc does the same products as dct_2d, so the result is the same.
+        Pays off on content with many flat blocks, such as screen content, where
+        it takes about two thirds of the time with 88% of the blocks flat; with
+        half of the blocks flat it costs about as much as it saves, and on photos
+        it adds about 12%. With the numba backend the pre-pass would cost more
+        than the kernel, so the pruned kernel is used instead (with a
+        pruning_tolerance of 0 unless given), which does the same check per block
+        and component inside the kernel. Defaults to False.
+    :param block_statistics:
+        (Optional) A structured np.ndarray of shape AxBx3, the get_block_statistics
+        of pixel_blocks, whose means and variances skip_flat_blocks finds the flat
+        blocks from with the numpy backend. Defaults to None (get_block_moments is
+        used).
+
+    :return:
+        A np.ndarray of shape AxBx3x64, where A = H/8, B = W/8.
+    """
+    if skip_flat_blocks and resolve_backend(backend) == NUMBA_BACKEND:
+        if pruning_tolerance is None:
+            pruning_tolerance = 0
+    elif skip_flat_blocks:
+        if block_statistics is None:
+            block_means, block_variances = get_block_moments(pixel_blocks)
+        else:
+            block_means = block_statistics["mean"]
+            block_variances = block_statistics["variance"]
+
+        is_flat = get_flat_block_mask(
+            block_means, block_variances, quantization_tensor, dtype=dtype
+        )
+
+        # Without flat blocks, the regular path below is taken.
+        if np.any(is_flat):
+            output = np.zeros(
+                pixel_blocks.shape[:2] + (pixel_blocks.shape[4], 64),
+                dtype=coefficient_dtype,
+            )
+
+            output[is_flat, :, 0] = quantize(
+                dct_2d_dc(pixel_blocks[is_flat], dtype=dtype),
+                quantization_tensor[0, 0],
+                dtype=coefficient_dtype,
+            )
+
+            if not np.all(is_flat):
+                output[~is_flat] = dct_quantize_zigzag(
+                    pixel_blocks[np.newaxis, ~is_flat],
+                    quantization_tensor,
+                    dtype=dtype,
+                    coefficient_dtype=coefficient_dtype,
+                    backend=backend,
+                    pruning_tolerance=pruning_tolerance,
+                )[0]
+
+            return output
+
+    if pruning_tolerance is not None and resolve_backend(backend) == NUMPY_BACKEND:
+        return _pruned_dct_quantize_zigzag(
+            pixel_blocks,
+            quantization_tensor,
+            pruning_tolerance,
+            dtype=dtype,
+            coefficient_dtype=coefficient_dtype,
+        )
+
+    if pruning_tolerance is not None and resolve_backend(backend) == NUMBA_BACKEND:
+        from .numba_kernels import pruned_dct_quantize_zigzag_kernel
+
+        output = np.empty(
+            pixel_blocks.shape[:2] + (pixel_blocks.shape[4], 64),
+            dtype=coefficient_dtype,
+        )
+        get_numba_kernel(pruned_dct_quantize_zigzag_kernel)(
+            np.ascontiguousarray(pixel_blocks, dtype=dtype),
+            *get_dct_tables(dtype),
+            np.asarray(quantization_tensor, dtype=dtype),
+            get_zigzag_indices(),
+            get_pruned_dct_thresholds(
+                quantization_tensor, pruning_tolerance, dtype=dtype
+            ),
+            get_pruned_dct_slack(dtype),
+            output,
+        )
+
+        return output
+
+    if resolve_backend(backend) == NUMBA_BACKEND:
+        from .numba_kernels import dct_quantize_zigzag_kernel
+
+        output = np.empty(
+            pixel_blocks.shape[:2] + (pixel_blocks.shape[4], 64),
+            dtype=coefficient_dtype,
+        )
+        get_numba_kernel(dct_quantize_zigzag_kernel)(
+            np.ascontiguousarray(pixel_blocks, dtype=dtype),
+            *get_dct_tables(dtype),
+            np.asarray(quantization_tensor, dtype=dtype),
+            get_zigzag_indices(),
+            output,
+        )
+
+        return output
+
+    return zigzag_pixel_blocks(
+        quantize(
+            dct_2d(pixel_blocks, dtype=dtype),
+            quantization_tensor,
+            dtype=coefficient_dtype,
+        )
+    )
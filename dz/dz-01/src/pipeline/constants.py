@@ -0,0 +1,56 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+DEFAULT_BIT_DEPTH = 8
+# Netpbm images with a maximum value below 255 are still coded as 8-bit images.
+MIN_NETPBM_BIT_DEPTH = 8
+MAX_BIT_DEPTH = 16
+
+LEVEL_SHIFT = 128
+MIN_PIXEL_VALUE = 0
+MAX_PIXEL_VALUE = 255
+
+REFERENCE_COMPUTE_DTYPE = np.float64
+REFERENCE_COEFFICIENT_DTYPE = np.int64
+FAST_COMPUTE_DTYPE = np.float32
+FAST_COEFFICIENT_DTYPE = np.int16
+PIXEL_DTYPE = np.uint8
+
+# How many unit roundoffs a value can pick up, relative to the sum of the absolute
+# values of its terms: a DCT coefficient of encode_image from the color conversion,
+# the two 8-term products (or the 64-term sums of the numba kernel) and the
+# quantization, and a pixel of reconstruct_image from its 192-term product.
+ENCODE_ROUNDING_ERRORS = 80
+DECODE_ROUNDING_ERRORS = 200
+
+DEFAULT_PENDING_PER_WORKER = 2
+MESSAGE_LENGTH_FORMAT = "<Q"
+MESSAGE_STATUS_FORMAT = "<B"
+MESSAGE_STATUS_OK = 0
+MESSAGE_STATUS_ERROR = 1
+# Requests are read whole before they are parsed, so their length is capped; 1 GiB
+# still fits a 16-bit 8192x8192 PPM6 image.
+MAX_REQUEST_LENGTH = 1 << 30
+
+# Zigzag positions where the spectral bands start: DC, the first 5 AC
+# coefficients and then the remaining diagonals in growing groups.
+DEFAULT_BAND_EDGES = (0, 1, 6, 15, 28, 64)
+
+THUMBNAIL_SCALES = (2, 4, 8)
+
+HAAR_LOSSLESS_TRANSFORM = "haar"
+IDENTITY_LOSSLESS_TRANSFORM = "identity"
+DEFAULT_LOSSLESS_TRANSFORM = HAAR_LOSSLESS_TRANSFORM
@@ -0,0 +1,373 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+from pathlib import Path
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from . import constants
+from .intra_coding import encode_image
+from .precision import FLOAT64_POLICY, PrecisionPolicy, get_bit_depth
+from ..parsing.ppm_parsing import Ppm6Image
+from ..transformations.constants import NUMPY_BACKEND
+
+
+def _encode_source(
+    source: Path or str or bytes,
+    quantization_tensor: Optional[np.ndarray],
+    policy: PrecisionPolicy,
+    backend: str,
+) -> np.ndarray:
+    # Runs in a worker process, so reading and parsing the file overlaps with the
+    # other requests being encoded.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    image = Ppm6Image(source)
+
+    return encode_image(
+        image.data,
+        quantization_tensor=quantization_tensor,
+        policy=policy,
+        backend=backend,
+        bit_depth=get_bit_depth(image.max_value),
+    )
+
+
+class EncodeService:
+    """
+    A class for encoding PPM6 images from asyncio code.
+
+    Images are parsed and encoded in a process pool, so the event loop is never
+    blocked. Every worker process takes one request at a time from a bounded
+    queue; once the queue is full, encode waits for a free slot instead of letting
+    work pile up, which keeps the latency of accepted requests bound.
+    """
+
+    def __init__(
+        self,
+        n_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        quantization_tensor: Optional[np.ndarray] = None,
+        policy: PrecisionPolicy = FLOAT64_POLICY,
+        backend: str = NUMPY_BACKEND,
+    ):
+        self._n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+        self._max_pending = (
+            constants.DEFAULT_PENDING_PER_WORKER * self._n_workers
+            if max_pending is None
+            else max_pending
+        )
+        self._encode_arguments = (quantization_tensor, policy, backend)
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = list()
+
+    async def __aenter__(self) -> "EncodeService":
+        await self.start()
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # region Properties
+    @property
+    def n_workers(self) -> int:
+        """
+        The number of workers property.
+
+        :return:
+            An int representing the number of worker processes.
+        """
+        return self._n_workers
+
+    @property
+    def max_pending(self) -> int:
+        """
+        The maximum pending property.
+
+        :return:
+            An int representing how many requests can wait for a worker.
+        """
+        return self._max_pending
+
+    @property
+    def n_pending(self) -> int:
+        """
+        The number of pending requests property.
+
+        :return:
+            An int representing how many requests are waiting for a worker.
+        """
+        return 0 if self._queue is None else self._queue.qsize()
+
+    # endregion
+
+    async def start(self):
+        """
+        Starts the worker processes. Does nothing if they are already running.
+
+        :return:
+            Nothing.
+        """
+        if self._executor is not None:
+            return
+
+        self._executor = ProcessPoolExecutor(max_workers=self._n_workers)
+        self._queue = asyncio.Queue(maxsize=self._max_pending)
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._n_workers)
+        ]
+
+    async def close(self):
+        """
+        Finishes the accepted requests and stops the worker processes.
+
+        :return:
+            Nothing.
+        """
+        if self._executor is None:
+            return
+
+        await self._queue.join()
+
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown()
+
+        self._executor, self._queue, self._workers = None, None, list()
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            source, future = await self._queue.get()
+
+            try:
+                if not future.cancelled():
+                    result = await loop.run_in_executor(
+                        self._executor,
+                        _encode_source,
+                        source,
+                        *self._encode_arguments,
+                    )
+
+                    if not future.cancelled():
+                        future.set_result(result)
+            except Exception as exception:
+                if not future.cancelled():
+                    future.set_exception(exception)
+            finally:
+                self._queue.task_done()
+
+    async def encode(self, source: Path or str or bytes) -> np.ndarray:
+        """
+        Encodes a PPM6 image, waiting for a free slot if the service is busy.
+
+        :param source:
+            A Path or string representing the path to a PPM6 image, or the bytes of
+            a PPM6 file.
+
+        :return:
+            A np.ndarray of shape AxBx3x64 containing the zigzagged quantized
+            coefficients, where A = H/8, B = W/8.
+        """
+        if self._executor is None:
+            raise RuntimeError("The service has to be started before encoding")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((source, future))
+
+        return await future
+
+
+async def _read_message_length(reader: asyncio.StreamReader) -> int:
+    header = await reader.readexactly(struct.calcsize(constants.MESSAGE_LENGTH_FORMAT))
+
+    return struct.unpack(constants.MESSAGE_LENGTH_FORMAT, header)[0]
+
+
+async def _read_message(reader: asyncio.StreamReader) -> bytes:
+    return await reader.readexactly(await _read_message_length(reader))
+
+
+async def _skip_bytes(reader: asyncio.StreamReader, n_bytes: int):
+    # read never returns more than the stream buffers, so memory stays bound.
+    while n_bytes > 0:
+        chunk = await reader.read(n_bytes)
+
+        if len(chunk) == 0:
+            raise asyncio.IncompleteReadError(b"", n_bytes)
+
+        n_bytes -= len(chunk)
+
+
+def _write_message(writer: asyncio.StreamWriter, message: bytes):
+    writer.write(struct.pack(constants.MESSAGE_LENGTH_FORMAT, len(message)))
+    writer.write(message)
+
+
+async def _read_response(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(struct.calcsize(constants.MESSAGE_STATUS_FORMAT))
+    status = struct.unpack(constants.MESSAGE_STATUS_FORMAT, header)[0]
+    message = await _read_message(reader)
+
+    if status != constants.MESSAGE_STATUS_OK:
+        raise RuntimeError(f"The server failed to encode the image: {message.decode()}")
+
+    return message
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, message: bytes):
+    writer.write(struct.pack(constants.MESSAGE_STATUS_FORMAT, status))
+    _write_message(writer, message)
+
+
+def _write_error(writer: asyncio.StreamWriter, exception: Exception):
+    _write_response(
+        writer,
+        constants.MESSAGE_STATUS_ERROR,
+        f"{type(exception).__name__}: {exception}".encode(),
+    )
+
+
+async def start_server(
+    service: EncodeService,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    path: Optional[Path or str] = None,
+    max_request_length: int = constants.MAX_REQUEST_LENGTH,
+) -> asyncio.AbstractServer:
+    """
+    Starts a minimal TCP or Unix socket server in front of an EncodeService.
+
+    Every message is prefixed with its length as a little endian uint64. A client
+    sends the bytes of a PPM6 file and gets back a status byte followed by either
+    the coefficients in the .npy format or, if encoding failed, a UTF-8 error
+    message; connections can be reused for more requests. Requests longer than
+    max_request_length are discarded unread and answered with an error.
+
+    :param service:
+        A started EncodeService handling the requests.
+    :param host:
+        (Optional) A string representing the host to listen on.
+    :param port:
+        (Optional) An int representing the TCP port to listen on.
+    :param path:
+        (Optional) A Path or string representing the Unix socket to listen on. If
+        given, host and port are ignored.
+    :param max_request_length:
+        (Optional) An int representing the largest request in bytes the server
+        reads. Defaults to 1 GiB.
+
+    :return:
+        An asyncio.AbstractServer which is already serving.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    length = await _read_message_length(reader)
+
+                    if length > max_request_length:
+                        # The request is thrown away as it arrives instead of
+                        # being buffered, which keeps the connection usable.
+                        await _skip_bytes(reader, length)
+                        _write_error(
+                            writer,
+                            ValueError(
+                                f"Expected a request of at most {max_request_length}"
+                                f" bytes, got {length}"
+                            ),
+                        )
+                        await writer.drain()
+
+                        continue
+
+                    message = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    coefficients = await service.encode(message)
+                except Exception as exception:
+                    _write_error(writer, exception)
+                else:
+                    output = io.BytesIO()
+                    np.save(output, coefficients)
+
+                    _write_response(
+                        writer, constants.MESSAGE_STATUS_OK, output.getvalue()
+                    )
+
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if path is not None:
+        return await asyncio.start_unix_server(handle, path=str(path))
+
+    return await asyncio.start_server(handle, host=host, port=port)
+
+
+async def request_encode(
+    data: bytes,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    path: Optional[Path or str] = None,
+) -> np.ndarray:
+    """
+    Sends a single image to a server started with start_server. Raises a
+    RuntimeError with the error message of the server if it failed to encode it.
+
+    :param data:
+        The bytes of a PPM6 file.
+    :param host:
+        (Optional) A string representing the server host.
+    :param port:
+        (Optional) An int representing the server TCP port.
+    :param path:
+        (Optional) A Path or string representing the server Unix socket. If given,
+        host and port are ignored.
+
+    :return:
+        A np.ndarray of shape AxBx3x64 containing the zigzagged quantized
+        coefficients, where A = H/8, B = W/8.
+    """
+    connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter] = (
+        await asyncio.open_unix_connection(str(path))
+        if path is not None
+        else await asyncio.open_connection(host, port)
+    )
+    reader, writer = connection
+
+    try:
+        _write_message(writer, data)
+        await writer.drain()
+
+        return np.load(io.BytesIO(await _read_response(reader)))
+    finally:
+        writer.close()
+        await writer.wait_closed()
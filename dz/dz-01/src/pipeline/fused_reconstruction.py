@@ -0,0 +1,214 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from sys import stdout
+from typing import Tuple
+
+import numpy as np
+
+from . import constants
+from .precision import (
+    FLOAT64_POLICY,
+    PrecisionPolicy,
+    get_level_shift,
+    get_max_pixel_value,
+)
+from ..quantization.ycbcr_quantization import get_quantization_tensor
+from ..transformations import constants as transformation_constants
+from ..transformations.color_transforms import get_color_transform
+from ..transformations.image_transformations import get_dct_basis, get_dct_weights
+from ..transformations.matrix_transformations import get_zigzag_indices
+
+
+def get_color_reconstruction_matrix(
+    quantization_tensor: np.ndarray,
+    color_matrix: np.ndarray,
+    color_offsets: np.ndarray,
+    level_shift: int = constants.LEVEL_SHIFT,
+    dtype=np.float64,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Folds dequantization, the IDCT, the level shift and the color conversion into
+    a single affine map from zigzagged coefficients to RGB pixels.
+
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+    :param color_matrix:
+        A np.ndarray of shape 3x3 whose rows are the weights of every RGB component,
+        e.g. ColorTransform.inverse_matrix.
+    :param color_offsets:
+        A np.ndarray of shape 3 subtracted from the components before the weights,
+        e.g. ColorTransform.get_offset_vector(bit_depth).
+    :param level_shift:
+        (Optional) An int representing the value added back to the IDCT output.
+        Defaults to 128.
+    :param dtype:
+        (Optional) The floating point dtype of the result. Defaults to np.float64.
+
+    :return:
+        A tuple containing a np.ndarray of shape 192x192 mapping a 3x64 block of
+        zigzagged coefficients onto an 8x8x3 block of RGB pixels (both flattened),
+        and a np.ndarray of shape 3 added to every RGB pixel afterwards.
+    """
+    rgb_offsets = color_matrix @ (level_shift - color_offsets)
+
+    basis = get_dct_basis()
+    scales = quantization_tensor * get_dct_weights()[..., np.newaxis] / 4
+
+    # The element at (c, u, v, i, j, k) is what the dequantized (u, v) coefficient of
+    # component c contributes to RGB component k of pixel (i, j).
+    matrix = np.einsum("kc,uvc,ui,vj->cuvijk", color_matrix, scales, basis, basis)
+    matrix = matrix.reshape(3, 64, -1)[:, get_zigzag_indices()]
+
+    return matrix.reshape(3 * 64, -1).astype(dtype), rgb_offsets.astype(dtype)
+
+
+def get_reconstruction_matrix(
+    quantization_tensor: np.ndarray,
+    r_coefficients=transformation_constants.DEFAULT_R_COEFFICIENTS,
+    g_coefficients=transformation_constants.DEFAULT_G_COEFFICIENTS,
+    b_coefficients=transformation_constants.DEFAULT_B_COEFFICIENTS,
+    y_addition=transformation_constants.DEFAULT_Y_ADDITION,
+    cb_addition=transformation_constants.DEFAULT_CB_ADDITION,
+    cr_addition=transformation_constants.DEFAULT_CR_ADDITION,
+    level_shift: int = constants.LEVEL_SHIFT,
+    dtype=np.float64,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets get_color_reconstruction_matrix for YCbCr weights and additions.
+
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+    :param r_coefficients:
+        A list of 3 YCbCr weights for the R component.
+    :param g_coefficients:
+        A list of 3 YCbCr weights for the G component.
+    :param b_coefficients:
+        A list of 3 YCbCr weights for the B component.
+    :param y_addition:
+        A float or int representing the number subtracted from Y before the weights.
+    :param cb_addition:
+        A float or int representing the number subtracted from Cb before the weights.
+    :param cr_addition:
+        A float or int representing the number subtracted from Cr before the weights.
+    :param level_shift:
+        (Optional) An int representing the value added back to the IDCT output.
+        Defaults to 128.
+    :param dtype:
+        (Optional) The floating point dtype of the result. Defaults to np.float64.
+
+    :return:
+        The result of get_color_reconstruction_matrix.
+    """
+    return get_color_reconstruction_matrix(
+        quantization_tensor,
+        np.array([r_coefficients, g_coefficients, b_coefficients], dtype=np.float64),
+        np.array([y_addition, cb_addition, cr_addition], dtype=np.float64),
+        level_shift=level_shift,
+        dtype=dtype,
+    )
+
+
+def reconstruct_image(
+    zigzagged_blocks: np.ndarray,
+    quantization_tensor: np.ndarray = None,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    max_value: int = None,
+    color_transform: str = transformation_constants.DEFAULT_COLOR_TRANSFORM,
+    verbose: int = 0,
+) -> np.ndarray:
+    """
+    Reconstructs an RGB image from zigzagged quantized coefficients in one pass.
+
+    Gives the same result as dequantize, idct_2d and blocks_to_rgb in a row (up to
+    floating point reassociation), but every block row goes from integer
+    coefficients to clipped pixels with a single matrix product and is written
+    straight into the merged image, so no full size floating point image is ever
+    held in memory.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64 of any integer dtype, usually the output of
+        encode_image.
+    :param quantization_tensor:
+        (Optional) A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+        Defaults to the K1 and K2 tables.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header; reconstructed samples are clipped to it. Defaults to
+        None (2^bit_depth - 1).
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+    :param verbose:
+        (Optional) An int; if greater than 0 will print out a tqdm progress bar.
+        Defaults to 0.
+
+    :return:
+        A np.ndarray of shape 8Ax8Bx3 containing the RGB image in the pixel dtype of
+        the policy, widened if the bit depth needs it.
+    """
+    if quantization_tensor is None:
+        quantization_tensor = get_quantization_tensor()
+
+    level_shift = get_level_shift(bit_depth)
+    max_pixel_value = get_max_pixel_value(bit_depth, max_value)
+
+    transform = get_color_transform(color_transform)
+
+    matrix, offsets = get_color_reconstruction_matrix(
+        quantization_tensor,
+        transform.inverse_matrix,
+        transform.get_offset_vector(bit_depth),
+        level_shift=level_shift,
+        dtype=policy.compute_dtype,
+    )
+    offsets = np.tile(offsets, 64)
+
+    n_block_rows, n_block_columns = zigzagged_blocks.shape[:2]
+    output = np.empty(
+        (8 * n_block_rows, 8 * n_block_columns, 3),
+        dtype=policy.get_pixel_dtype(bit_depth),
+    )
+    strip = np.empty((n_block_columns, 3 * 64), dtype=policy.compute_dtype)
+
+    if verbose > 0:
+        # tqdm is only needed for progress bars, so it isn't imported up front.
+        from tqdm import tqdm
+
+        pbar = tqdm(total=n_block_rows * n_block_columns, file=stdout)
+
+    for a in range(n_block_rows):
+        np.matmul(zigzagged_blocks[a].reshape(n_block_columns, -1), matrix, out=strip)
+        strip += offsets
+
+        np.rint(strip, out=strip)
+        np.clip(strip, constants.MIN_PIXEL_VALUE, max_pixel_value, out=strip)
+
+        # Bx8x8x3 -> 8xBx8x3, which is the image strip once the middle axes are joined.
+        output[8 * a : 8 * (a + 1)] = np.swapaxes(
+            strip.reshape(n_block_columns, 8, 8, 3), 0, 1
+        ).reshape(8, -1, 3)
+
+        if verbose > 0:
+            pbar.update(n_block_columns)
+
+    if verbose > 0:
+        pbar.close()
+
+    return output
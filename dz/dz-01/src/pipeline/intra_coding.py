@@ -0,0 +1,264 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from sys import stdout
+
+import numpy as np
+
+from . import constants
+from .block_kernels import dct_quantize_zigzag
+from .fused_reconstruction import reconstruct_image
+from .precision import (
+    FLOAT64_POLICY,
+    PrecisionPolicy,
+    get_level_shift,
+    get_max_pixel_value,
+)
+from ..coding.block_cache import BlockCache
+from ..quantization.ycbcr_quantization import (
+    dead_zone_quantize,
+    get_quantization_tensor,
+)
+from ..transformations.color_transforms import get_color_transform
+from ..transformations.constants import DEFAULT_COLOR_TRANSFORM, NUMPY_BACKEND
+from ..transformations.fused_transformations import rgb_to_shifted_blocks
+from ..transformations.image_transformations import (
+    apply_inverse_color_matrix,
+    dct_2d,
+    merge_blocks_to_image,
+    shift_image_pixels,
+)
+from ..transformations.matrix_transformations import zigzag_pixel_blocks
+
+
+def encode_image(
+    pixel_data: np.ndarray,
+    quantization_tensor: np.ndarray = None,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    verbose: int = 0,
+    backend: str = NUMPY_BACKEND,
+    dead_zone_rounding: float = None,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    color_transform: str = DEFAULT_COLOR_TRANSFORM,
+    skip_flat_blocks: bool = False,
+    block_cache: BlockCache = None,
+) -> np.ndarray:
+    """
+    Runs an RGB image through the whole intra coding pipeline.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 containing an RGB image.
+    :param quantization_tensor:
+        (Optional) A np.ndarray of shape 8x8x3 you wish to quantize with. Defaults to
+        the K1 and K2 tables.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param verbose:
+        An int; if greater than 0 will print out a tqdm progress bar for the DCT,
+        which then goes through one row of blocks at a time.
+    :param backend:
+        (Optional) A string: "numpy", "numba" or "auto". Defaults to "numpy".
+    :param dead_zone_rounding:
+        (Optional) A float; if given, AC coefficients are quantized with
+        dead_zone_quantize using this rounding offset. Defaults to None (plain
+        rounding).
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+    :param skip_flat_blocks:
+        (Optional) A bool; if True, flat blocks skip the DCT as in
+        dct_quantize_zigzag. Can't be combined with dead_zone_rounding. Defaults to
+        False.
+    :param block_cache:
+        (Optional) A BlockCache; if given, blocks it already holds reuse their
+        coefficients instead of going through the DCT, e.g. when re-encoding the
+        same images. Can't be combined with dead_zone_rounding. Defaults to None.
+
+    :return:
+        A np.ndarray of shape AxBx3x64 containing the zigzagged quantized
+        coefficients, where A = H/8, B = W/8.
+    """
+    if dead_zone_rounding is not None and (skip_flat_blocks or block_cache is not None):
+        raise ValueError(
+            "Expected dead_zone_rounding not to be combined with skip_flat_blocks or "
+            "block_cache, which only apply to plain rounding"
+        )
+
+    if quantization_tensor is None:
+        quantization_tensor = get_quantization_tensor()
+
+    level_shift = get_level_shift(bit_depth)
+    coefficient_dtype = policy.get_coefficient_dtype(bit_depth)
+    transform = get_color_transform(color_transform)
+
+    pixel_blocks = rgb_to_shifted_blocks(
+        pixel_data,
+        transform.get_forward_matrix(policy.compute_dtype),
+        transform.get_offset_vector(
+            bit_depth, shift=-level_shift, dtype=policy.compute_dtype
+        ),
+        dtype=policy.compute_dtype,
+        backend=backend,
+    )
+
+    if dead_zone_rounding is not None:
+        dct_blocks = dct_2d(pixel_blocks, verbose=verbose, dtype=policy.compute_dtype)
+
+        return zigzag_pixel_blocks(
+            dead_zone_quantize(
+                dct_blocks,
+                quantization_tensor,
+                rounding=dead_zone_rounding,
+                dtype=coefficient_dtype,
+            )
+        )
+
+    encode_blocks = (
+        dct_quantize_zigzag if block_cache is None else block_cache.dct_quantize_zigzag
+    )
+    encode_arguments = dict(
+        dtype=policy.compute_dtype,
+        coefficient_dtype=coefficient_dtype,
+        backend=backend,
+        skip_flat_blocks=skip_flat_blocks,
+    )
+
+    if verbose <= 0:
+        return encode_blocks(pixel_blocks, quantization_tensor, **encode_arguments)
+
+    # The fused kernel has no progress bar, so verbose runs give it one row of blocks
+    # at a time. Every block is coded on its own, so the result is the same.
+    # tqdm is only needed for progress bars, so it isn't imported up front.
+    from tqdm import tqdm
+
+    n_block_rows, n_block_columns = pixel_blocks.shape[:2]
+    output = np.empty(
+        (n_block_rows, n_block_columns, pixel_blocks.shape[4], 64),
+        dtype=coefficient_dtype,
+    )
+    pbar = tqdm(total=n_block_rows * n_block_columns, file=stdout)
+
+    for a in range(n_block_rows):
+        output[a] = encode_blocks(
+            pixel_blocks[a : a + 1], quantization_tensor, **encode_arguments
+        )[0]
+        pbar.update(n_block_columns)
+
+    pbar.close()
+
+    return output
+
+
+def blocks_to_rgb(
+    pixel_blocks: np.ndarray,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    max_value: int = None,
+    color_transform: str = DEFAULT_COLOR_TRANSFORM,
+) -> np.ndarray:
+    """
+    Turns level shifted YCbCr pixel blocks, e.g. the IDCT output, into RGB pixels.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBxCxDx3 containing level shifted YCbCr blocks.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header; reconstructed samples are clipped to it. Defaults to
+        None (2^bit_depth - 1).
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+
+    :return:
+        A np.ndarray of shape ACxBDx3 containing the RGB image in the pixel dtype of
+        the policy, widened if the bit depth needs it.
+    """
+    level_shift = get_level_shift(bit_depth)
+    transform = get_color_transform(color_transform)
+
+    merged_data = merge_blocks_to_image(pixel_blocks)
+    shifted_data = shift_image_pixels(
+        merged_data, level_shift, in_place=policy.in_place
+    )
+    rgb_data = apply_inverse_color_matrix(
+        shifted_data,
+        transform.get_inverse_matrix(policy.compute_dtype),
+        transform.get_offset_vector(bit_depth, dtype=policy.compute_dtype),
+        dtype=policy.compute_dtype,
+    )
+
+    np.rint(rgb_data, out=rgb_data)
+    np.clip(
+        rgb_data,
+        constants.MIN_PIXEL_VALUE,
+        get_max_pixel_value(bit_depth, max_value),
+        out=rgb_data,
+    )
+
+    return rgb_data.astype(policy.get_pixel_dtype(bit_depth))
+
+
+def decode_image(
+    zigzagged_blocks: np.ndarray,
+    quantization_tensor: np.ndarray = None,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    verbose: int = 0,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    max_value: int = None,
+    color_transform: str = DEFAULT_COLOR_TRANSFORM,
+) -> np.ndarray:
+    """
+    Reconstructs an RGB image from zigzagged quantized coefficients.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64, usually the output of encode_image.
+    :param quantization_tensor:
+        (Optional) A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+        Defaults to the K1 and K2 tables.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param verbose:
+        An int; if greater than 0 will print out a tqdm progress bar for the IDCT.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header; reconstructed samples are clipped to it. Defaults to
+        None (2^bit_depth - 1).
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+
+    :return:
+        A np.ndarray of shape 8Ax8Bx3 containing the RGB image in the pixel dtype of
+        the policy, widened if the bit depth needs it.
+    """
+    if quantization_tensor is None:
+        quantization_tensor = get_quantization_tensor()
+
+    return reconstruct_image(
+        zigzagged_blocks,
+        quantization_tensor=quantization_tensor,
+        policy=policy,
+        bit_depth=bit_depth,
+        max_value=max_value,
+        color_transform=color_transform,
+        verbose=verbose,
+    )
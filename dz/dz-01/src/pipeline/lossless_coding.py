@@ -0,0 +1,228 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+from . import constants
+from .precision import check_bit_depth, get_level_shift
+from ..transformations.color_transforms import rgb_to_ycocg_r, ycocg_r_to_rgb
+from ..transformations.image_transformations import (
+    divide_image_to_blocks,
+    merge_blocks_to_image,
+)
+from ..transformations.matrix_transformations import (
+    unzigzag_pixel_blocks,
+    zigzag_pixel_blocks,
+)
+
+
+def get_lossless_dtype(bit_depth: int = constants.DEFAULT_BIT_DEPTH) -> np.dtype:
+    """
+    Gets the integer dtype lossless coefficients of an image are stored in.
+
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+
+    :return:
+        A np.dtype, int16 for up to 10 bits per sample and int32 above.
+    """
+    # Co and Cg take a bit more than the samples, the 2D Haar high band two more and
+    # the DC difference one more.
+    return np.min_scalar_type(-(2 ** (check_bit_depth(bit_depth) + 4)) - 1)
+
+
+def _check_transform(transform: str):
+    if transform not in (
+        constants.HAAR_LOSSLESS_TRANSFORM,
+        constants.IDENTITY_LOSSLESS_TRANSFORM,
+    ):
+        raise ValueError(
+            f"Expected transform to be {constants.HAAR_LOSSLESS_TRANSFORM} or "
+            f"{constants.IDENTITY_LOSSLESS_TRANSFORM}, got {transform}"
+        )
+
+
+def _swap_to_rows(region: np.ndarray, axis: int) -> np.ndarray:
+    return region if axis == 2 else np.swapaxes(region, 2, 3)
+
+
+def _haar_forward(region: np.ndarray, axis: int):
+    rows = _swap_to_rows(region, axis)
+    half = rows.shape[2] // 2
+
+    difference = rows[:, :, 0::2] - rows[:, :, 1::2]
+    mean = rows[:, :, 1::2] + (difference >> 1)
+
+    rows[:, :, :half] = mean
+    rows[:, :, half:] = difference
+
+
+def _haar_inverse(region: np.ndarray, axis: int):
+    rows = _swap_to_rows(region, axis)
+    half = rows.shape[2] // 2
+
+    mean = np.copy(rows[:, :, :half])
+    difference = np.copy(rows[:, :, half:])
+
+    rows[:, :, 1::2] = mean - (difference >> 1)
+    rows[:, :, 0::2] = difference + rows[:, :, 1::2]
+
+
+def haar_2d(pixel_blocks: np.ndarray) -> np.ndarray:
+    """
+    Runs a reversible integer 2D Haar transform on every block.
+
+    Every level lifts pairs (a, b) into d = a - b and s = b + (d >> 1), first along
+    rows and then along columns, and the next level works on the top left quarter
+    of s values, so the DC like value ends up at (0, 0) and the high frequencies
+    towards the bottom right, as with the DCT.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3 of a signed integer dtype.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3 containing the transform, same dtype.
+    """
+    transformed_blocks = np.array(pixel_blocks)
+    size = transformed_blocks.shape[2]
+
+    while size > 1:
+        region = transformed_blocks[:, :, :size, :size]
+        _haar_forward(region, axis=2)
+        _haar_forward(region, axis=3)
+
+        size //= 2
+
+    return transformed_blocks
+
+
+def inverse_haar_2d(transformed_blocks: np.ndarray) -> np.ndarray:
+    """
+    Exactly undoes haar_2d.
+
+    :param transformed_blocks:
+        A np.ndarray of shape AxBx8x8x3, usually the output of haar_2d.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3 containing the pixel blocks, same dtype.
+    """
+    pixel_blocks = np.array(transformed_blocks)
+    size = 2
+
+    while size <= pixel_blocks.shape[2]:
+        region = pixel_blocks[:, :, :size, :size]
+        _haar_inverse(region, axis=3)
+        _haar_inverse(region, axis=2)
+
+        size *= 2
+
+    return pixel_blocks
+
+
+def encode_lossless(
+    pixel_data: np.ndarray,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    transform: str = constants.DEFAULT_LOSSLESS_TRANSFORM,
+) -> np.ndarray:
+    """
+    Runs an RGB image through the lossless variant of the intra coding pipeline.
+
+    The image goes through the integer YCoCg-R transform, the level shift, the
+    integer Haar transform (or none) and zigzag scanning, without quantization.
+    The top left coefficient of every block is then replaced by its difference to
+    the one of the previous block in raster order.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 containing an integer RGB image, H and W being
+        multiples of 8.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param transform:
+        (Optional) A string: "haar" or "identity" (no transform). Defaults to
+        "haar".
+
+    :return:
+        A np.ndarray of shape AxBx3x64 containing the zigzagged coefficients, where
+        A = H/8, B = W/8.
+    """
+    _check_transform(transform)
+
+    if pixel_data.shape[0] % 8 != 0 or pixel_data.shape[1] % 8 != 0:
+        raise ValueError(
+            f"Expected the image size to be a multiple of 8, got {pixel_data.shape}"
+        )
+
+    ycocg_data = rgb_to_ycocg_r(pixel_data).astype(get_lossless_dtype(bit_depth))
+    ycocg_data[..., 0] -= get_level_shift(bit_depth)
+
+    pixel_blocks = divide_image_to_blocks(ycocg_data)
+
+    if transform == constants.HAAR_LOSSLESS_TRANSFORM:
+        pixel_blocks = haar_2d(pixel_blocks)
+
+    zigzagged_blocks = zigzag_pixel_blocks(pixel_blocks)
+
+    # DC DPCM: every block but the first one stores the difference to its
+    # predecessor.
+    dc_values = zigzagged_blocks[..., 0].reshape(-1, 3)
+    dc_values[1:] = np.diff(dc_values, axis=0)
+    zigzagged_blocks[..., 0] = dc_values.reshape(zigzagged_blocks.shape[:-1])
+
+    return zigzagged_blocks
+
+
+def decode_lossless(
+    zigzagged_blocks: np.ndarray,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    transform: str = constants.DEFAULT_LOSSLESS_TRANSFORM,
+    pixel_dtype=None,
+) -> np.ndarray:
+    """
+    Exactly reconstructs an RGB image encoded with encode_lossless.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64, the output of encode_lossless.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param transform:
+        (Optional) A string: "haar" or "identity" (no transform). Defaults to
+        "haar".
+    :param pixel_dtype:
+        (Optional) The dtype of the result. Defaults to uint8 for up to 8 bits per
+        sample and uint16 above.
+
+    :return:
+        A np.ndarray of shape 8Ax8Bx3 containing the RGB image.
+    """
+    _check_transform(transform)
+
+    if pixel_dtype is None:
+        pixel_dtype = np.min_scalar_type((1 << check_bit_depth(bit_depth)) - 1)
+
+    zigzagged_blocks = np.array(zigzagged_blocks, dtype=get_lossless_dtype(bit_depth))
+
+    dc_values = np.cumsum(
+        zigzagged_blocks[..., 0].reshape(-1, 3), axis=0, dtype=zigzagged_blocks.dtype
+    )
+    zigzagged_blocks[..., 0] = dc_values.reshape(zigzagged_blocks.shape[:-1])
+
+    pixel_blocks = unzigzag_pixel_blocks(zigzagged_blocks)
+
+    if transform == constants.HAAR_LOSSLESS_TRANSFORM:
+        pixel_blocks = inverse_haar_2d(pixel_blocks)
+
+    ycocg_data = merge_blocks_to_image(pixel_blocks)
+    ycocg_data[..., 0] += get_level_shift(bit_depth)
+
+    return ycocg_r_to_rgb(ycocg_data).astype(pixel_dtype)
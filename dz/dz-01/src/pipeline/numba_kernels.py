@@ -0,0 +1,124 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import numpy as np
+from numba import prange
+
+# Kernels for get_numba_kernel. This module imports numba, so it is only imported
+# once a kernel is needed; importing numba takes longer than the rest of the
+# package.
+
+
+def dct_quantize_zigzag_kernel(
+    pixel_blocks, basis, weights, quantization_tensor, zigzag_indices, output
+):
+    for a in prange(pixel_blocks.shape[0]):
+        rows = np.empty((8, 8), dtype=basis.dtype)
+        coefficients = np.empty((8, 8), dtype=basis.dtype)
+
+        for b in range(pixel_blocks.shape[1]):
+            for c in range(pixel_blocks.shape[4]):
+                for u in range(8):
+                    for j in range(8):
+                        rows[u, j] = 0
+
+                        for i in range(8):
+                            rows[u, j] += basis[u, i] * pixel_blocks[a, b, i, j, c]
+
+                for u in range(8):
+                    for v in range(8):
+                        coefficients[u, v] = 0
+
+                        for j in range(8):
+                            coefficients[u, v] += rows[u, j] * basis[v, j]
+
+                        coefficients[u, v] *= weights[u, v]
+
+                for k in range(64):
+                    u, v = zigzag_indices[k] // 8, zigzag_indices[k] % 8
+                    output[a, b, c, k] = np.rint(
+                        coefficients[u, v] / quantization_tensor[u, v, c]
+                    )
+
+
+def pruned_dct_quantize_zigzag_kernel(
+    pixel_blocks,
+    basis,
+    weights,
+    quantization_tensor,
+    zigzag_indices,
+    thresholds,
+    slack,
+    output,
+):
+    for a in prange(pixel_blocks.shape[0]):
+        block = np.empty((8, 8), dtype=basis.dtype)
+        rows = np.empty((8, 8), dtype=basis.dtype)
+        coefficients = np.empty((8, 8), dtype=basis.dtype)
+
+        for b in range(pixel_blocks.shape[1]):
+            for c in range(pixel_blocks.shape[4]):
+                mean = 0.0
+                norm = 0.0
+
+                for i in range(8):
+                    for j in range(8):
+                        block[i, j] = pixel_blocks[a, b, i, j, c]
+                        mean += block[i, j]
+                        norm += abs(block[i, j])
+
+                mean /= 64
+                energy = 0.0
+
+                for i in range(8):
+                    for j in range(8):
+                        energy += (block[i, j] - mean) ** 2
+
+                # The slack covers the float error of the coefficients.
+                energy = np.sqrt(energy) + slack * norm
+                size = 1
+
+                for m in range(1, 8):
+                    if energy >= thresholds[c, m]:
+                        size = m + 1
+
+                # Only the top left size x size coefficients are computed, the
+                # others are known to quantize to 0.
+                for u in range(size):
+                    for j in range(8):
+                        rows[u, j] = 0
+
+                    for i in range(8):
+                        for j in range(8):
+                            rows[u, j] += basis[u, i] * block[i, j]
+
+                for u in range(size):
+                    for v in range(size):
+                        coefficients[u, v] = 0
+
+                        for j in range(8):
+                            coefficients[u, v] += rows[u, j] * basis[v, j]
+
+                        coefficients[u, v] *= weights[u, v]
+
+                for k in range(64):
+                    u, v = zigzag_indices[k] // 8, zigzag_indices[k] % 8
+
+                    if u < size and v < size:
+                        output[a, b, c, k] = np.rint(
+                            coefficients[u, v] / quantization_tensor[u, v, c]
+                        )
+                    else:
+                        output[a, b, c, k] = 0
@@ -0,0 +1,278 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+from . import constants
+from ..transformations.color_transforms import get_color_transform
+from ..transformations.constants import DEFAULT_COLOR_TRANSFORM
+
+
+def check_bit_depth(bit_depth: int) -> int:
+    """
+    Checks whether the pipeline supports a bit depth.
+
+    :param bit_depth:
+        An int representing the bits per sample.
+
+    :return:
+        The same bit depth, if it is in [1, 16].
+    """
+    if not 1 <= bit_depth <= constants.MAX_BIT_DEPTH:
+        raise ValueError(
+            f"Expected bit_depth to be in [1, {constants.MAX_BIT_DEPTH}], got "
+            f"{bit_depth}"
+        )
+
+    return bit_depth
+
+
+def get_bit_depth(max_value: int) -> int:
+    """
+    Gets the bit depth of a Netpbm image from its maximum value.
+
+    :param max_value:
+        An int representing the maximum value from the image header.
+
+    :return:
+        An int representing the bits per sample, e.g. 12 for a max_value of 4095
+        (or 4000). Maximum values below 255 give 8 bits, so the level shift and
+        the chroma centers stay those of 8-bit images.
+    """
+    return check_bit_depth(
+        max(int(max_value).bit_length(), constants.MIN_NETPBM_BIT_DEPTH)
+    )
+
+
+def get_level_shift(bit_depth: int = constants.DEFAULT_BIT_DEPTH) -> int:
+    """
+    Gets the level shift and chroma offset for a bit depth.
+
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+
+    :return:
+        An int equal to 2^(bit_depth - 1), i.e. 128 for 8-bit images.
+    """
+    return 1 << (check_bit_depth(bit_depth) - 1)
+
+
+def get_max_pixel_value(
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH, max_value: int = None
+) -> int:
+    """
+    Gets the maximum sample value for a bit depth.
+
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header. Defaults to None (the full range of the bit depth).
+
+    :return:
+        An int equal to max_value if given, else 2^bit_depth - 1, i.e. 255 for
+        8-bit images.
+    """
+    full_max_value = (1 << check_bit_depth(bit_depth)) - 1
+
+    if max_value is None:
+        return full_max_value
+
+    if not 1 <= max_value <= full_max_value:
+        raise ValueError(
+            f"Expected max_value to be in [1, {full_max_value}] for {bit_depth} bits, "
+            f"got {max_value}"
+        )
+
+    return int(max_value)
+
+
+class PrecisionPolicy:
+    """
+    A class describing the dtypes every pipeline stage works in.
+
+    Accuracy of FLOAT32_POLICY against FLOAT64_POLICY: let u be the unit roundoff of
+    the compute dtype (2^-24 for float32) and S the largest level-shifted color
+    component, e.g. 383 for 8-bit YCbCr. A DCT coefficient sums 64 terms of weight
+    at most 1 / 4, so the value encode_image rounds is within
+    E = 16 * ENCODE_ROUNDING_ERRORS * u * S of the exact one, i.e. within 0.03 for
+    8-bit YCbCr under float32 (get_coefficient_error_bound). A coefficient quantized
+    with a step q can therefore only differ between the two policies if its float64
+    value lies within (E32 + E64) / q of a rounding boundary, which for evenly
+    spread values is a fraction of about 2 (E32 + E64) / q of them, under 0.6% for
+    8-bit images and q >= 10. It then differs by 1 as long as (E32 + E64) / q is
+    below 1 / 2, which holds up to 14 bits per sample.
+
+    reconstruct_image computes every sample as c M + o, with M the 192x192 matrix of
+    get_color_reconstruction_matrix, and stays within
+    DECODE_ROUNDING_ERRORS * u * (|c| |M| + |o|) of the exact value
+    (get_reconstruction_error_bound). So a sample decoded under the two policies
+    differs by at most 1 + |c32 - c64| |M| plus both of those bounds: by 1 in blocks
+    without a changed coefficient, and by at most 43 more per changed coefficient
+    for 8-bit YCbCr and the K1 and K2 tables. The float32_policy stages of the
+    equivalence harness check both bounds.
+    """
+
+    def __init__(
+        self,
+        compute_dtype=constants.REFERENCE_COMPUTE_DTYPE,
+        coefficient_dtype=constants.REFERENCE_COEFFICIENT_DTYPE,
+        pixel_dtype=constants.PIXEL_DTYPE,
+        in_place: bool = False,
+    ):
+        self._compute_dtype = np.dtype(compute_dtype)
+        self._coefficient_dtype = np.dtype(coefficient_dtype)
+        self._pixel_dtype = np.dtype(pixel_dtype)
+        self._in_place = in_place
+
+    # region Properties
+    @property
+    def compute_dtype(self) -> np.dtype:
+        """
+        The compute dtype property.
+
+        :return:
+            A np.dtype used for color conversion and the DCT.
+        """
+        return self._compute_dtype
+
+    @property
+    def coefficient_dtype(self) -> np.dtype:
+        """
+        The coefficient dtype property.
+
+        :return:
+            A np.dtype used for quantized coefficients.
+        """
+        return self._coefficient_dtype
+
+    @property
+    def pixel_dtype(self) -> np.dtype:
+        """
+        The pixel dtype property.
+
+        :return:
+            A np.dtype used for decoded pixels.
+        """
+        return self._pixel_dtype
+
+    @property
+    def in_place(self) -> bool:
+        """
+        The in place property.
+
+        :return:
+            A bool; True if intermediate arrays owned by the pipeline are modified in
+            place instead of being copied.
+        """
+        return self._in_place
+
+    # endregion
+
+    def get_coefficient_dtype(
+        self, bit_depth: int = constants.DEFAULT_BIT_DEPTH
+    ) -> np.dtype:
+        """
+        Gets the dtype quantized coefficients of an image are stored in.
+
+        The coefficient dtype of the policy is only widened when a coefficient
+        quantized with a step of 1 might not fit into it.
+
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+
+        :return:
+            A np.dtype wide enough for the quantized coefficients.
+        """
+        # A coefficient sums 64 terms bound by 2^(bit_depth - 1) / 4.
+        return np.promote_types(
+            self._coefficient_dtype,
+            np.min_scalar_type(-(2 ** (check_bit_depth(bit_depth) + 3)) - 1),
+        )
+
+    def get_pixel_dtype(self, bit_depth: int = constants.DEFAULT_BIT_DEPTH) -> np.dtype:
+        """
+        Gets the dtype decoded pixels of an image are stored in.
+
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+
+        :return:
+            A np.dtype wide enough for the decoded pixels.
+        """
+        return np.promote_types(
+            self._pixel_dtype, np.min_scalar_type(get_max_pixel_value(bit_depth))
+        )
+
+    def get_coefficient_error_bound(
+        self,
+        bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+        color_transform: str = DEFAULT_COLOR_TRANSFORM,
+    ) -> float:
+        """
+        Gets how far the DCT coefficients of encode_image can be from the exact ones
+        before they are rounded.
+
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+        :param color_transform:
+            (Optional) A string representing the name of a registered color
+            transform. Defaults to "jfif".
+
+        :return:
+            A float bounding the absolute error of every DCT coefficient.
+        """
+        transform = get_color_transform(color_transform)
+        max_pixel_value = get_max_pixel_value(bit_depth)
+        offsets = transform.get_offset_vector(
+            bit_depth, shift=-get_level_shift(bit_depth)
+        )
+
+        # Every level-shifted color component is bound by S, and a DCT coefficient
+        # sums 64 of them with weights of at most 1 / 4.
+        max_component = np.max(
+            np.sum(np.abs(transform.forward_matrix), axis=1) * max_pixel_value
+            + np.abs(offsets)
+        )
+        unit_roundoff = np.finfo(self._compute_dtype).eps / 2
+
+        return float(
+            16 * constants.ENCODE_ROUNDING_ERRORS * unit_roundoff * max_component
+        )
+
+    def get_reconstruction_error_bound(self, magnitudes: np.ndarray) -> np.ndarray:
+        """
+        Gets how far the samples of reconstruct_image can be from the exact ones
+        before they are rounded.
+
+        :param magnitudes:
+            A np.ndarray containing the sums of the absolute values of the terms of
+            every sample, i.e. |c| |M| + |o| for coefficients c, the reconstruction
+            matrix M and the offsets o.
+
+        :return:
+            A np.ndarray of the same shape bounding the absolute error of every
+            sample.
+        """
+        unit_roundoff = np.finfo(self._compute_dtype).eps / 2
+
+        return constants.DECODE_ROUNDING_ERRORS * unit_roundoff * magnitudes
+
+
+FLOAT64_POLICY = PrecisionPolicy()
+FLOAT32_POLICY = PrecisionPolicy(
+    compute_dtype=constants.FAST_COMPUTE_DTYPE,
+    coefficient_dtype=constants.FAST_COEFFICIENT_DTYPE,
+    in_place=True,
+)
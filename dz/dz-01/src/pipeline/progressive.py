@@ -0,0 +1,162 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Tuple
+
+import numpy as np
+
+from . import constants
+from .intra_coding import blocks_to_rgb
+from .precision import FLOAT64_POLICY, PrecisionPolicy
+from ..quantization.ycbcr_quantization import get_quantization_tensor
+from ..transformations.constants import DEFAULT_COLOR_TRANSFORM
+from ..transformations.image_transformations import get_dct_basis, get_dct_weights
+from ..transformations.matrix_transformations import get_zigzag_indices
+
+
+def to_spectral_layout(zigzagged_blocks: np.ndarray) -> np.ndarray:
+    """
+    Reorders zigzagged blocks so coefficients are grouped by frequency.
+
+    The result holds the DC plane of every block first, then the first AC
+    coefficient of every block and so on, so any prefix of it (in C order) is a
+    complete set of spectral bands.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64, usually the output of encode_image.
+
+    :return:
+        A C contiguous np.ndarray of shape 64x3xAxB.
+    """
+    return np.ascontiguousarray(np.moveaxis(zigzagged_blocks, (3, 2), (0, 1)))
+
+
+def from_spectral_layout(spectral_layout: np.ndarray) -> np.ndarray:
+    """
+    Undoes to_spectral_layout.
+
+    :param spectral_layout:
+        A np.ndarray of shape 64x3xAxB.
+
+    :return:
+        A np.ndarray of shape AxBx3x64.
+    """
+    return np.ascontiguousarray(np.moveaxis(spectral_layout, (0, 1), (3, 2)))
+
+
+def get_band_slice(
+    band_index: int, band_edges: Tuple[int, ...] = constants.DEFAULT_BAND_EDGES
+) -> slice:
+    """
+    Gets the part of the spectral layout holding a single band.
+
+    :param band_index:
+        An int representing the index of the band.
+    :param band_edges:
+        (Optional) A tuple of ints representing the zigzag positions the bands
+        start at, ending with 64.
+
+    :return:
+        A slice over the first axis of the spectral layout.
+    """
+    return slice(band_edges[band_index], band_edges[band_index + 1])
+
+
+def render_preview(
+    spectral_layout: np.ndarray,
+    n_bands: int,
+    quantization_tensor: np.ndarray = None,
+    band_edges: Tuple[int, ...] = constants.DEFAULT_BAND_EDGES,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    max_value: int = None,
+    color_transform: str = DEFAULT_COLOR_TRANSFORM,
+) -> np.ndarray:
+    """
+    Renders an RGB preview from the first few spectral bands.
+
+    The missing coefficients are treated as zeros. Since the first n zigzag
+    positions all lie within the top left kxk corner of a block, the IDCT is
+    truncated to that corner, which makes previews from few bands cheap.
+
+    :param spectral_layout:
+        A np.ndarray of shape Nx3xAxB, where N is at least the end of the last
+        requested band; the rest of the layout is not needed.
+    :param n_bands:
+        An int representing the number of bands to render from.
+    :param quantization_tensor:
+        (Optional) A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+        Defaults to the K1 and K2 tables.
+    :param band_edges:
+        (Optional) A tuple of ints representing the zigzag positions the bands
+        start at, ending with 64.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header; reconstructed samples are clipped to it. Defaults to
+        None (2^bit_depth - 1).
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+
+    :return:
+        A np.ndarray of shape 8Ax8Bx3 containing the RGB preview in the pixel dtype
+        of the policy, widened if the bit depth needs it.
+    """
+    if quantization_tensor is None:
+        quantization_tensor = get_quantization_tensor()
+
+    n_coefficients = band_edges[n_bands]
+
+    if len(spectral_layout) < n_coefficients:
+        raise ValueError(
+            f"Expected at least {n_coefficients} coefficient planes for {n_bands} "
+            f"bands, got {len(spectral_layout)}"
+        )
+
+    zigzag_indices = get_zigzag_indices()[:n_coefficients]
+    rows, columns = np.divmod(zigzag_indices, 8)
+    size = int(max(np.max(rows, initial=0), np.max(columns, initial=0))) + 1
+
+    # Dequantize and scatter the kept coefficients into the kxk corners, ending up
+    # with AxBxkxkx3 blocks.
+    dct_blocks = np.zeros(
+        spectral_layout.shape[2:] + (size, size, 3), dtype=policy.compute_dtype
+    )
+    dct_blocks[:, :, rows, columns] = np.moveaxis(
+        spectral_layout[:n_coefficients]
+        * quantization_tensor[rows, columns][..., np.newaxis, np.newaxis],
+        (0, 1),
+        (2, 3),
+    )
+
+    basis = get_dct_basis()[:size].astype(policy.compute_dtype)
+    weights = get_dct_weights()[:size, :size, np.newaxis] / 4
+    dct_blocks *= weights.astype(policy.compute_dtype)
+
+    # f = B^T (F * W / 4) B per component, with B cut down to its first k rows.
+    pixel_blocks = np.moveaxis(
+        basis.T @ np.moveaxis(dct_blocks, -1, -3) @ basis, -3, -1
+    )
+
+    return blocks_to_rgb(
+        pixel_blocks,
+        policy=policy,
+        bit_depth=bit_depth,
+        max_value=max_value,
+        color_transform=color_transform,
+    )
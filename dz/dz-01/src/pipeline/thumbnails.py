@@ -0,0 +1,125 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import numpy as np
+
+from . import constants
+from .intra_coding import blocks_to_rgb
+from .precision import FLOAT64_POLICY, PrecisionPolicy
+from ..quantization.ycbcr_quantization import get_quantization_tensor
+from ..transformations.constants import DEFAULT_COLOR_TRANSFORM
+from ..transformations.image_transformations import get_dct_basis, get_dct_weights
+from ..transformations.matrix_transformations import get_zigzag_indices
+
+
+def get_reduced_idct_basis(size: int) -> np.ndarray:
+    """
+    Gets the basis of an IDCT which outputs size x size pixels per block.
+
+    Every output pixel is the mean of the 8 / size x 8 / size pixels of the full
+    IDCT it covers, so a reduced IDCT over the top left size x size coefficients is
+    a box filtered, low passed 8x8 IDCT.
+
+    :param size:
+        An int, one of 1, 2, 4 or 8, representing the output block size.
+
+    :return:
+        A np.ndarray of shape size x size: the element at (u, x) is the mean of
+        cos((2i + 1) * u * pi / 16) over the pixels i averaged into x.
+    """
+    return get_dct_basis()[:size].reshape(size, size, 8 // size).mean(axis=-1)
+
+
+def get_thumbnail(
+    zigzagged_blocks: np.ndarray,
+    scale: int = 8,
+    quantization_tensor: np.ndarray = None,
+    policy: PrecisionPolicy = FLOAT64_POLICY,
+    bit_depth: int = constants.DEFAULT_BIT_DEPTH,
+    max_value: int = None,
+    color_transform: str = DEFAULT_COLOR_TRANSFORM,
+) -> np.ndarray:
+    """
+    Builds a downscaled RGB image straight from quantized coefficients.
+
+    Only the top left 8 / scale x 8 / scale coefficients of every block are
+    dequantized and run through a reduced IDCT, so the full size image is never
+    reconstructed. At scale 8 this uses only the DC coefficient: every pixel is
+    the mean of its block.
+
+    :param zigzagged_blocks:
+        A np.ndarray of shape AxBx3x64, usually the output of encode_image.
+    :param scale:
+        (Optional) An int, one of 2, 4 or 8, representing the factor the image is
+        shrunk by. Defaults to 8.
+    :param quantization_tensor:
+        (Optional) A np.ndarray of shape 8x8x3 the coefficients were quantized with.
+        Defaults to the K1 and K2 tables.
+    :param policy:
+        (Optional) A PrecisionPolicy the stages work in. Defaults to FLOAT64_POLICY.
+    :param bit_depth:
+        (Optional) An int representing the bits per sample. Defaults to 8.
+    :param max_value:
+        (Optional) An int representing the maximum value of the image, e.g. from
+        its Netpbm header; reconstructed samples are clipped to it. Defaults to
+        None (2^bit_depth - 1).
+    :param color_transform:
+        (Optional) A string representing the name of a registered color transform.
+        Defaults to "jfif".
+
+    :return:
+        A np.ndarray of shape (8A / scale)x(8B / scale)x3 containing the RGB
+        thumbnail in the pixel dtype of the policy, widened if the bit depth needs it.
+    """
+    if scale not in constants.THUMBNAIL_SCALES:
+        raise ValueError(
+            f"Expected scale to be one of {constants.THUMBNAIL_SCALES}, got {scale}"
+        )
+
+    if quantization_tensor is None:
+        quantization_tensor = get_quantization_tensor()
+
+    size = 8 // scale
+
+    # Zigzag positions of the top left size x size coefficients, in row major order.
+    zigzag_positions = np.argsort(get_zigzag_indices())
+    zigzag_positions = zigzag_positions.reshape(8, 8)[:size, :size].ravel()
+
+    # AxBx3x(size * size) -> AxBxsizexsizex3
+    dct_blocks = np.moveaxis(
+        zigzagged_blocks[..., zigzag_positions].reshape(
+            zigzagged_blocks.shape[:-1] + (size, size)
+        ),
+        -3,
+        -1,
+    ).astype(policy.compute_dtype)
+    dct_blocks *= (
+        quantization_tensor[:size, :size]
+        * get_dct_weights()[:size, :size, np.newaxis]
+        / 4
+    ).astype(policy.compute_dtype)
+
+    # f = M^T (F * W / 4) M per component, M being the reduced basis.
+    basis = get_reduced_idct_basis(size).astype(policy.compute_dtype)
+    pixel_blocks = np.moveaxis(
+        basis.T @ np.moveaxis(dct_blocks, -1, -3) @ basis, -3, -1
+    )
+
+    return blocks_to_rgb(
+        pixel_blocks,
+        policy=policy,
+        bit_depth=bit_depth,
+        max_value=max_value,
+        color_transform=color_transform,
+    )
@@ -0,0 +1,241 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from . import constants
+from .ycbcr_quantization import dequantize, get_quantization_tensor, quantize
+from ..transformations.image_transformations import (
+    dct_2d,
+    get_dct_basis,
+    get_dct_weights,
+)
+
+
+def estimate_entropy_size(quantized_blocks: np.ndarray) -> int:
+    """
+    Estimates the entropy coded size of quantized blocks.
+
+    Every coefficient is split into a size category (its bit length) and amplitude
+    bits. Categories are charged their zeroth-order entropy per component, amplitude
+    bits are charged as is.
+
+    :param quantized_blocks:
+        A np.ndarray of shape AxBx8x8x3 containing quantized coefficients.
+
+    :return:
+        An int representing the estimated size in bytes.
+    """
+    categories = np.frexp(np.abs(quantized_blocks))[1].reshape(-1, 3)
+    total_bits = float(np.sum(categories))
+
+    for component_categories in categories.T:
+        counts = np.bincount(component_categories)
+        probabilities = counts[counts > 0] / len(component_categories)
+        total_bits -= len(component_categories) * np.sum(
+            probabilities * np.log2(probabilities)
+        )
+
+    return int(np.ceil(total_bits / 8))
+
+
+class AdaptiveQuantizer:
+    """
+    A class for finding the quantization quality of a single image.
+
+    The DCT of the image is computed only once; every quality that is tried only
+    reruns quantization and size or distortion estimation, and the results are
+    cached per quality.
+    """
+
+    def __init__(
+        self,
+        dct_blocks: np.ndarray,
+        y_table=constants.K1_TABLE,
+        cb_table=constants.K2_TABLE,
+        cr_table=constants.K2_TABLE,
+    ):
+        self._dct_blocks = np.array(dct_blocks, dtype=np.float64)
+        self._tables = (y_table, cb_table, cr_table)
+
+        self._dct_basis = get_dct_basis()
+        self._dct_weights = get_dct_weights()[..., np.newaxis] / 4
+
+        self._psnr_cache: Dict[int, float] = dict()
+        self._size_cache: Dict[int, int] = dict()
+
+    @classmethod
+    def from_pixel_blocks(
+        cls, pixel_blocks: np.ndarray, verbose: int = 0, **kwargs
+    ) -> "AdaptiveQuantizer":
+        """
+        Creates an AdaptiveQuantizer by running the DCT on pixel blocks once.
+
+        :param pixel_blocks:
+            A np.ndarray of shape AxBx8x8x3, where A = H/8, B = W/8.
+        :param verbose:
+            An int; if greater than 0 will print out a tqdm progress bar for the DCT.
+        :param kwargs:
+            Keyword arguments passed on to the AdaptiveQuantizer constructor.
+
+        :return:
+            An AdaptiveQuantizer for the given pixel blocks.
+        """
+        return cls(dct_blocks=dct_2d(pixel_blocks, verbose=verbose), **kwargs)
+
+    # region Properties
+    @property
+    def dct_blocks(self) -> np.ndarray:
+        """
+        The cached DCT blocks.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3 containing the DCT of the image.
+        """
+        return np.copy(self._dct_blocks)
+
+    # endregion
+
+    def get_quantization_tensor(self, quality: int) -> np.ndarray:
+        """
+        Gets the quantization tensor for a given quality.
+
+        :param quality:
+            An int in [1, 100] representing the quality.
+
+        :return:
+            A np.ndarray of shape 8x8x3 used to quantize DCT blocks.
+        """
+        return get_quantization_tensor(*self._tables, quality=quality)
+
+    def quantize(self, quality: int) -> np.ndarray:
+        """
+        Quantizes the cached DCT blocks with a given quality.
+
+        :param quality:
+            An int in [1, 100] representing the quality.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3: the quantization result.
+        """
+        return quantize(self._dct_blocks, self.get_quantization_tensor(quality))
+
+    def get_psnr(self, quality: int) -> float:
+        """
+        Gets the PSNR of the quantization error for a given quality.
+
+        The error is the IDCT of the difference between the dequantized and the
+        original DCT blocks, i.e. the image is compared to its unquantized
+        reconstruction.
+
+        :param quality:
+            An int in [1, 100] representing the quality.
+
+        :return:
+            A float representing the PSNR in dB (inf if there is no error).
+        """
+        if quality not in self._psnr_cache:
+            quantization_tensor = self.get_quantization_tensor(quality)
+            error_blocks = (
+                dequantize(
+                    quantize(self._dct_blocks, quantization_tensor), quantization_tensor
+                )
+                - self._dct_blocks
+            )
+            error_pixels = np.einsum(
+                "ui,abuvc,vj->abijc",
+                self._dct_basis,
+                error_blocks * self._dct_weights,
+                self._dct_basis,
+                optimize=True,
+            )
+            mse = np.mean(np.square(error_pixels))
+
+            self._psnr_cache[quality] = (
+                np.inf
+                if mse == 0
+                else 10 * np.log10(constants.PSNR_PEAK_VALUE ** 2 / mse)
+            )
+
+        return self._psnr_cache[quality]
+
+    def get_size(self, quality: int) -> int:
+        """
+        Gets the estimated entropy coded size for a given quality.
+
+        :param quality:
+            An int in [1, 100] representing the quality.
+
+        :return:
+            An int representing the estimated size in bytes.
+        """
+        if quality not in self._size_cache:
+            self._size_cache[quality] = estimate_entropy_size(self.quantize(quality))
+
+        return self._size_cache[quality]
+
+    def _bisect(self, is_acceptable: Callable[[int], bool], lowest: bool) -> int:
+        low, high = constants.MIN_QUALITY, constants.MAX_QUALITY
+
+        while low < high:
+            if lowest:
+                middle = (low + high) // 2
+
+                if is_acceptable(middle):
+                    high = middle
+                else:
+                    low = middle + 1
+            else:
+                middle = (low + high + 1) // 2
+
+                if is_acceptable(middle):
+                    low = middle
+                else:
+                    high = middle - 1
+
+        return low
+
+    def search_psnr(self, target_psnr: float) -> Tuple[int, np.ndarray]:
+        """
+        Finds the lowest quality which reaches a target PSNR.
+
+        If no quality reaches the target, the maximum quality is returned.
+
+        :param target_psnr:
+            A float representing the minimum acceptable PSNR in dB.
+
+        :return:
+            A tuple containing the found quality and its 8x8x3 quantization tensor.
+        """
+        quality = self._bisect(lambda x: self.get_psnr(x) >= target_psnr, lowest=True)
+
+        return quality, self.get_quantization_tensor(quality)
+
+    def search_size(self, target_size: int) -> Tuple[int, np.ndarray]:
+        """
+        Finds the highest quality which fits into a target size.
+
+        If no quality fits, the minimum quality is returned.
+
+        :param target_size:
+            An int representing the maximum acceptable size in bytes.
+
+        :return:
+            A tuple containing the found quality and its 8x8x3 quantization tensor.
+        """
+        quality = self._bisect(lambda x: self.get_size(x) <= target_size, lowest=False)
+
+        return quality, self.get_quantization_tensor(quality)
@@ -12,6 +12,21 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+QUALITY_SCALE_PIVOT = 50
+MIN_QUANTIZATION_VALUE = 1
+MAX_QUANTIZATION_VALUE = 255
+
+PSNR_PEAK_VALUE = 255
+
+# Rounding offset for AC coefficients in dead zone quantization; 0.5 would be
+# plain rounding, smaller values zero out more of the small coefficients.
+DEFAULT_DEAD_ZONE_ROUNDING = 1 / 3
+
+# Background and region of interest qualities for quality maps.
+DEFAULT_ROI_QUALITIES = (25, 85)
+
 K1_TABLE = (
     (16, 11, 10, 16, 24, 40, 51, 61),
     (12, 12, 14, 19, 26, 58, 60, 55),
@@ -0,0 +1,190 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from . import constants
+from .ycbcr_quantization import dequantize, get_quantization_tensor, quantize
+
+
+def get_mask_quality_map(
+    mask: np.ndarray,
+    block_width: int = 8,
+    block_height: int = 8,
+    min_coverage: float = 0,
+) -> np.ndarray:
+    """
+    Derives a two level quality map from a region of interest mask.
+
+    :param mask:
+        A np.ndarray of shape HxW; nonzero pixels belong to the region of interest.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+    :param min_coverage:
+        (Optional) A float in [0, 1); a block is in the region of interest if more
+        than this share of its pixels is. Defaults to 0 (any pixel).
+
+    :return:
+        A np.ndarray of shape AxB containing 1 for blocks in the region of interest
+        and 0 for the rest, where A = H / block_height and B = W / block_width.
+    """
+    n_block_rows = mask.shape[0] // block_height
+    n_block_columns = mask.shape[1] // block_width
+
+    coverage = np.mean(
+        mask[: n_block_rows * block_height, : n_block_columns * block_width].reshape(
+            n_block_rows, block_height, n_block_columns, block_width
+        )
+        != 0,
+        axis=(1, 3),
+    )
+
+    return (coverage > min_coverage).astype(np.intp)
+
+
+def get_variance_quality_map(block_variances: np.ndarray, n_levels: int) -> np.ndarray:
+    """
+    Derives a quality map from the variance of every block.
+
+    Blocks are split into n_levels groups of (roughly) equal size by their
+    variance, so detailed blocks such as text and edges get the highest level and
+    flat background blocks the lowest.
+
+    :param block_variances:
+        A np.ndarray of shape AxB containing block variances, e.g. the luma
+        variances get_block_statistics(pixel_blocks)["variance"][..., 0].
+    :param n_levels:
+        An int representing the number of quality levels.
+
+    :return:
+        A np.ndarray of shape AxB containing levels in [0, n_levels - 1].
+    """
+    thresholds = np.quantile(block_variances, np.arange(1, n_levels) / n_levels)
+
+    return np.searchsorted(thresholds, block_variances, side="right")
+
+
+class QualityMapQuantizer:
+    """
+    A class for quantizing every block with its own quality.
+
+    The quantization tensors of a small set of qualities are scaled once and
+    stacked; a quality map of indices into that set then picks the tensor of every
+    block with a single gather, so there are no per-block loops.
+    """
+
+    def __init__(
+        self,
+        qualities: Sequence[int] = constants.DEFAULT_ROI_QUALITIES,
+        y_table=constants.K1_TABLE,
+        cb_table=constants.K2_TABLE,
+        cr_table=constants.K2_TABLE,
+    ):
+        self._qualities = tuple(qualities)
+        self._tensors = np.stack(
+            [
+                get_quantization_tensor(y_table, cb_table, cr_table, quality=quality)
+                for quality in self._qualities
+            ]
+        )
+        self._tensors.flags.writeable = False
+
+    # region Properties
+    @property
+    def qualities(self) -> Tuple[int, ...]:
+        """
+        The qualities property.
+
+        :return:
+            A tuple of ints representing the quality of every level.
+        """
+        return self._qualities
+
+    @property
+    def tensors(self) -> np.ndarray:
+        """
+        The quantization tensors property.
+
+        :return:
+            A np.ndarray of shape Qx8x8x3 containing the quantization tensor of
+            every level.
+        """
+        return np.copy(self._tensors)
+
+    # endregion
+
+    def get_block_tensors(self, quality_map: np.ndarray) -> np.ndarray:
+        """
+        Gathers the quantization tensor of every block.
+
+        :param quality_map:
+            A np.ndarray of shape AxB containing level indices.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3, which quantize and dequantize broadcast
+            over the blocks directly.
+        """
+        quality_map = np.asarray(quality_map)
+
+        if quality_map.size != 0 and not (
+            0 <= quality_map.min() and quality_map.max() < len(self._qualities)
+        ):
+            raise ValueError(
+                f"Expected quality map levels in [0, {len(self._qualities) - 1}], "
+                f"got [{quality_map.min()}, {quality_map.max()}]"
+            )
+
+        return self._tensors[quality_map]
+
+    def quantize(
+        self, dct_blocks: np.ndarray, quality_map: np.ndarray, dtype=int
+    ) -> np.ndarray:
+        """
+        Quantizes every block with the quality its level in the map points to.
+
+        :param dct_blocks:
+            A np.ndarray of shape AxBx8x8x3 containing DCT blocks.
+        :param quality_map:
+            A np.ndarray of shape AxB containing level indices.
+        :param dtype:
+            (Optional) The integer dtype of the result. Defaults to int.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3: the quantization result.
+        """
+        return quantize(dct_blocks, self.get_block_tensors(quality_map), dtype=dtype)
+
+    def dequantize(
+        self, quantized_blocks: np.ndarray, quality_map: np.ndarray, dtype=int
+    ) -> np.ndarray:
+        """
+        Dequantizes blocks quantized with the same quality map.
+
+        :param quantized_blocks:
+            A np.ndarray of shape AxBx8x8x3 containing quantized coefficients.
+        :param quality_map:
+            A np.ndarray of shape AxB containing level indices.
+        :param dtype:
+            (Optional) The dtype of the result. Defaults to int.
+
+        :return:
+            A np.ndarray of shape AxBx8x8x3: the dequantization result.
+        """
+        return dequantize(
+            quantized_blocks, self.get_block_tensors(quality_map), dtype=dtype
+        )
@@ -17,8 +17,44 @@ import numpy as np
 from . import constants
 
 
+def scale_quantization_table(table, quality: int) -> np.ndarray:
+    """
+    Scales a quantization table to a given quality.
+
+    Uses the IJG convention: a quality of 50 leaves the table as is, lower qualities
+    make the steps coarser and higher qualities make them finer.
+
+    :param table:
+        A table of shape 8x8 you wish to scale.
+    :param quality:
+        An int in [1, 100] representing the target quality.
+
+    :return:
+        A np.ndarray of shape 8x8: the scaled quantization table.
+    """
+    if not constants.MIN_QUALITY <= quality <= constants.MAX_QUALITY:
+        raise ValueError(
+            f"Expected quality to be in "
+            f"[{constants.MIN_QUALITY}, {constants.MAX_QUALITY}], got {quality}"
+        )
+
+    if quality < constants.QUALITY_SCALE_PIVOT:
+        scale = 5000 / quality
+    else:
+        scale = 200 - 2 * quality
+
+    return np.clip(
+        np.floor((np.array(table) * scale + 50) / 100),
+        constants.MIN_QUANTIZATION_VALUE,
+        constants.MAX_QUANTIZATION_VALUE,
+    ).astype(int)
+
+
 def get_quantization_tensor(
-    y_table=constants.K1_TABLE, cb_table=constants.K2_TABLE, cr_table=constants.K2_TABLE
+    y_table=constants.K1_TABLE,
+    cb_table=constants.K2_TABLE,
+    cr_table=constants.K2_TABLE,
+    quality: int = None,
 ) -> np.ndarray:
     """
     Gets a tensor used to quantize DCT blocks.
@@ -29,15 +65,33 @@ def get_quantization_tensor(
         A table representing the quantization table for the Cb component of an image.
     :param cr_table:
         A table representing the quantization table for the Cr component of an image.
+    :param quality:
+        (Optional) An int in [1, 100]; if given, every table is scaled to this
+        quality first. Defaults to None (tables are used as is).
 
     :return:
         A np.ndarray of shape 8x8x3 used to quantize DCT blocks.
     """
-    return np.stack([y_table, cb_table, cr_table]).transpose((1, 2, 0))
+    tables = (y_table, cb_table, cr_table)
 
+    if quality is not None:
+        tables = tuple(scale_quantization_table(x, quality) for x in tables)
 
-def quantize_pixel_block(
+    return np.stack(tables).transpose((1, 2, 0))
+
+
+def _as_compute_tensor(
     pixel_block: np.ndarray, quantization_tensor: np.ndarray
+) -> np.ndarray:
+    # Floating point blocks are divided in their own precision, not promoted.
+    if np.issubdtype(np.asarray(pixel_block).dtype, np.floating):
+        return np.asarray(quantization_tensor, dtype=pixel_block.dtype)
+
+    return quantization_tensor
+
+
+def quantize_pixel_block(
+    pixel_block: np.ndarray, quantization_tensor: np.ndarray, dtype=int
 ) -> np.ndarray:
     """
     Quantizes a single pixel block.
@@ -46,14 +100,20 @@ def quantize_pixel_block(
         A np.ndarray of shape 8x8x3 you wish to quantize.
     :param quantization_tensor:
         A np.ndarray of shape 8x8x3 you wish to quantize with.
+    :param dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
 
     :return:
         A np.ndarray of shape 8x8x3: the quantization result.
     """
-    return np.rint(pixel_block / quantization_tensor).astype(int)
+    return np.rint(
+        pixel_block / _as_compute_tensor(pixel_block, quantization_tensor)
+    ).astype(dtype)
 
 
-def quantize(pixel_blocks: np.ndarray, quantization_tensor: np.ndarray) -> np.ndarray:
+def quantize(
+    pixel_blocks: np.ndarray, quantization_tensor: np.ndarray, dtype=int
+) -> np.ndarray:
     """
     Quantizes an image comprised of pixel blocks.
 
@@ -62,25 +122,58 @@ def quantize(pixel_blocks: np.ndarray, quantization_tensor: np.ndarray) -> np.nd
         the original image, respectively.
     :param quantization_tensor:
         A np.ndarray of shape 8x8x3 you with to quantize the pixel blocks with.
+    :param dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
 
     :return:
         A np.ndarray of shape AxBx8x8x3: the quantization result.
     """
-    to_return = list()
+    # The block operation broadcasts over the AxB block grid as well.
+    return quantize_pixel_block(pixel_blocks, quantization_tensor, dtype=dtype)
 
-    for pixel_block_row in pixel_blocks:
-        current_row = list()
 
-        for pixel_block in pixel_block_row:
-            current_row.append(quantize_pixel_block(pixel_block, quantization_tensor))
+def dead_zone_quantize(
+    pixel_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    rounding: float = constants.DEFAULT_DEAD_ZONE_ROUNDING,
+    dtype=int,
+) -> np.ndarray:
+    """
+    Quantizes an image comprised of pixel blocks with a dead zone.
 
-        to_return.append(current_row)
+    AC coefficients are quantized as sign(x) * floor(|x| / q + rounding), so with a
+    rounding below 0.5 values just above a rounding boundary are rounded towards
+    zero, which widens the zero bin. DC coefficients are rounded to the nearest
+    integer as in quantize, since errors there show up as blocking.
 
-    return np.array(to_return)
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8x3, where 8A and 8B are the height and width of
+        the original image, respectively.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8x3 you with to quantize the pixel blocks with.
+    :param rounding:
+        (Optional) A float in [0, 0.5] representing the rounding offset of AC
+        coefficients. Defaults to 1/3.
+    :param dtype:
+        (Optional) The integer dtype of the result. Defaults to int.
+
+    :return:
+        A np.ndarray of shape AxBx8x8x3: the quantization result.
+    """
+    if not 0 <= rounding <= 0.5:
+        raise ValueError(f"Expected rounding to be in [0, 0.5], got {rounding}")
+
+    scaled_blocks = pixel_blocks / _as_compute_tensor(pixel_blocks, quantization_tensor)
+    quantized_blocks = np.copysign(
+        np.floor(np.abs(scaled_blocks) + rounding), scaled_blocks
+    )
+    quantized_blocks[..., 0, 0, :] = np.rint(scaled_blocks[..., 0, 0, :])
+
+    return quantized_blocks.astype(dtype)
 
 
 def dequantize_pixel_block(
-    pixel_block: np.ndarray, quantization_tensor: np.ndarray
+    pixel_block: np.ndarray, quantization_tensor: np.ndarray, dtype=int
 ) -> np.ndarray:
     """
     Dequantizes a single pixel block.
@@ -89,14 +182,18 @@ def dequantize_pixel_block(
         A np.ndarray of shape 8x8x3 you wish to dequantize.
     :param quantization_tensor:
         A np.ndarray of shape 8x8x3 you wish to dequantize with.
+    :param dtype:
+        (Optional) The dtype of the result. Defaults to int.
 
     :return:
         A np.ndarray of shape 8x8x3: the dequantization result.
     """
-    return np.rint(pixel_block * quantization_tensor).astype(int)
+    return np.rint(pixel_block * quantization_tensor).astype(dtype)
 
 
-def dequantize(pixel_blocks: np.ndarray, quantization_tensor: np.ndarray) -> np.ndarray:
+def dequantize(
+    pixel_blocks: np.ndarray, quantization_tensor: np.ndarray, dtype=int
+) -> np.ndarray:
     """
     Dequantizes an image comprised of pixel blocks.
 
@@ -105,18 +202,11 @@ def dequantize(pixel_blocks: np.ndarray, quantization_tensor: np.ndarray) -> np.
         the original image, respectively.
     :param quantization_tensor:
         A np.ndarray of shape 8x8x3 you with to dequantize the pixel blocks with.
+    :param dtype:
+        (Optional) The dtype of the result. Defaults to int.
 
     :return:
         A np.ndarray of shape AxBx8x8x3: the dequantization result.
     """
-    to_return = list()
-
-    for pixel_block_row in pixel_blocks:
-        current_row = list()
-
-        for pixel_block in pixel_block_row:
-            current_row.append(dequantize_pixel_block(pixel_block, quantization_tensor))
-
-        to_return.append(current_row)
-
-    return np.array(to_return)
+    # The block operation broadcasts over the AxB block grid as well.
+    return dequantize_pixel_block(pixel_blocks, quantization_tensor, dtype=dtype)
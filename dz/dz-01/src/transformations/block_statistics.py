@@ -0,0 +1,194 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Tuple
+
+import numpy as np
+
+from . import constants
+
+
+def _get_block_rows(pixel_blocks: np.ndarray) -> np.ndarray:
+    # AxBxCxDxE -> AxBxExCxD -> (ABE)x(CD), so every block and component is a
+    # contiguous row.
+    return np.ascontiguousarray(
+        np.moveaxis(pixel_blocks, -1, -3), dtype=np.float64
+    ).reshape(-1, pixel_blocks.shape[2] * pixel_blocks.shape[3])
+
+
+def _get_row_moments(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    means = (rows @ np.ones(rows.shape[-1])) / rows.shape[-1]
+    variances = np.einsum("ij,ij->i", rows, rows) / rows.shape[-1] - np.square(means)
+
+    return means, np.maximum(variances, 0, out=variances)
+
+
+def _get_strip_moments(strip: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # kxCxDxBxE -> kx(CD)x(BE), so every block and component is a column and the
+    # sums run over whole rows of the strip.
+    columns = strip.reshape(strip.shape[0], strip.shape[1] * strip.shape[2], -1)
+    n_pixels = columns.shape[1]
+
+    means = (np.ones(n_pixels) @ columns) / n_pixels
+    variances = np.einsum("aij,aij->aj", columns, columns) / n_pixels - np.square(means)
+
+    return means, np.maximum(variances, 0, out=variances)
+
+
+def _get_strips(block_columns: np.ndarray):
+    # Yields the row slices of AxCxDxBxE pixels and the float64 copies of those
+    # rows, a few block rows at a time, so the copies and temporaries stay small
+    # and are reused.
+    n_block_rows = block_columns.shape[0]
+    strip_height = constants.BLOCK_STATISTICS_STRIP_HEIGHT
+    buffer = np.empty(
+        (min(strip_height, n_block_rows),) + block_columns.shape[1:], dtype=np.float64
+    )
+
+    for a in range(0, n_block_rows, strip_height):
+        rows = slice(a, min(a + strip_height, n_block_rows))
+        strip = buffer[: rows.stop - rows.start]
+        np.copyto(strip, block_columns[rows])
+
+        yield rows, strip
+
+
+def _fill_block_statistics(
+    block_columns: np.ndarray, statistics: np.ndarray, pixel_blocks: np.ndarray = None
+):
+    # Fills a structured np.ndarray of shape Ax(BE) with the statistics of AxCxDxBxE
+    # pixels and, if given, an AxBxCxDxE np.ndarray with their blocks.
+    for rows, strip in _get_strips(block_columns):
+        if pixel_blocks is not None:
+            pixel_blocks[rows] = np.moveaxis(block_columns[rows], 3, 1)
+
+        strip_statistics = statistics[rows]
+        n_rows, height, width = strip.shape[:3]
+        columns = strip.reshape(n_rows, height * width, -1)
+
+        means, variances = _get_strip_moments(strip)
+        strip_statistics["mean"] = means
+        strip_statistics["variance"] = variances
+        strip_statistics["min"] = np.min(columns, axis=1)
+        strip_statistics["max"] = np.max(columns, axis=1)
+
+        vertical_differences = (strip[:, 1:] - strip[:, :-1]).reshape(
+            n_rows, (height - 1) * width, -1
+        )
+        horizontal_differences = (strip[:, :, 1:] - strip[:, :, :-1]).reshape(
+            n_rows, height * (width - 1), -1
+        )
+        strip_statistics["gradient_energy"] = np.einsum(
+            "aij,aij->aj", vertical_differences, vertical_differences
+        ) + np.einsum("aij,aij->aj", horizontal_differences, horizontal_differences)
+
+
+def get_block_moments(pixel_blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets the mean and variance of every block and component.
+
+    Gives the "mean" and "variance" fields of get_block_statistics (up to float64
+    rounding, as the sums are taken in another order), for decisions which need
+    nothing else. Both come from a single sum and sum of squares over every block,
+    so the variance is E[f^2] - E[f]^2, which for 8x8 blocks is off by at most
+    BLOCK_VARIANCE_EPS_FACTOR float64 epsilons times the squared largest magnitude
+    in the block.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBxCxDxE.
+
+    :return:
+        A tuple of two np.ndarrays of shape AxBxE: the means and the variances.
+    """
+    means, variances = _get_row_moments(_get_block_rows(pixel_blocks))
+    shape = pixel_blocks.shape[:2] + pixel_blocks.shape[4:]
+
+    return means.reshape(shape), variances.reshape(shape)
+
+
+def get_block_statistics(pixel_blocks: np.ndarray) -> np.ndarray:
+    """
+    Gets per-block, per-component statistics of pixel blocks.
+
+    The blocks are copied to float64 a few block rows at a time, and every statistic
+    is taken over whole pixel rows of such a strip; the mean and variance are
+    computed as in get_block_moments.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBxCxDxE.
+
+    :return:
+        A structured np.ndarray of shape AxBxE with the fields "mean", "variance",
+        "min", "max" and "gradient_energy" (the sum of squared differences between
+        horizontally and vertically neighbouring pixels of a block).
+    """
+    statistics = np.empty(
+        (pixel_blocks.shape[0], pixel_blocks.shape[1] * pixel_blocks.shape[4]),
+        dtype=constants.BLOCK_STATISTICS_DTYPE,
+    )
+    _fill_block_statistics(np.moveaxis(pixel_blocks, 1, 3), statistics)
+
+    return statistics.reshape(pixel_blocks.shape[:2] + pixel_blocks.shape[4:])
+
+
+def divide_image_to_blocks_with_statistics(
+    pixel_data: np.ndarray, block_width: int = 8, block_height: int = 8
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Divides an image into blocks and gets their statistics.
+
+    Gives the same result as divide_image_to_blocks and get_block_statistics, but
+    both are taken from the same view of the image a few block rows at a time, so
+    every row of blocks is copied and measured while it is still in the cache.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWxE.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+
+    :return:
+        A tuple containing a np.ndarray of shape AxB x block_height x block_width xE
+        (the blocks) and a structured np.ndarray of shape AxBxE (their statistics,
+        as in get_block_statistics), where A = H / block_height and
+        B = W / block_width.
+    """
+    n_block_rows = pixel_data.shape[0] // block_height
+    n_block_columns = pixel_data.shape[1] // block_width
+    n_components = pixel_data.shape[2]
+
+    # Pixels which don't fill a whole block are left out. HxWxE -> AxCxBxDxE ->
+    # AxCxDxBxE, which are strips of whole pixel rows.
+    block_columns = np.swapaxes(
+        pixel_data[
+            : n_block_rows * block_height, : n_block_columns * block_width
+        ].reshape(
+            n_block_rows, block_height, n_block_columns, block_width, n_components
+        ),
+        2,
+        3,
+    )
+
+    pixel_blocks = np.empty(
+        (n_block_rows, n_block_columns, block_height, block_width, n_components),
+        dtype=pixel_data.dtype,
+    )
+    statistics = np.empty(
+        (n_block_rows, n_block_columns * n_components),
+        dtype=constants.BLOCK_STATISTICS_DTYPE,
+    )
+    _fill_block_statistics(block_columns, statistics, pixel_blocks=pixel_blocks)
+
+    return pixel_blocks, statistics.reshape(n_block_rows, n_block_columns, n_components)
@@ -0,0 +1,358 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from . import constants
+from .image_transformations import apply_color_matrix, apply_inverse_color_matrix
+
+
+def _as_read_only(array, dtype=np.float64) -> np.ndarray:
+    array = np.array(array, dtype=dtype, order="C")
+    array.flags.writeable = False
+
+    return array
+
+
+class ColorTransform:
+    """
+    A class describing a linear RGB to luma-chroma color transform.
+
+    The forward matrix, its exact inverse and the chroma centers are built once and
+    kept as read-only arrays, so the transform can be applied any number of times
+    without creating them again. Their casts to other dtypes and the offsets of
+    every bit depth are cached the same way on first use.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        forward_matrix,
+        centers=constants.LUMA_CHROMA_CENTERS,
+    ):
+        self._name = name
+        self._forward_matrix = _as_read_only(forward_matrix)
+        self._inverse_matrix = _as_read_only(np.linalg.inv(self._forward_matrix))
+        self._centers = _as_read_only(centers)
+        self._arrays = dict()
+
+    @classmethod
+    def from_luma_weights(
+        cls, name: str, red_weight: float, blue_weight: float
+    ) -> "ColorTransform":
+        """
+        Creates a full range YCbCr transform from the luma weights of a standard.
+
+        :param name:
+            A string representing the name of the transform.
+        :param red_weight:
+            A float representing Kr, the weight of R in Y.
+        :param blue_weight:
+            A float representing Kb, the weight of B in Y.
+
+        :return:
+            A ColorTransform where Y = Kr R + Kg G + Kb B, Cb = (B - Y) / (2 - 2 Kb)
+            and Cr = (R - Y) / (2 - 2 Kr).
+        """
+        luma = np.array([red_weight, 1 - red_weight - blue_weight, blue_weight])
+
+        return cls(
+            name=name,
+            forward_matrix=(
+                luma,
+                (np.array([0, 0, 1]) - luma) / (2 - 2 * blue_weight),
+                (np.array([1, 0, 0]) - luma) / (2 - 2 * red_weight),
+            ),
+        )
+
+    # region Properties
+    @property
+    def name(self) -> str:
+        """
+        The name property.
+
+        :return:
+            A string representing the name the transform is registered under.
+        """
+        return self._name
+
+    @property
+    def forward_matrix(self) -> np.ndarray:
+        """
+        The forward matrix property.
+
+        :return:
+            A read-only np.ndarray of shape 3x3 whose rows are the RGB weights of
+            every output component.
+        """
+        return self._forward_matrix
+
+    @property
+    def inverse_matrix(self) -> np.ndarray:
+        """
+        The inverse matrix property.
+
+        :return:
+            A read-only np.ndarray of shape 3x3, the exact inverse of the forward
+            matrix.
+        """
+        return self._inverse_matrix
+
+    # endregion
+
+    def get_offsets(self, bit_depth: int = 8) -> Tuple[float, float, float]:
+        """
+        Gets the values added to every component after the forward matrix.
+
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+
+        :return:
+            A tuple of 3 floats: the centers of the transform times half the sample
+            range, e.g. 128 for the chroma components of 8-bit YCbCr.
+        """
+        return tuple(self._centers * (1 << (bit_depth - 1)))
+
+    def _get_array(self, key: Tuple, values) -> np.ndarray:
+        if key not in self._arrays:
+            self._arrays[key] = _as_read_only(values, dtype=key[-1])
+
+        return self._arrays[key]
+
+    def get_forward_matrix(self, dtype=np.float64) -> np.ndarray:
+        """
+        Gets the forward matrix in a dtype.
+
+        :param dtype:
+            (Optional) The floating point dtype of the result. Defaults to
+            np.float64.
+
+        :return:
+            A read-only np.ndarray of shape 3x3, cached per dtype.
+        """
+        return self._get_array(("forward", np.dtype(dtype)), self._forward_matrix)
+
+    def get_inverse_matrix(self, dtype=np.float64) -> np.ndarray:
+        """
+        Gets the inverse matrix in a dtype.
+
+        :param dtype:
+            (Optional) The floating point dtype of the result. Defaults to
+            np.float64.
+
+        :return:
+            A read-only np.ndarray of shape 3x3, cached per dtype.
+        """
+        return self._get_array(("inverse", np.dtype(dtype)), self._inverse_matrix)
+
+    def get_offset_vector(
+        self, bit_depth: int = 8, shift: float = 0, dtype=np.float64
+    ) -> np.ndarray:
+        """
+        Gets the offsets of get_offsets as an array, with a shift added to them.
+
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+        :param shift:
+            (Optional) A float added to every offset, e.g. the negative level shift
+            of the pipeline. Defaults to 0.
+        :param dtype:
+            (Optional) The floating point dtype of the result. Defaults to
+            np.float64.
+
+        :return:
+            A read-only np.ndarray of shape 3, cached per arguments.
+        """
+        return self._get_array(
+            ("offsets", bit_depth, shift, np.dtype(dtype)),
+            np.add(self.get_offsets(bit_depth), shift),
+        )
+
+    def forward(
+        self, pixel_data: np.ndarray, bit_depth: int = 8, dtype=np.float64
+    ) -> np.ndarray:
+        """
+        Converts RGB pixels into the luma-chroma space of the transform.
+
+        :param pixel_data:
+            A np.ndarray of shape Sx3 (any leading shape) containing RGB pixels.
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+        :param dtype:
+            (Optional) The floating point dtype the conversion is computed in.
+            Defaults to np.float64.
+
+        :return:
+            A np.ndarray of shape Sx3 in the luma-chroma space.
+        """
+        return apply_color_matrix(
+            pixel_data,
+            self.get_forward_matrix(dtype),
+            self.get_offset_vector(bit_depth, dtype=dtype),
+            dtype=dtype,
+        )
+
+    def inverse(
+        self, pixel_data: np.ndarray, bit_depth: int = 8, dtype=np.float64
+    ) -> np.ndarray:
+        """
+        Converts luma-chroma pixels back into RGB.
+
+        :param pixel_data:
+            A np.ndarray of shape Sx3 (any leading shape) in the luma-chroma space.
+        :param bit_depth:
+            (Optional) An int representing the bits per sample. Defaults to 8.
+        :param dtype:
+            (Optional) The floating point dtype the conversion is computed in.
+            Defaults to np.float64.
+
+        :return:
+            A np.ndarray of shape Sx3 containing RGB pixels.
+        """
+        return apply_inverse_color_matrix(
+            pixel_data,
+            self.get_inverse_matrix(dtype),
+            self.get_offset_vector(bit_depth, dtype=dtype),
+            dtype=dtype,
+        )
+
+
+def rgb_to_ycocg_r(pixel_data: np.ndarray) -> np.ndarray:
+    """
+    Converts integer RGB pixels into YCoCg-R with the lossless lifting steps.
+
+    Co = R - B, t = B + (Co >> 1), Cg = G - t, Y = t + (Cg >> 1). Co and Cg need one
+    bit more than the input samples, so the result is a signed dtype at least one
+    size wider than an unsigned input.
+
+    :param pixel_data:
+        A np.ndarray of shape Sx3 (any leading shape) containing integer RGB pixels.
+
+    :return:
+        A np.ndarray of shape Sx3 containing Y, Co and Cg, with Co and Cg centered
+        on 0.
+    """
+    dtype = np.promote_types(pixel_data.dtype, np.int16)
+    red, green, blue = np.moveaxis(pixel_data.astype(dtype, copy=False), -1, 0)
+
+    co = red - blue
+    t = blue + (co >> 1)
+    cg = green - t
+    y = t + (cg >> 1)
+
+    return np.stack((y, co, cg), axis=-1)
+
+
+def ycocg_r_to_rgb(pixel_data: np.ndarray) -> np.ndarray:
+    """
+    Converts YCoCg-R pixels back into RGB, exactly undoing rgb_to_ycocg_r.
+
+    :param pixel_data:
+        A np.ndarray of shape Sx3 (any leading shape) containing integer Y, Co and
+        Cg.
+
+    :return:
+        A np.ndarray of shape Sx3 containing RGB pixels in the dtype of the input.
+    """
+    y, co, cg = np.moveaxis(pixel_data, -1, 0)
+
+    t = y - (cg >> 1)
+    green = cg + t
+    blue = t - (co >> 1)
+    red = blue + co
+
+    return np.stack((red, green, blue), axis=-1)
+
+
+_color_transforms: Dict[str, ColorTransform] = dict()
+
+
+def register_color_transform(color_transform: ColorTransform):
+    """
+    Makes a color transform available by its name.
+
+    :param color_transform:
+        A ColorTransform; one registered under the same name is replaced.
+
+    :return:
+        Nothing.
+    """
+    _color_transforms[color_transform.name] = color_transform
+
+
+def get_color_transform(
+    name: str = constants.DEFAULT_COLOR_TRANSFORM,
+) -> ColorTransform:
+    """
+    Gets a registered color transform.
+
+    :param name:
+        (Optional) A string representing the name of the transform. Defaults to
+        "jfif".
+
+    :return:
+        The ColorTransform registered under the name.
+    """
+    if name not in _color_transforms:
+        raise KeyError(
+            f"Expected one of the registered color transforms "
+            f"{get_color_transform_names()}, got {name}"
+        )
+
+    return _color_transforms[name]
+
+
+def get_color_transform_names() -> List[str]:
+    """
+    Gets the names of all registered color transforms.
+
+    :return:
+        A sorted list of strings.
+    """
+    return sorted(_color_transforms)
+
+
+register_color_transform(
+    ColorTransform(
+        name=constants.JFIF_COLOR_TRANSFORM,
+        forward_matrix=(
+            constants.DEFAULT_Y_COEFFICIENTS,
+            constants.DEFAULT_CB_COEFFICIENTS,
+            constants.DEFAULT_CR_COEFFICIENTS,
+        ),
+    )
+)
+register_color_transform(
+    ColorTransform.from_luma_weights(
+        constants.BT601_COLOR_TRANSFORM, *constants.BT601_LUMA_WEIGHTS
+    )
+)
+register_color_transform(
+    ColorTransform.from_luma_weights(
+        constants.BT709_COLOR_TRANSFORM, *constants.BT709_LUMA_WEIGHTS
+    )
+)
+register_color_transform(
+    ColorTransform.from_luma_weights(
+        constants.BT2020_COLOR_TRANSFORM, *constants.BT2020_LUMA_WEIGHTS
+    )
+)
+register_color_transform(
+    ColorTransform(
+        name=constants.YCOCG_R_COLOR_TRANSFORM,
+        forward_matrix=constants.YCOCG_R_MATRIX,
+    )
+)
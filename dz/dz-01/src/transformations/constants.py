@@ -28,3 +28,67 @@ DEFAULT_B_COEFFICIENTS = (1, 1.772, 0)
 DCT_C_ZERO_VAL = 0.5
 DCT_C_NONZERO_VAL = 1
 PI_SIXTEENTH = np.pi / 16
+
+DEFAULT_SEARCH_RANGE = 16
+LARGE_DIAMOND_PATTERN = (
+    (0, 0),
+    (-2, 0),
+    (2, 0),
+    (0, -2),
+    (0, 2),
+    (-1, -1),
+    (-1, 1),
+    (1, -1),
+    (1, 1),
+)
+SMALL_DIAMOND_PATTERN = ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1))
+
+NUMPY_BACKEND = "numpy"
+NUMBA_BACKEND = "numba"
+AUTO_BACKEND = "auto"
+
+JFIF_COLOR_TRANSFORM = "jfif"
+BT601_COLOR_TRANSFORM = "bt601"
+BT709_COLOR_TRANSFORM = "bt709"
+BT2020_COLOR_TRANSFORM = "bt2020"
+YCOCG_R_COLOR_TRANSFORM = "ycocg-r"
+DEFAULT_COLOR_TRANSFORM = JFIF_COLOR_TRANSFORM
+
+# (Kr, Kb) luma weights of the red and blue primaries.
+BT601_LUMA_WEIGHTS = (0.299, 0.114)
+BT709_LUMA_WEIGHTS = (0.2126, 0.0722)
+BT2020_LUMA_WEIGHTS = (0.2627, 0.0593)
+
+# The lifting steps of YCoCg-R without their rounding: Co = R - B,
+# Cg = G - (B + Co / 2) and Y = B + Co / 2 + Cg / 2.
+YCOCG_R_MATRIX = ((0.25, 0.5, 0.25), (1, 0, -1), (-0.5, 1, -0.5))
+
+# Centers of every component, in units of half the sample range. The chroma
+# components are centered on half the sample range, which the level shift of the
+# pipeline takes back to 0. Co and Cg span [-2^bit_depth, 2^bit_depth] around 0, so
+# they are centered the same way as Cb and Cr.
+LUMA_CHROMA_CENTERS = (0, 1, 1)
+
+BLOCK_STATISTICS_DTYPE = np.dtype(
+    [
+        ("mean", np.float64),
+        ("variance", np.float64),
+        ("min", np.float64),
+        ("max", np.float64),
+        ("gradient_energy", np.float64),
+    ]
+)
+
+# Block statistics are taken this many block rows at a time, so the float64 copy of
+# the pixels and the temporaries stay in the cache.
+BLOCK_STATISTICS_STRIP_HEIGHT = 4
+
+# Block variances are E[f^2] - E[f]^2 of 64 float64 sums, which are off by at most
+# this many float64 epsilons times the squared largest magnitude in the block.
+BLOCK_VARIANCE_EPS_FACTOR = 256
+
+# Pruning leaves a margin of this many machine epsilons of the dtype the DCT is
+# computed in, relative to the thresholds and to the sum of the absolute pixel
+# values of a block, so float error in the bound or the DCT can't flip a skipped
+# coefficient.
+DCT_PRUNING_EPS_FACTOR = 8
@@ -0,0 +1,219 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from importlib.util import find_spec
+from typing import Union
+
+import numpy as np
+
+from . import constants
+
+_numba_kernels = dict()
+
+
+def is_numba_available() -> bool:
+    """
+    Checks whether numba can be imported.
+
+    :return:
+        A bool; True if numba is installed.
+    """
+    return find_spec("numba") is not None
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Resolves a backend name into the backend which will actually be used.
+
+    :param backend:
+        A string: "numpy", "numba", or "auto" (numba if it is installed, numpy
+        otherwise).
+
+    :return:
+        A string, either "numpy" or "numba".
+    """
+    if backend == constants.AUTO_BACKEND:
+        return (
+            constants.NUMBA_BACKEND if is_numba_available() else constants.NUMPY_BACKEND
+        )
+
+    if backend == constants.NUMBA_BACKEND and not is_numba_available():
+        raise ImportError("The numba backend was requested, but numba is not installed")
+
+    if backend not in (constants.NUMPY_BACKEND, constants.NUMBA_BACKEND):
+        raise ValueError(
+            f"Expected backend to be one of {constants.NUMPY_BACKEND}, "
+            f"{constants.NUMBA_BACKEND} or {constants.AUTO_BACKEND}, got {backend}"
+        )
+
+    return backend
+
+
+def get_numba_kernel(function):
+    """
+    Compiles a kernel with numba on first use.
+
+    Kernels run in parallel over their outer loop and are cached on disk, so later
+    runs skip the compilation. numba itself is only imported here and in the
+    numba_kernels modules, which callers import right before they need a kernel.
+
+    :param function:
+        A module level Python function written in the numba subset.
+
+    :return:
+        The compiled kernel.
+    """
+    if function not in _numba_kernels:
+        import numba
+
+        _numba_kernels[function] = numba.njit(parallel=True, cache=True)(function)
+
+    return _numba_kernels[function]
+
+
+def rgb_to_shifted_blocks(
+    pixel_data: np.ndarray,
+    matrix: np.ndarray,
+    offsets: np.ndarray,
+    block_width: int = 8,
+    block_height: int = 8,
+    dtype=np.float64,
+    backend: str = constants.NUMPY_BACKEND,
+) -> np.ndarray:
+    """
+    Converts a RGB image straight into level shifted pixel blocks of another color
+    space.
+
+    Gives the same result as divide_image_to_blocks(apply_color_matrix(pixel_data,
+    matrix, offsets)), but the result is written into the block layout directly,
+    so the image is only passed over once.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 you wish to convert, usually uint8.
+    :param matrix:
+        A np.ndarray of shape 3x3 in dtype whose rows are the RGB weights of every
+        output component, e.g. ColorTransform.get_forward_matrix(dtype).
+    :param offsets:
+        A np.ndarray of shape 3 in dtype added to every pixel afterwards, level
+        shift included, e.g. ColorTransform.get_offset_vector(bit_depth, -128,
+        dtype).
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+    :param dtype:
+        (Optional) The floating point dtype the conversion is computed in. Defaults
+        to np.float64.
+    :param backend:
+        (Optional) A string: "numpy", "numba" or "auto". Defaults to "numpy".
+
+    :return:
+        A np.ndarray of shape AxB x block_height x block_width x3, where
+        A = H / block_height and B = W / block_width.
+    """
+    n_block_rows = pixel_data.shape[0] // block_height
+    n_block_columns = pixel_data.shape[1] // block_width
+    output = np.empty(
+        (n_block_rows, n_block_columns, block_height, block_width, 3), dtype=dtype
+    )
+
+    if resolve_backend(backend) == constants.NUMBA_BACKEND:
+        from .numba_kernels import rgb_to_shifted_blocks_kernel
+
+        get_numba_kernel(rgb_to_shifted_blocks_kernel)(
+            np.ascontiguousarray(pixel_data), matrix, offsets, output
+        )
+
+        return output
+
+    # Every strip of block_height rows is small enough to stay in cache, so it is
+    # converted and blocked before moving on to the next one.
+    for a in range(n_block_rows):
+        strip = pixel_data[
+            a * block_height : (a + 1) * block_height,
+            : n_block_columns * block_width,
+        ].reshape(block_height, n_block_columns, block_width, 3)
+
+        # matmul only takes a dtype from numpy 1.16 on, so the strip is cast first.
+        np.matmul(
+            np.asarray(strip.swapaxes(0, 1), dtype=dtype), matrix.T, out=output[a]
+        )
+        output[a] += offsets
+
+    return output
+
+
+def rgb_to_shifted_ycbcr_blocks(
+    pixel_data: np.ndarray,
+    y_coefficients=constants.DEFAULT_Y_COEFFICIENTS,
+    cb_coefficients=constants.DEFAULT_CB_COEFFICIENTS,
+    cr_coefficients=constants.DEFAULT_CR_COEFFICIENTS,
+    y_addition: Union[float, int] = constants.DEFAULT_Y_ADDITION,
+    cb_addition: Union[float, int] = constants.DEFAULT_CB_ADDITION,
+    cr_addition: Union[float, int] = constants.DEFAULT_CR_ADDITION,
+    shift: Union[float, int] = -128,
+    block_width: int = 8,
+    block_height: int = 8,
+    dtype=np.float64,
+    backend: str = constants.NUMPY_BACKEND,
+) -> np.ndarray:
+    """
+    Converts a RGB image straight into level shifted YCbCr pixel blocks.
+
+    Gives the same result as divide_image_to_blocks(shift_image_pixels(
+    rgb_to_ycbcr(pixel_data), shift)), with the shift folded into the additions,
+    through rgb_to_shifted_blocks.
+
+    :param pixel_data:
+        A np.ndarray of shape HxWx3 you wish to convert, usually uint8.
+    :param y_coefficients:
+        A list of 3 RGB weights for the Y component.
+    :param cb_coefficients:
+        A list of 3 RGB weights for the Cb component.
+    :param cr_coefficients:
+        A list of 3 RGB weights for the Cr component.
+    :param y_addition:
+        A float or int representing the number to be added after weight-summing to get
+        the Y component.
+    :param cb_addition:
+        A float or int representing the number to be added after weight-summing to get
+        the Cb component.
+    :param cr_addition:
+        A float or int representing the number to be added after weight-summing to get
+        the Cr component.
+    :param shift:
+        An int representing the value to be added to all components afterwards.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+    :param dtype:
+        (Optional) The floating point dtype the conversion is computed in. Defaults
+        to np.float64.
+    :param backend:
+        (Optional) A string: "numpy", "numba" or "auto". Defaults to "numpy".
+
+    :return:
+        A np.ndarray of shape AxB x block_height x block_width x3, where
+        A = H / block_height and B = W / block_width.
+    """
+    return rgb_to_shifted_blocks(
+        pixel_data,
+        np.array([y_coefficients, cb_coefficients, cr_coefficients], dtype=dtype),
+        np.array([y_addition, cb_addition, cr_addition], dtype=dtype) + shift,
+        block_width=block_width,
+        block_height=block_height,
+        dtype=dtype,
+        backend=backend,
+    )
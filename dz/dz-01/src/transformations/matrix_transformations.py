@@ -12,6 +12,8 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+from functools import lru_cache
+
 import numpy as np
 
 
@@ -56,19 +58,50 @@ def zigzag_pixel_blocks(pixel_blocks: np.ndarray):
     :return:
         A np.ndarray of shape AxBx3x64, where A = H/8, B = W/8.
     """
-    to_return = list()
+    # AxBx8x8x3 -> AxBx3x64, then gather every block in zigzag order at once.
+    flat_blocks = np.moveaxis(pixel_blocks, -1, -3).reshape(
+        pixel_blocks.shape[:-3] + (pixel_blocks.shape[-1], -1)
+    )
+
+    return flat_blocks[..., get_zigzag_indices(pixel_blocks.shape[-2])]
+
+
+@lru_cache(maxsize=None)
+def get_zigzag_indices(size: int = 8) -> np.ndarray:
+    """
+    Gets the flat indices of a square array in zigzag scanning order.
+
+    The indices are built on first use for every size and shared afterwards, so
+    they are read-only.
+
+    :param size:
+        An int representing the width and height of the array.
+
+    :return:
+        A read-only np.ndarray of shape (size * size), where the element at i is the
+        flat index of the i-th element in zigzag order.
+    """
+    zigzag_indices = np.array(
+        array_2d_to_zigzag(np.arange(size * size).reshape(size, size))
+    )
+    zigzag_indices.flags.writeable = False
 
-    for pixel_block_row in pixel_blocks:
-        current_row = list()
+    return zigzag_indices
 
-        for pixel_block in pixel_block_row:
-            current_block = list()
 
-            for pixel_sector in pixel_block.transpose(2, 0, 1):
-                current_block.append(array_2d_to_zigzag(pixel_sector))
+def unzigzag_pixel_blocks(zigzagged_blocks: np.ndarray) -> np.ndarray:
+    """
+    Converts zigzag scanned 1D arrays back into pixel blocks.
+
+    This is the inverse of zigzag_pixel_blocks.
 
-            current_row.append(current_block)
+    :param zigzagged_blocks:
+        A np.ndarray of shape Sx3x64, where S is any shape (usually AxB).
 
-        to_return.append(current_row)
+    :return:
+        A np.ndarray of shape Sx8x8x3.
+    """
+    pixel_blocks = np.empty_like(zigzagged_blocks)
+    pixel_blocks[..., get_zigzag_indices()] = zigzagged_blocks
 
-    return np.array(to_return)
+    return np.moveaxis(pixel_blocks.reshape(pixel_blocks.shape[:-1] + (8, 8)), -3, -1)
@@ -0,0 +1,479 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from . import constants
+
+
+def get_candidate_windows(
+    frame: np.ndarray, block_width: int = 8, block_height: int = 8
+) -> np.ndarray:
+    """
+    Gets a read-only view of every block_height x block_width window of a frame.
+
+    :param frame:
+        A np.ndarray of shape HxW or HxWxC.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+
+    :return:
+        A np.ndarray of shape (H - block_height + 1)x(W - block_width + 1)x
+        block_height x block_width (xC), where the element at (y, x) is the window
+        whose top left pixel is at (y, x).
+    """
+    frame = np.ascontiguousarray(frame)
+
+    return as_strided(
+        frame,
+        shape=(
+            frame.shape[0] - block_height + 1,
+            frame.shape[1] - block_width + 1,
+            block_height,
+            block_width,
+        )
+        + frame.shape[2:],
+        strides=frame.strides[:2] + frame.strides,
+        writeable=False,
+    )
+
+
+def get_block_mad(
+    reference_block: np.ndarray, block: np.ndarray, n_block_axes: int = 2
+) -> np.ndarray:
+    """
+    Calculates the mean absolute difference (MAD) between blocks.
+
+    :param reference_block:
+        A np.ndarray of shape SxT, where S is any shape and T is the block shape.
+    :param block:
+        A np.ndarray broadcastable to the shape of reference_block.
+    :param n_block_axes:
+        An int representing the number of trailing axes which form a block: 2 for
+        HxW blocks, 3 for HxWxC blocks.
+
+    :return:
+        A np.ndarray of shape S: the MAD of every block pair.
+    """
+    return np.mean(
+        np.abs(np.subtract(reference_block, block, dtype=np.float64)),
+        axis=tuple(range(-n_block_axes, 0)),
+    )
+
+
+def _get_mad_map(
+    windows: np.ndarray,
+    block: np.ndarray,
+    origin_y: int,
+    origin_x: int,
+    search_range: int,
+) -> np.ndarray:
+    y_start, x_start = max(origin_y - search_range, 0), max(origin_x - search_range, 0)
+    y_end = min(origin_y + search_range, windows.shape[0] - 1) + 1
+    x_end = min(origin_x + search_range, windows.shape[1] - 1) + 1
+
+    mad_map = np.full((2 * search_range + 1, 2 * search_range + 1), np.inf)
+    mad_map[
+        y_start - origin_y + search_range : y_end - origin_y + search_range,
+        x_start - origin_x + search_range : x_end - origin_x + search_range,
+    ] = get_block_mad(windows[y_start:y_end, x_start:x_end], block, block.ndim)
+
+    return mad_map
+
+
+def get_block_mad_map(
+    reference_frame: np.ndarray,
+    current_frame: np.ndarray,
+    block_row: int,
+    block_column: int,
+    block_width: int = 8,
+    block_height: int = 8,
+    search_range: int = constants.DEFAULT_SEARCH_RANGE,
+) -> np.ndarray:
+    """
+    Calculates the MAD of a block for every candidate offset in the search range.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are searched
+        in.
+    :param current_frame:
+        A np.ndarray of the same shape as reference_frame the block is taken from.
+    :param block_row:
+        An int representing the row index of the block, as in divide_image_to_blocks.
+    :param block_column:
+        An int representing the column index of the block, as in
+        divide_image_to_blocks.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+    :param search_range:
+        An int representing the maximum displacement in each direction.
+
+    :return:
+        A np.ndarray of shape (2R + 1)x(2R + 1), where R = search_range and the
+        element at (R + dy, R + dx) is the MAD for the offset (dy, dx). Offsets which
+        fall outside of the frame have a MAD of inf.
+    """
+    windows = get_candidate_windows(
+        np.asarray(reference_frame, dtype=np.float64), block_width, block_height
+    )
+
+    origin_y, origin_x = block_row * block_height, block_column * block_width
+    block = np.asarray(
+        current_frame[
+            origin_y : origin_y + block_height, origin_x : origin_x + block_width
+        ],
+        dtype=np.float64,
+    )
+
+    return _get_mad_map(windows, block, origin_y, origin_x, search_range)
+
+
+def _get_current_blocks(
+    current_frame: np.ndarray,
+    block_width: int,
+    block_height: int,
+    row_start: int,
+    row_end: int,
+    n_block_columns: int,
+) -> np.ndarray:
+    current_frame = current_frame[
+        row_start * block_height : row_end * block_height,
+        : n_block_columns * block_width,
+    ]
+
+    blocks = current_frame.reshape(
+        (row_end - row_start, block_height, n_block_columns, block_width)
+        + current_frame.shape[2:]
+    )
+
+    return np.swapaxes(blocks, 1, 2).astype(np.float64)
+
+
+def _evaluate_pattern(
+    windows: np.ndarray,
+    blocks: np.ndarray,
+    origins: np.ndarray,
+    centers: np.ndarray,
+    pattern: np.ndarray,
+    search_range: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # AxBxPx2 candidate offsets for every block at once.
+    candidates = centers[:, :, np.newaxis] + pattern
+    positions = origins[:, :, np.newaxis] + candidates
+
+    is_valid = np.all(np.abs(candidates) <= search_range, axis=-1)
+    is_valid &= np.all(positions >= 0, axis=-1)
+    is_valid &= positions[..., 0] < windows.shape[0]
+    is_valid &= positions[..., 1] < windows.shape[1]
+
+    positions = np.clip(positions, 0, np.array(windows.shape[:2]) - 1)
+    candidate_windows = windows[positions[..., 0], positions[..., 1]]
+
+    mads = get_block_mad(candidate_windows, blocks[:, :, np.newaxis], blocks.ndim - 2)
+    mads[~is_valid] = np.inf
+
+    best = np.argmin(mads, axis=-1)[..., np.newaxis]
+
+    return (
+        np.take_along_axis(candidates, best[..., np.newaxis], axis=2)[:, :, 0],
+        np.take_along_axis(mads, best, axis=2)[..., 0],
+    )
+
+
+def _search_block_rows(
+    method: str,
+    reference_frame: np.ndarray,
+    current_frame: np.ndarray,
+    block_width: int,
+    block_height: int,
+    search_range: int,
+    row_start: int,
+    row_end: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    reference_frame = np.asarray(reference_frame, dtype=np.float64)
+    windows = get_candidate_windows(reference_frame, block_width, block_height)
+
+    n_block_columns = current_frame.shape[1] // block_width
+    blocks = _get_current_blocks(
+        current_frame, block_width, block_height, row_start, row_end, n_block_columns
+    )
+
+    origins = np.stack(
+        np.meshgrid(
+            np.arange(row_start, row_end) * block_height,
+            np.arange(n_block_columns) * block_width,
+            indexing="ij",
+        ),
+        axis=-1,
+    )
+    centers = np.zeros_like(origins)
+
+    if method == "full":
+        motion_vectors = np.empty_like(origins)
+        mads = np.empty(origins.shape[:2])
+
+        for i, j in np.ndindex(*origins.shape[:2]):
+            mad_map = _get_mad_map(windows, blocks[i, j], *origins[i, j], search_range)
+
+            # Prefer the zero offset on ties, then the first offset in raster order.
+            if mad_map[search_range, search_range] <= np.min(mad_map):
+                best = (search_range, search_range)
+            else:
+                best = np.unravel_index(np.argmin(mad_map), mad_map.shape)
+
+            motion_vectors[i, j] = np.array(best) - search_range
+            mads[i, j] = mad_map[best]
+
+        return motion_vectors, mads
+
+    if method == "three_step":
+        step = 2 ** int(np.ceil(np.log2(search_range + 1)) - 1)
+
+        # A search range of 0 has no steps, only the zero offset.
+        if step < 1:
+            return _evaluate_pattern(
+                windows, blocks, origins, centers, np.zeros((1, 2), dtype=int), 0
+            )
+
+        while step >= 1:
+            pattern = np.array(
+                [[0, 0]]
+                + [
+                    [dy * step, dx * step]
+                    for dy in (-1, 0, 1)
+                    for dx in (-1, 0, 1)
+                    if dy != 0 or dx != 0
+                ]
+            )
+            centers, mads = _evaluate_pattern(
+                windows, blocks, origins, centers, pattern, search_range
+            )
+            step //= 2
+
+        return centers, mads
+
+    if method == "diamond":
+        large_pattern = np.array(constants.LARGE_DIAMOND_PATTERN)
+        is_active = np.ones(origins.shape[:2], dtype=bool)
+
+        # Every large diamond step moves at least one pixel, so the search is bound
+        # to converge within the search window.
+        for _ in range(2 * search_range + 1):
+            new_centers, _ = _evaluate_pattern(
+                windows, blocks, origins, centers, large_pattern, search_range
+            )
+            has_moved = np.any(new_centers != centers, axis=-1) & is_active
+            centers[has_moved] = new_centers[has_moved]
+            is_active = has_moved
+
+            if not np.any(is_active):
+                break
+
+        return _evaluate_pattern(
+            windows,
+            blocks,
+            origins,
+            centers,
+            np.array(constants.SMALL_DIAMOND_PATTERN),
+            search_range,
+        )
+
+    raise ValueError(
+        f"Expected method to be one of full, three_step or diamond, got {method}"
+    )
+
+
+def estimate_motion(
+    reference_frame: np.ndarray,
+    current_frame: np.ndarray,
+    method: str = "full",
+    block_width: int = 8,
+    block_height: int = 8,
+    search_range: int = constants.DEFAULT_SEARCH_RANGE,
+    n_jobs: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates the motion of every block of a frame relative to a reference frame.
+
+    Blocks are indexed the same way divide_image_to_blocks indexes them.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are searched
+        in.
+    :param current_frame:
+        A np.ndarray of the same shape as reference_frame which is divided into
+        blocks.
+    :param method:
+        A string representing the search method: "full" for a full search,
+        "three_step" for a three step search, or "diamond" for a diamond search.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+    :param search_range:
+        An int representing the maximum displacement in each direction.
+    :param n_jobs:
+        An int representing the number of processes the block rows are split
+        across. Defaults to 1 (no additional processes).
+
+    :return:
+        A tuple containing a np.ndarray of shape AxBx2 with the (dy, dx) motion
+        vector of every block, and a np.ndarray of shape AxB with the MAD of every
+        block at its motion vector, where A = H/block_height, B = W/block_width.
+        The block at (a, b) best matches the reference frame window whose top left
+        pixel is at (a * block_height + dy, b * block_width + dx).
+    """
+    if reference_frame.shape != current_frame.shape:
+        raise ValueError(
+            f"Expected frames of the same shape, got {reference_frame.shape} and "
+            f"{current_frame.shape}"
+        )
+
+    n_block_rows = current_frame.shape[0] // block_height
+    arguments = (
+        method,
+        reference_frame,
+        current_frame,
+        block_width,
+        block_height,
+        search_range,
+    )
+
+    if n_jobs <= 1 or n_block_rows <= 1:
+        return _search_block_rows(*arguments, 0, n_block_rows)
+
+    bounds = np.linspace(0, n_block_rows, min(n_jobs, n_block_rows) + 1).astype(int)
+
+    with ProcessPoolExecutor(max_workers=len(bounds) - 1) as executor:
+        futures = [
+            executor.submit(_search_block_rows, *arguments, row_start, row_end)
+            for row_start, row_end in zip(bounds[:-1], bounds[1:])
+        ]
+        results = [future.result() for future in futures]
+
+    return (
+        np.concatenate([x[0] for x in results]),
+        np.concatenate([x[1] for x in results]),
+    )
+
+
+def full_search(
+    reference_frame: np.ndarray, current_frame: np.ndarray, **kwargs
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates block motion by checking every offset in the search range.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are searched
+        in.
+    :param current_frame:
+        A np.ndarray of the same shape as reference_frame which is divided into
+        blocks.
+    :param kwargs:
+        Keyword arguments passed on to estimate_motion.
+
+    :return:
+        A tuple containing the AxBx2 motion vectors and the AxB MADs.
+    """
+    return estimate_motion(reference_frame, current_frame, method="full", **kwargs)
+
+
+def three_step_search(
+    reference_frame: np.ndarray, current_frame: np.ndarray, **kwargs
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates block motion with a three step search.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are searched
+        in.
+    :param current_frame:
+        A np.ndarray of the same shape as reference_frame which is divided into
+        blocks.
+    :param kwargs:
+        Keyword arguments passed on to estimate_motion.
+
+    :return:
+        A tuple containing the AxBx2 motion vectors and the AxB MADs.
+    """
+    return estimate_motion(
+        reference_frame, current_frame, method="three_step", **kwargs
+    )
+
+
+def diamond_search(
+    reference_frame: np.ndarray, current_frame: np.ndarray, **kwargs
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates block motion with a diamond search.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are searched
+        in.
+    :param current_frame:
+        A np.ndarray of the same shape as reference_frame which is divided into
+        blocks.
+    :param kwargs:
+        Keyword arguments passed on to estimate_motion.
+
+    :return:
+        A tuple containing the AxBx2 motion vectors and the AxB MADs.
+    """
+    return estimate_motion(reference_frame, current_frame, method="diamond", **kwargs)
+
+
+def get_motion_compensated_blocks(
+    reference_frame: np.ndarray,
+    motion_vectors: np.ndarray,
+    block_width: int = 8,
+    block_height: int = 8,
+) -> np.ndarray:
+    """
+    Gets the blocks of a reference frame which motion vectors point to.
+
+    :param reference_frame:
+        A np.ndarray of shape HxW or HxWxC representing the frame blocks are taken
+        from.
+    :param motion_vectors:
+        A np.ndarray of shape AxBx2 containing the (dy, dx) motion vector of every
+        block.
+    :param block_width:
+        An int representing the width of a block.
+    :param block_height:
+        An int representing the height of a block.
+
+    :return:
+        A np.ndarray of shape AxB x block_height x block_width (xC), laid out the same
+        way as the output of divide_image_to_blocks.
+    """
+    windows = get_candidate_windows(reference_frame, block_width, block_height)
+    origins = np.stack(
+        np.meshgrid(
+            np.arange(motion_vectors.shape[0]) * block_height,
+            np.arange(motion_vectors.shape[1]) * block_width,
+            indexing="ij",
+        ),
+        axis=-1,
+    )
+    positions = origins + motion_vectors
+
+    return windows[positions[..., 0], positions[..., 1]]
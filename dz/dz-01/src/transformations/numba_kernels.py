@@ -0,0 +1,37 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+from numba import prange
+
+# Kernels for get_numba_kernel. This module imports numba, so it is only imported
+# once a kernel is needed; importing numba takes longer than the rest of the
+# package.
+
+
+def rgb_to_shifted_blocks_kernel(pixel_data, matrix, offsets, output):
+    for a in prange(output.shape[0]):
+        for b in range(output.shape[1]):
+            for i in range(output.shape[2]):
+                for j in range(output.shape[3]):
+                    y = a * output.shape[2] + i
+                    x = b * output.shape[3] + j
+
+                    for c in range(3):
+                        output[a, b, i, j, c] = (
+                            matrix[c, 0] * pixel_data[y, x, 0]
+                            + matrix[c, 1] * pixel_data[y, x, 1]
+                            + matrix[c, 2] * pixel_data[y, x, 2]
+                            + offsets[c]
+                        )
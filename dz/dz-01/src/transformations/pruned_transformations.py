@@ -0,0 +1,298 @@
+# Copyright 2021 Yalfoosh
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+from typing import List, Tuple
+
+import numpy as np
+
+from . import constants
+from .block_statistics import get_block_moments
+from .image_transformations import get_dct_tables
+
+# The DCT weights here never exceed those of the orthonormal DCT (they are equal,
+# or smaller by sqrt(2) in the first row and column), so by Parseval every AC
+# coefficient of a block is at most its orthonormal counterpart, which is at most
+# ||f - mean(f)||. The bound per coefficient is c(u, v) * ||f - mean(f)||, where
+# c(u, v) is 1 / sqrt(2) in the first row and column and 1 elsewhere.
+#
+# Computed in a float dtype, a coefficient is off by at most about
+# 4 * eps * ||f||_1, where eps is the machine epsilon of the dtype and ||f||_1 the
+# sum of the absolute pixel values, or about 6 * eps * ||f||_1 once divided by
+# c(u, v). So the block norm gets get_pruned_dct_slack(dtype) * ||f||_1 added
+# before it is compared against the thresholds; the error is relative to the
+# pixel values rather than to q, so a margin on the thresholds alone wouldn't
+# cover large samples computed in float32.
+
+
+def get_pruned_dct_slack(dtype=np.float64) -> float:
+    """
+    Gets the relative margin pruning leaves for float error of a dtype.
+
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in. Defaults to
+        np.float64.
+
+    :return:
+        A float; thresholds are lowered by this fraction, and block norms are
+        raised by this times the sum of the absolute pixel values of the block.
+    """
+    return constants.DCT_PRUNING_EPS_FACTOR * float(np.finfo(dtype).eps)
+
+
+def get_pruned_dct_thresholds(
+    quantization_tensor: np.ndarray, tolerance: float = 0, dtype=np.float64
+) -> np.ndarray:
+    """
+    Gets the block norms from which on a larger square of coefficients is needed.
+
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8xC the DCT blocks will be quantized with.
+    :param tolerance:
+        (Optional) A float; coefficients are skipped if their bound is below
+        (0.5 + tolerance) * q, so a skipped coefficient is off by at most
+        round(0.5 + tolerance) quantization steps. Defaults to 0 (exact).
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in; the thresholds
+        are lowered by get_pruned_dct_slack of it. Defaults to np.float64.
+
+    :return:
+        A np.ndarray of shape Cx8; a block of component c needs a square of at
+        least m + 1 coefficients if ||f - mean(f)||, plus the slack for float
+        error, is at least the element at (c, m). The element at (c, 0) is
+        infinite, as the DC coefficient is always computed.
+    """
+    coefficient_bounds = np.ones((8, 8))
+    coefficient_bounds[0, :] = coefficient_bounds[:, 0] = 1 / np.sqrt(2)
+
+    thresholds = (
+        (0.5 + tolerance)
+        * (1 - get_pruned_dct_slack(dtype))
+        * np.asarray(quantization_tensor, dtype=np.float64)
+        / coefficient_bounds[..., np.newaxis]
+    )
+    thresholds[0, 0] = np.inf
+
+    # Coefficients with max(u, v) = m need a square of at least m + 1, so the
+    # lowest threshold among them decides.
+    rings = np.maximum.outer(np.arange(8), np.arange(8))
+
+    return np.stack([np.min(thresholds[rings == m], axis=0) for m in range(8)], axis=-1)
+
+
+def _get_energy_bounds(
+    block_means: np.ndarray, block_variances: np.ndarray, dtype
+) -> np.ndarray:
+    # ||f - mean(f)|| is 8 * sqrt(variance), plus the float error of the variance,
+    # and the sum of the absolute pixel values the slack for float error grows with
+    # is at most 8 * ||f|| = 64 * sqrt(variance + mean^2). The squared largest
+    # magnitude is at most 64 times the mean square.
+    mean_squares = block_variances + np.square(block_means)
+    variance_errors = (
+        64 * constants.BLOCK_VARIANCE_EPS_FACTOR * np.finfo(np.float64).eps
+    ) * mean_squares
+
+    return 8 * np.sqrt(block_variances + variance_errors) + (
+        64 * get_pruned_dct_slack(dtype)
+    ) * np.sqrt(mean_squares)
+
+
+def get_pruned_dct_sizes(
+    pixel_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    tolerance: float = 0,
+    dtype=np.float64,
+) -> np.ndarray:
+    """
+    Gets the size of the top left square of DCT coefficients worth computing.
+
+    A coefficient F quantizes to 0 if |F| / q <= 0.5. Its bound from the block
+    energy, taken from get_block_moments, is checked against that, and the square
+    is made large enough to hold every coefficient which may not quantize to 0.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8xC.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8xC the DCT blocks will be quantized with.
+    :param tolerance:
+        (Optional) A float passed to get_pruned_dct_thresholds. Defaults to 0
+        (exact).
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in, which decides
+        the margin left for float error. Defaults to np.float64.
+
+    :return:
+        A np.ndarray of shape AxBxC containing an int k in [1, 8] for every block
+        and component.
+    """
+    energies = _get_energy_bounds(*get_block_moments(pixel_blocks), dtype)
+    thresholds = get_pruned_dct_thresholds(quantization_tensor, tolerance, dtype=dtype)
+
+    # The thresholds of larger squares aren't always larger, so the largest square
+    # whose threshold is reached decides.
+    return 1 + np.max(
+        np.where(energies[..., np.newaxis] >= thresholds, np.arange(8), 0), axis=-1
+    )
+
+
+def get_pruned_dct_groups(sizes: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+    """
+    Groups blocks by the size of their top left square of DCT coefficients.
+
+    :param sizes:
+        A np.ndarray of ints in [1, 8], e.g. from get_pruned_dct_sizes.
+
+    :return:
+        A list of tuples containing a size k and a np.ndarray of the flat indices
+        into sizes which have it, for every size at least one block has, in
+        ascending order of k.
+    """
+    sizes = sizes.ravel()
+    order = np.argsort(sizes, kind="stable")
+    bounds = np.cumsum(np.bincount(sizes, minlength=9))
+
+    return [
+        (k, order[bounds[k - 1] : bounds[k]])
+        for k in range(1, 9)
+        if bounds[k] != bounds[k - 1]
+    ]
+
+
+def get_pruned_dct_corners(
+    pixel_blocks: np.ndarray, indices: np.ndarray, size: int, dtype=np.float64
+) -> np.ndarray:
+    """
+    Does only the top left size x size coefficients of the 8x8 2D DCT of some
+    blocks and components.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8xC.
+    :param indices:
+        A np.ndarray of shape M containing flat indices into the AxBxC blocks and
+        components, e.g. from get_pruned_dct_groups.
+    :param size:
+        An int k in [1, 8] representing the size of the square.
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in. Defaults to
+        np.float64.
+
+    :return:
+        A np.ndarray of shape Mxkxk.
+    """
+    n_components = pixel_blocks.shape[-1]
+    basis, weights = get_dct_tables(dtype)
+
+    blocks = np.asarray(
+        pixel_blocks.reshape((-1, 8, 8, n_components))[
+            indices // n_components, :, :, indices % n_components
+        ],
+        dtype=basis.dtype,
+    )
+
+    # Both products are single matrix products over every block, rather than one
+    # small product per block: the rows, (8M)x8 @ 8xk, then the columns,
+    # kx8 @ 8x(Mk).
+    row_products = (blocks.reshape(-1, 8) @ basis[:size].T).reshape(-1, 8, size)
+    corners = basis[:size] @ row_products.swapaxes(0, 1).reshape(8, -1)
+
+    return corners.reshape(size, -1, size).swapaxes(0, 1) * weights[:size, :size]
+
+
+def pruned_dct_2d(
+    pixel_blocks: np.ndarray,
+    quantization_tensor: np.ndarray,
+    tolerance: float = 0,
+    dtype=np.float64,
+) -> np.ndarray:
+    """
+    Does the 8x8 2D DCT of only the coefficients which may survive quantization.
+
+    Blocks are grouped by get_pruned_dct_sizes, and every group only computes its
+    top left k x k coefficients; the rest are set to 0. Every skipped coefficient
+    would have been quantized to 0 (with a tolerance of 0). The kept ones come
+    from smaller products than those of dct_2d, which sum in another order, so
+    quantizing the result gives the same result as quantizing dct_2d except where
+    a kept coefficient lies within float error of a rounding boundary, where it
+    may differ by 1.
+
+    :param pixel_blocks:
+        A np.ndarray of shape AxBx8x8xC, where A = H/8, B = W/8.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8xC the result will be quantized with.
+    :param tolerance:
+        (Optional) A float passed to get_pruned_dct_thresholds. Defaults to 0
+        (exact).
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in. Defaults to
+        np.float64.
+
+    :return:
+        A np.ndarray of shape AxBx8x8xC, where A = H/8, B = W/8.
+    """
+    sizes = get_pruned_dct_sizes(
+        pixel_blocks, quantization_tensor, tolerance=tolerance, dtype=dtype
+    )
+
+    # (ABC)x8x8, so that flat indices into the AxBxC blocks and components index
+    # its first axis.
+    flat_dct_blocks = np.zeros((sizes.size, 8, 8), dtype=dtype)
+
+    for k, indices in get_pruned_dct_groups(sizes):
+        flat_dct_blocks[indices, :k, :k] = get_pruned_dct_corners(
+            pixel_blocks, indices, k, dtype=dtype
+        )
+
+    return np.moveaxis(
+        flat_dct_blocks.reshape(pixel_blocks.shape[:2] + (pixel_blocks.shape[4], 8, 8)),
+        -3,
+        -1,
+    )
+
+
+def get_flat_block_mask(
+    block_means: np.ndarray,
+    block_variances: np.ndarray,
+    quantization_tensor: np.ndarray,
+    dtype=np.float64,
+) -> np.ndarray:
+    """
+    Finds blocks whose AC coefficients all quantize to 0 in every component.
+
+    Uses the bound of get_pruned_dct_sizes on the moments of the blocks, e.g. from
+    get_block_statistics or get_block_moments, so the pixels aren't read again.
+    If the bound is below the lowest threshold of an AC coefficient in every
+    component, every AC coefficient is provably below half a quantization step and
+    only the DC coefficients need to be computed.
+
+    :param block_means:
+        A np.ndarray of shape AxBxC containing the mean of every 8x8 block.
+    :param block_variances:
+        A np.ndarray of shape AxBxC containing the variance of every 8x8 block.
+    :param quantization_tensor:
+        A np.ndarray of shape 8x8xC the DCT blocks will be quantized with.
+    :param dtype:
+        (Optional) The floating point dtype the DCT is computed in. Defaults to
+        np.float64.
+
+    :return:
+        A np.ndarray of shape AxB containing True for flat blocks.
+    """
+    energies = _get_energy_bounds(block_means, block_variances, dtype)
+
+    # The first column only holds the infinite DC threshold.
+    lowest_thresholds = np.min(
+        get_pruned_dct_thresholds(quantization_tensor, dtype=dtype)[:, 1:], axis=-1
+    )
+
+    return np.all(energies < lowest_thresholds, axis=-1)